@@ -0,0 +1,210 @@
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+# Nombre de titres par bloc de l'index de recherche par sous-chaîne
+TAILLE_BLOC = 1024
+# En dessous, appliquer() insère les titres un par un dans l'index trié
+TAILLE_LOT = 64
+
+# Diacritiques à retirer après décomposition NFKD (blocs Unicode des signes combinants)
+_DIACRITIQUES = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+
+def normaliser(titre):
+    """Clé de comparaison d'un titre : sans casse, sans accents, espaces réduits"""
+    if titre.isascii():
+        return " ".join(titre.lower().split())
+    sans_accent = _DIACRITIQUES.sub("", unicodedata.normalize("NFKD", titre.casefold()))
+    return " ".join(sans_accent.split())
+
+
+class CatalogueLivres:
+    """Ensemble ordonné de titres, indexé pour l'appartenance et la recherche
+
+    - ordre d'insertion : listes des titres et de leurs clés (None pour un titre
+      supprimé, compactées quand la moitié des cases est vide) ;
+    - appartenance en O(1) : dictionnaire clé normalisée -> position ;
+    - recherche par préfixe : liste triée des clés (bisect) ;
+    - recherche par sous-chaîne : par bloc de TAILLE_BLOC titres, les clés sont
+      concaténées en une seule chaîne parcourue par str.find ; seul le bloc
+      modifié est reconstruit, à la recherche suivante.
+
+    Les clés sont partagées par le dictionnaire et les listes : un titre coûte
+    ses deux chaînes (titre et clé), une entrée de dictionnaire et trois pointeurs.
+    """
+
+    def __init__(self, titres=()):
+        self._titres = []
+        self._cles = []
+        self._positions = {}
+        self._blocs = []
+        self._supprimes = 0
+        self._vue = None
+        self.version = 0
+        for titre in titres:
+            cle = normaliser(titre)
+            if cle not in self._positions:
+                self._positions[cle] = len(self._titres)
+                self._titres.append(titre)
+                self._cles.append(cle)
+        # Un seul tri au chargement plutôt qu'une insertion triée par titre
+        self._cles_triees = sorted(self._cles)
+
+    @classmethod
+    def depuis_entrees(cls, titres, cles):
+        """Reconstruire un catalogue à partir de titres et de leurs clés déjà normalisées (instantané)"""
+        catalogue = cls()
+        catalogue._titres = list(titres)
+        catalogue._cles = list(cles)
+        catalogue._positions = {cle: position for position, cle in enumerate(catalogue._cles)}
+        catalogue._cles_triees = sorted(catalogue._cles)
+        return catalogue
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, titre):
+        return normaliser(titre) in self._positions
+
+    def __iter__(self):
+        return (titre for titre in self._titres if titre is not None)
+
+    def _modifie(self, position):
+        self.version += 1
+        self._vue = None
+        numero = position // TAILLE_BLOC
+        if numero < len(self._blocs):
+            self._blocs[numero] = None
+
+    def ajouter(self, titre):
+        """Ajouter un titre ; renvoie False si un titre de même clé est déjà présent"""
+        cle = normaliser(titre)
+        if cle in self._positions:
+            return False
+        position = len(self._titres)
+        self._titres.append(titre)
+        self._cles.append(cle)
+        self._positions[cle] = position
+        insort(self._cles_triees, cle)
+        self._modifie(position)
+        return True
+
+    def supprimer(self, titre):
+        """Retirer un titre (casse et accents ignorés) ; renvoie False s'il est absent"""
+        cle = normaliser(titre)
+        position = self._positions.pop(cle, None)
+        if position is None:
+            return False
+        self._titres[position] = None
+        self._cles[position] = None
+        del self._cles_triees[bisect_left(self._cles_triees, cle)]
+        self._supprimes += 1
+        self._modifie(position)
+        if self._supprimes > len(self._titres) // 2:
+            self._compacter()
+        return True
+
+    def appliquer(self, operations):
+        """Appliquer une suite de (ajout, titre) ; l'index trié n'est fusionné qu'une fois (rejeu d'un journal)"""
+        operations = list(operations)
+        if len(operations) < TAILLE_LOT:
+            for ajout, titre in operations:
+                if ajout:
+                    self.ajouter(titre)
+                else:
+                    self.supprimer(titre)
+            return
+        ajoutees, retirees = [], set()
+        for ajout, titre in operations:
+            cle = normaliser(titre)
+            if ajout:
+                if cle in self._positions:
+                    continue
+                position = len(self._titres)
+                self._titres.append(titre)
+                self._cles.append(cle)
+                self._positions[cle] = position
+                ajoutees.append(cle)
+            else:
+                position = self._positions.pop(cle, None)
+                if position is None:
+                    continue
+                self._titres[position] = None
+                self._cles[position] = None
+                self._supprimes += 1
+                retirees.add(cle)
+            self._modifie(position)
+        # Deux suites triées concaténées : sorted() les fusionne en temps linéaire
+        triees = [cle for cle in self._cles_triees if cle not in retirees] if retirees else self._cles_triees
+        ajoutees = sorted(cle for cle in dict.fromkeys(ajoutees) if cle in self._positions)
+        self._cles_triees = sorted(triees + ajoutees)
+        if self._supprimes > len(self._titres) // 2:
+            self._compacter()
+
+    def _compacter(self):
+        # Retirer les cases vides : les positions et tous les blocs changent
+        self._titres = [titre for titre in self._titres if titre is not None]
+        self._cles = [cle for cle in self._cles if cle is not None]
+        self._positions = {cle: position for position, cle in enumerate(self._cles)}
+        self._blocs = []
+        self._supprimes = 0
+
+    def titres(self):
+        """Liste des titres dans l'ordre d'insertion (partagée jusqu'à la prochaine modification)"""
+        if self._vue is None:
+            self._vue = [titre for titre in self._titres if titre is not None]
+        return self._vue
+
+    def cles(self):
+        """Clés normalisées, dans l'ordre de titres()"""
+        return [cle for cle in self._cles if cle is not None]
+
+    def rechercher_prefixe(self, terme, limite=None):
+        """Titres dont la clé commence par `terme`, dans l'ordre alphabétique des clés"""
+        prefixe = normaliser(terme)
+        debut = bisect_left(self._cles_triees, prefixe)
+        fin = bisect_right(self._cles_triees, prefixe + "\U0010ffff", lo=debut)
+        if limite is not None:
+            fin = min(fin, debut + limite)
+        return [self._titres[self._positions[cle]] for cle in self._cles_triees[debut:fin]]
+
+    def rechercher(self, terme, limite=None):
+        """Titres contenant `terme` (casse et accents ignorés), dans l'ordre d'insertion"""
+        motif = normaliser(terme)
+        if not motif:
+            return []
+        trouves = []
+        for numero in range((len(self._titres) + TAILLE_BLOC - 1) // TAILLE_BLOC):
+            texte, debuts = self._bloc(numero)
+            depart = 0
+            while True:
+                trouve = texte.find(motif, depart)
+                if trouve < 0:
+                    break
+                # Case du titre contenant l'occurrence, puis reprise après ce titre
+                case = bisect_right(debuts, trouve) - 1
+                trouves.append(self._titres[numero * TAILLE_BLOC + case])
+                if limite is not None and len(trouves) >= limite:
+                    return trouves
+                depart = debuts[case + 1] if case + 1 < len(debuts) else len(texte)
+        return trouves
+
+    def _bloc(self, numero):
+        """Clés d'un bloc concaténées ("\\n" entre deux titres) et position de début de chacune"""
+        while len(self._blocs) <= numero:
+            self._blocs.append(None)
+        bloc = self._blocs[numero]
+        if bloc is None:
+            morceaux = []
+            debuts = array("I")
+            longueur = 0
+            for cle in self._cles[numero * TAILLE_BLOC:(numero + 1) * TAILLE_BLOC]:
+                # Une case vide garde sa place pour que les positions restent alignées
+                cle = cle or ""
+                debuts.append(longueur)
+                morceaux.append(cle)
+                longueur += len(cle) + 1
+            bloc = self._blocs[numero] = ("\n".join(morceaux), debuts)
+        return bloc
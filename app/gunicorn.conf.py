@@ -0,0 +1,96 @@
+# Configuration gunicorn, chargée automatiquement depuis le répertoire de travail
+#
+# Modèle de workers réglé par l'environnement (section gunicorn du chart) :
+#   GUNICORN_WORKER_CLASS         sync, gthread (défaut) ou gevent
+#   GUNICORN_WORKERS              processus ; défaut : d'après le quota CPU du conteneur
+#                                 (un seul sans LIBRAIRIE_DATA_DIR, le catalogue étant en mémoire)
+#   GUNICORN_THREADS              threads par worker gthread (4)
+#   GUNICORN_WORKER_CONNECTIONS   requêtes simultanées par worker gevent (100)
+#   GUNICORN_PRELOAD              charger l'application dans le maître avant le fork (true, false en gevent)
+#   GUNICORN_KEEPALIVE            secondes d'attente d'une requête suivante sur une connexion (5)
+#   GUNICORN_MAX_REQUESTS         requêtes avant le recyclage d'un worker (10000, 0 : jamais ;
+#                                 jamais par défaut sans LIBRAIRIE_DATA_DIR)
+#   GUNICORN_MAX_REQUESTS_JITTER  écart aléatoire ajouté, pour ne pas tous les recycler ensemble (1000)
+#   GUNICORN_TIMEOUT              worker relancé s'il ne répond plus pendant ce délai (30)
+import math
+import os
+
+# Les workers partagent leurs métriques Prometheus via ce répertoire (mode multiprocess)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/metriques")
+
+
+def cpus_alloues():
+    """CPU utilisables par le conteneur : quota cgroup (limits.cpu), sinon CPU visibles"""
+    visibles = len(os.sched_getaffinity(0))
+    quotas = (
+        ("/sys/fs/cgroup/cpu.max", None),  # cgroup v2 : "<quota> <période>" ou "max <période>"
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),  # cgroup v1
+    )
+    for chemin_quota, chemin_periode in quotas:
+        try:
+            with open(chemin_quota) as fichier:
+                valeurs = fichier.read().split()
+            if chemin_periode is not None:
+                with open(chemin_periode) as fichier:
+                    valeurs.append(fichier.read().strip())
+            quota, periode = valeurs[0], valeurs[1]
+        except (OSError, IndexError):
+            continue
+        if quota in ("max", "-1"):
+            break
+        return max(1, min(visibles, math.ceil(int(quota) / int(periode))))
+    return visibles
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+# Sans LIBRAIRIE_DATA_DIR, chaque processus a son propre catalogue en mémoire : un seul
+# worker, la concurrence vient des threads. Avec le catalogue partagé sur disque, les
+# requêtes sont surtout du calcul : un worker par CPU.
+if os.getenv("GUNICORN_WORKERS"):
+    workers = int(os.getenv("GUNICORN_WORKERS"))
+elif not os.getenv("LIBRAIRIE_DATA_DIR"):
+    workers = 1
+else:
+    workers = cpus_alloues()
+
+# Pas de préchargement par défaut avec gevent : les threads du maître (journal, écoute
+# des invalidations) deviendraient des greenlets recopiées dans chaque worker
+preload_app = (os.getenv("GUNICORN_PRELOAD") or ("false" if worker_class == "gevent" else "true")).lower() == "true"
+if worker_class == "gevent" and preload_app:
+    # L'application est importée par le maître : gevent doit avoir remplacé threading,
+    # socket et select avant, comme il le fait dans chaque worker
+    from gevent import monkey
+    monkey.patch_all()
+
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycler le worker d'un catalogue en mémoire seule effacerait les livres ajoutés
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000" if os.getenv("LIBRAIRIE_DATA_DIR") else "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = timeout
+# Battement des workers en mémoire : un disque lent ne doit pas les faire tuer
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Journaux de gunicorn sur la sortie d'erreur ; pas de journal d'accès synchrone,
+# les requêtes sont journalisées (échantillonnées) par l'application
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+errorlog = "-"
+accesslog = None
+
+
+def on_starting(server):
+    # Repartir de compteurs vierges à chaque démarrage du maître
+    repertoire = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(repertoire, exist_ok=True)
+    for nom in os.listdir(repertoire):
+        os.remove(os.path.join(repertoire, nom))
+
+
+def child_exit(server, worker):
+    # Retirer les jauges (requêtes en cours) d'un worker arrêté
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
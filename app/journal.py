@@ -0,0 +1,160 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Identifiant de la requête HTTP en cours (threads gunicorn comme tâches asyncio)
+id_requete = contextvars.ContextVar("id_requete", default=None)
+# Décision d'échantillonnage de la requête en cours : ses messages DEBUG sont tous gardés ou tous écartés
+_echantillonnee = contextvars.ContextVar("echantillonnee", default=None)
+
+# Identifiant reçu dans X-Request-ID : repris tel quel s'il est sûr
+_ID_VALIDE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Attributs propres à logging : tout le reste vient de extra= et est écrit tel quel
+_ATTRIBUTS_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName", "request_id", "exception",
+}
+
+logger = logging.getLogger("librairie.http")
+
+
+class FormateurJSON(logging.Formatter):
+    """Une ligne JSON par message, avec l'identifiant de requête et les champs passés en extra="""
+
+    def format(self, record):
+        entree = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entree["request_id"] = record.request_id
+        for cle, valeur in vars(record).items():
+            if cle not in _ATTRIBUTS_STANDARD:
+                entree[cle] = valeur
+        if getattr(record, "exception", None):
+            entree["exception"] = record.exception
+        return json.dumps(entree, ensure_ascii=False, default=str)
+
+
+class FiltreContexte(logging.Filter):
+    """Rattacher chaque message à sa requête et échantillonner les messages DEBUG
+
+    Exécuté dans le thread qui journalise, avant la mise en file. Les messages
+    INFO et plus graves sont toujours gardés.
+    """
+
+    def __init__(self, taux_echantillonnage=1.0):
+        super().__init__()
+        self.taux_echantillonnage = taux_echantillonnage
+
+    def filter(self, record):
+        record.request_id = id_requete.get()
+        if record.levelno > logging.DEBUG or self.taux_echantillonnage >= 1:
+            return True
+        decision = _echantillonnee.get()
+        if decision is None:
+            return random.random() < self.taux_echantillonnage
+        return decision
+
+
+class GestionnaireFile(logging.handlers.QueueHandler):
+    """Met les messages en file : le formatage et l'écriture se font dans le thread d'écoute"""
+
+    def prepare(self, record):
+        # Figer le message et la trace tant que leurs arguments sont valides
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_ecouteur = None
+_filtre = FiltreContexte()
+
+
+def configurer_journalisation():
+    """Écrire les journaux en JSON sur la sortie standard, sans bloquer les requêtes
+
+    LOG_LEVEL fixe le niveau (INFO par défaut) et LOG_SAMPLE_RATE la part des
+    requêtes dont les messages DEBUG sont gardés (1 par défaut).
+    """
+    global _ecouteur
+    _filtre.taux_echantillonnage = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+    if _ecouteur is not None:
+        return
+
+    sortie = logging.StreamHandler(sys.stdout)
+    sortie.setFormatter(FormateurJSON())
+    file = queue.SimpleQueue()
+    gestionnaire = GestionnaireFile(file)
+    gestionnaire.addFilter(_filtre)
+
+    racine = logging.getLogger()
+    racine.handlers[:] = [gestionnaire]
+    racine.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _ecouteur = logging.handlers.QueueListener(file, sortie)
+    _ecouteur.start()
+    atexit.register(_ecouteur.stop)
+    # Le thread d'écoute n'existe pas dans les workers forkés : on le relance
+    os.register_at_fork(after_in_child=_relancer_ecouteur)
+
+
+def _relancer_ecouteur():
+    _ecouteur._thread = None
+    _ecouteur.start()
+
+
+def debut_requete(identifiant=None):
+    """Ouvrir le contexte de journalisation d'une requête et renvoyer son identifiant"""
+    if not identifiant or not _ID_VALIDE.fullmatch(identifiant):
+        identifiant = uuid.uuid4().hex
+    id_requete.set(identifiant)
+    _echantillonnee.set(random.random() < _filtre.taux_echantillonnage)
+    return identifiant
+
+
+def fin_requete():
+    id_requete.set(None)
+    _echantillonnee.set(None)
+
+
+def tracer_requetes(app):
+    """Identifier chaque requête Flask (en-tête X-Request-ID) et la journaliser en DEBUG"""
+    from flask import g, request
+
+    @app.before_request
+    def ouvrir_trace():
+        g.trace_debut = time.perf_counter()
+        g.trace_id = debut_requete(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    def fermer_trace(reponse):
+        if "trace_id" in g:
+            reponse.headers["X-Request-ID"] = g.trace_id
+            logger.debug("requête traitée", extra={
+                "method": request.method,
+                "path": request.path,
+                "status": reponse.status_code,
+                "duree_ms": round((time.perf_counter() - g.trace_debut) * 1000, 2),
+            })
+        return reponse
+
+    # Les exceptions non gérées sont déjà journalisées par Flask (logger de l'application)
+    @app.teardown_request
+    def oublier_trace(exception=None):
+        fin_requete()
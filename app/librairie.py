@@ -1,17 +1,40 @@
+import logging
+import threading
+
+from catalogue import CatalogueLivres
+from persistance import CataloguePersistant
+
+logger = logging.getLogger("librairie")
+
 class Librairie :
-    def __init__(self, nom, adresse, livres):
+    def __init__(self, nom, adresse, livres, repertoire=None, **options):
+        # repertoire : catalogue persisté sur disque (instantané + journal), partagé par les workers
+        self.__persistant = None
+        # Les threads d'un worker gthread partagent le catalogue : un accès à la fois
+        self.__verrou = threading.RLock()
         self.set_nom(nom)
         self.set_adresse(adresse)
-        self.set_livres(livres)
+        if repertoire:
+            # Les livres donnés ne servent qu'au premier démarrage (pas encore d'instantané)
+            self.__persistant = self.__livres = CataloguePersistant(repertoire, livres, **options)
+        else:
+            self.set_livres(livres)
     
     def set_livres(self, livres):
         try:
             if isinstance(livres, list):
-                self.__livres = livres
+                # Catalogue indexé : doublons (casse et accents ignorés) écartés
+                titres = (livre for livre in livres if isinstance(livre, str))
+                if self.__persistant is not None:
+                    self.__persistant.remplacer(titres)
+                else:
+                    catalogue = CatalogueLivres(titres)
+                    with self.__verrou:
+                        self.__livres = catalogue
             else: 
                 raise ValueError
         except ValueError:
-            print("Attention la liste est incorrecte")
+            logger.warning("La liste est incorrecte")
     
     def set_nom(self, nom):
         try:
@@ -20,7 +43,7 @@ class Librairie :
             else: 
                 raise ValueError
         except ValueError:
-            print("Attention le nom est incorrect")
+            logger.warning("Le nom est incorrect")
     
     def set_adresse(self, adresse):
         try:
@@ -29,7 +52,7 @@ class Librairie :
             else: 
                 raise ValueError
         except ValueError:
-                print("Attention l'adresse est incorrecte")
+                logger.warning("L'adresse est incorrecte")
     
     def get_nom(self):
         return self.__nom
@@ -38,24 +61,43 @@ class Librairie :
         return self.__adresse
     
     def get_livres(self):
-        return self.__livres
+        # Liste partagée jusqu'à la prochaine modification : ne pas la modifier
+        with self.__verrou:
+            return self.__livres.titres()
+    
+    def get_version(self):
+        # Change à chaque ajout ou suppression (cache de GET /livres)
+        with self.__verrou:
+            return self.__livres.version
     
     def add_livres(self, livre):
         try:
-            if not isinstance(livre, str):
+            if not isinstance(livre, str) or not livre.strip():
                 raise ValueError
         except ValueError:
-            print("Attention le livre donne est incorrect")
-        present = False
-        for livreref in self.__livres:
-            if livreref == livre:
-                print("Attention le livre est deja present")
-                present = True
-        if not present:
-            self.__livres.append(livre)
+            logger.warning("Le livre donne est incorrect")
+            return False
+        with self.__verrou:
+            ajoute = self.__livres.ajouter(livre)
+        if not ajoute:
+            logger.debug("Le livre est deja present")
+            return False
+        return True
     
     def del_livres(self, livre):
-        self.__livres.remove(livre)
+        with self.__verrou:
+            supprime = isinstance(livre, str) and self.__livres.supprimer(livre)
+        if not supprime:
+            logger.debug("Le livre n'est pas dans la librairie")
+            return False
+        return True
+    
+    def rechercher_livres(self, terme, limite=None, prefixe=False):
+        # Casse et accents ignorés ; par préfixe (ordre alphabétique) ou sous-chaîne (ordre d'ajout)
+        with self.__verrou:
+            if prefixe:
+                return self.__livres.rechercher_prefixe(terme, limite)
+            return self.__livres.rechercher(terme, limite)
     
     def index(self, livre):
         return "Bienvenu sur le site de la librairie {0} !".format(self.__nom)
\ No newline at end of file
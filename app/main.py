@@ -1,9 +1,33 @@
+import os
+
 from librairie import Librairie
-from flask import Flask, jsonify, request
+from journal import configurer_journalisation, tracer_requetes
+from metriques import exposer, instrumenter
+from flask import Flask, Response, jsonify, request
+
+# Journaux JSON écrits par un thread dédié (LOG_LEVEL, LOG_SAMPLE_RATE)
+configurer_journalisation()
 
 app = Flask(__name__)
 
-librairie1 = Librairie("CGI", "15 Avenue du Docteur Maurice Grynfogel", ["Le DevOps c'est super !", "Le Python pour les nuls"])
+# Identifiant de requête (X-Request-ID) repris dans les journaux
+tracer_requetes(app)
+
+# Latence et requêtes en cours par route, exposées sur /metrics
+instrumenter(app)
+
+# LIBRAIRIE_DATA_DIR : catalogue conservé sur disque et rechargé au redémarrage (instantané
+# relu par mmap + journal des écritures). Le journal est replié dans un nouvel instantané
+# toutes les LIBRAIRIE_SNAPSHOT_EVERY écritures ; LIBRAIRIE_FSYNC=true synchronise chaque écriture.
+persistance = {}
+if os.getenv("LIBRAIRIE_DATA_DIR"):
+    persistance = {
+        "repertoire": os.getenv("LIBRAIRIE_DATA_DIR"),
+        "seuil_instantane": int(os.getenv("LIBRAIRIE_SNAPSHOT_EVERY", "10000")),
+        "fsync": os.getenv("LIBRAIRIE_FSYNC", "false").lower() == "true",
+    }
+
+librairie1 = Librairie("CGI", "15 Avenue du Docteur Maurice Grynfogel", ["Le DevOps c'est super !", "Le Python pour les nuls"], **persistance)
 
 @app.route("/")
 def get():
@@ -13,25 +37,57 @@ def get():
 def getnom():
     return jsonify(librairie1.get_nom())
 
+# Corps de GET /livres, resérialisé seulement quand le catalogue change
+corps_livres = (None, b"")
+
 @app.route("/livres")
 def getlivres():
-    return jsonify(librairie1.get_livres())
+    global corps_livres
+    version, corps = corps_livres
+    if version != librairie1.get_version():
+        version = librairie1.get_version()
+        # Même sortie compacte que jsonify
+        corps = (app.json.dumps(librairie1.get_livres(), separators=(",", ":")) + "\n").encode("utf-8")
+        corps_livres = (version, corps)
+    return app.response_class(corps, mimetype="application/json")
 
 @app.route('/livres', methods=['POST'])
 def addlivres():
     livre = request.get_json()
-    print(livre)
     librairie1.add_livres(livre['nomLivre'])
     return "", 204
 
 @app.route('/livres', methods=['DELETE'])
 def dellivres():
     livre = request.get_json()
-    print(livre)
     librairie1.del_livres(livre['nomLivre'])
     return "", 204
 
+# Recherche de livres par titre (?q=, casse et accents ignorés)
+# mode=substring (défaut, ordre d'ajout) ou prefix (ordre alphabétique), limit= optionnel
+@app.route('/livres/search')
+def search_livres():
+    terme = request.args.get('q', '')
+    if not terme:
+        return jsonify([])
+    
+    mode = request.args.get('mode', 'substring')
+    if mode not in ('substring', 'prefix'):
+        return jsonify({'error': "mode doit valoir 'substring' ou 'prefix'"}), 400
+    
+    limite = request.args.get('limit', type=int)
+    if limite is not None and limite <= 0:
+        return jsonify({'error': 'limit doit être un entier positif'}), 400
+    
+    return jsonify(librairie1.rechercher_livres(terme, limite, prefixe=(mode == 'prefix')))
+
 # Point de terminaison Health Check pour Kubernetes
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy'}), 200
\ No newline at end of file
+    return jsonify({'status': 'healthy'}), 200
+
+# Métriques Prometheus (tous les workers gunicorn agrégés)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    corps, type_contenu = exposer()
+    return Response(corps, content_type=type_contenu)
\ No newline at end of file
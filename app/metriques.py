@@ -0,0 +1,59 @@
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Avec plusieurs workers gunicorn, chaque processus écrit ses valeurs dans
+# PROMETHEUS_MULTIPROC_DIR et /metrics les agrège (voir gunicorn.conf.py)
+REPERTOIRE_MULTIPROCESSUS = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if REPERTOIRE_MULTIPROCESSUS:
+    os.makedirs(REPERTOIRE_MULTIPROCESSUS, exist_ok=True)
+
+DUREE_HTTP = Histogram(
+    "librairie_http_request_duration_seconds",
+    "Durée de traitement des requêtes HTTP par route",
+    ["route", "method", "status"],
+)
+REQUETES_EN_COURS = Gauge(
+    "librairie_http_requests_in_progress",
+    "Requêtes HTTP en cours de traitement",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+
+
+def instrumenter(app):
+    """Mesurer la durée et le nombre de requêtes en cours de chaque route"""
+
+    @app.before_request
+    def debut_mesure():
+        # Le modèle de route et non le chemin, pour borner le nombre de séries
+        g.metriques_route = request.url_rule.rule if request.url_rule is not None else "inconnue"
+        g.metriques_debut = time.perf_counter()
+        REQUETES_EN_COURS.labels(g.metriques_route).inc()
+
+    @app.after_request
+    def fin_mesure(reponse):
+        if "metriques_debut" in g:
+            DUREE_HTTP.labels(g.metriques_route, request.method, reponse.status_code).observe(
+                time.perf_counter() - g.metriques_debut
+            )
+        return reponse
+
+    @app.teardown_request
+    def fin_requete(exception=None):
+        if "metriques_route" in g:
+            REQUETES_EN_COURS.labels(g.pop("metriques_route")).dec()
+
+
+def exposer():
+    """Renvoyer (corps, type de contenu) de la page /metrics, tous workers confondus"""
+    if REPERTOIRE_MULTIPROCESSUS:
+        registre = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registre)
+    else:
+        registre = REGISTRY
+    return generate_latest(registre), CONTENT_TYPE_LATEST
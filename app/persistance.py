@@ -0,0 +1,260 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+from itertools import accumulate
+
+from catalogue import CatalogueLivres
+
+# En-tête d'un instantané : magie, génération, taille du journal précédent qu'il
+# inclut (-1 s'il le remplace), nombre de titres, taille en octets des titres
+ENTETE = struct.Struct("<8sQqQQ")
+MAGIE = b"LIBRCAT1"
+
+
+class CataloguePersistant:
+    """Catalogue de livres persisté sur disque et partagé par les workers gunicorn
+
+    L'état est un instantané compact (catalogue.snap, lu par mmap au démarrage)
+    suivi d'un journal en ajout seul (catalogue.<génération>.log, une ligne par
+    ajout ou suppression). Chaque écriture se fait sous verrou de fichier après
+    avoir rejoué les lignes écrites par les autres workers ; les lectures
+    rejouent seulement la fin du journal. Au-delà de `seuil_instantane` lignes,
+    le journal est replié dans un nouvel instantané.
+
+    Même interface de lecture et d'écriture que CatalogueLivres.
+    """
+
+    def __init__(self, repertoire, titres_initiaux=(), seuil_instantane=10000, fsync=False):
+        os.makedirs(repertoire, exist_ok=True)
+        self.repertoire = repertoire
+        self.seuil_instantane = seuil_instantane
+        self.fsync = fsync
+        self._chemin_instantane = os.path.join(repertoire, "catalogue.snap")
+        self._ouvrir_verrous()
+        # Catalogue chargé dans le maître gunicorn (preload_app) : chaque worker rouvre ses verrous
+        os.register_at_fork(after_in_child=self._apres_fork)
+        self._journal = None
+        # Incrémenté à chaque chargement d'instantané (version du catalogue)
+        self._rechargements = 0
+
+        with self._verrou_fichier(fcntl.LOCK_EX):
+            # Premier démarrage : le catalogue initial devient le premier instantané
+            if not os.path.exists(self._chemin_instantane):
+                self._ecrire_instantane(CatalogueLivres(titres_initiaux), generation=1, inclus=-1)
+            self._charger()
+
+    # --- Fichiers -----------------------------------------------------------
+
+    def _ouvrir_verrous(self):
+        self._fichier_verrou = open(os.path.join(self.repertoire, "catalogue.lock"), "a")
+        # flock ne sépare pas les threads d'un même processus : verrou local en plus
+        self._verrou = threading.RLock()
+
+    def _apres_fork(self):
+        # Un flock appartient au fichier ouvert, que le fork partage : sans nouvelle
+        # ouverture, le maître et tous les workers détiendraient le même verrou
+        self._fichier_verrou.close()
+        self._ouvrir_verrous()
+
+    @contextmanager
+    def _verrou_fichier(self, mode):
+        with self._verrou:
+            fcntl.flock(self._fichier_verrou, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fichier_verrou, fcntl.LOCK_UN)
+
+    def _chemin_journal(self, generation):
+        return os.path.join(self.repertoire, f"catalogue.{generation}.log")
+
+    def _ouvrir_journal(self, generation):
+        if self._journal is not None:
+            os.close(self._journal)
+        self._journal = os.open(self._chemin_journal(generation), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.generation = generation
+        self._position = 0
+        self._lignes = 0
+
+    def _lire_entete(self, fichier):
+        entete = ENTETE.unpack(fichier.read(ENTETE.size))
+        if entete[0] != MAGIE:
+            raise ValueError(f"{self._chemin_instantane} n'est pas un instantané de catalogue")
+        return entete[1:]
+
+    def _charger(self):
+        """Charger l'instantané (mmap) puis rejouer son journal"""
+        with open(self._chemin_instantane, "rb") as fichier:
+            identite = os.fstat(fichier.fileno())
+            generation, _, nombre, octets_titres = self._lire_entete(fichier)
+            with mmap.mmap(fichier.fileno(), 0, access=mmap.ACCESS_READ) as donnees:
+                # Positions (en caractères) de chaque titre puis de chaque clé
+                debut = ENTETE.size
+                taille = 8 * (nombre + 1)
+                positions_titres, positions_cles = array("Q"), array("Q")
+                positions_titres.frombytes(donnees[debut:debut + taille])
+                positions_cles.frombytes(donnees[debut + taille:debut + 2 * taille])
+                debut += 2 * taille
+                titres = donnees[debut:debut + octets_titres].decode("utf-8")
+                cles = donnees[debut + octets_titres:].decode("utf-8")
+
+        self._catalogue = CatalogueLivres.depuis_entrees(
+            (titres[positions_titres[i]:positions_titres[i + 1]] for i in range(nombre)),
+            (cles[positions_cles[i]:positions_cles[i + 1]] for i in range(nombre)),
+        )
+        self._instantane = (identite.st_ino, identite.st_mtime_ns)
+        self._rechargements += 1
+        self._ouvrir_journal(generation)
+        self._rejouer()
+
+    def _ecrire_instantane(self, catalogue, generation, inclus):
+        titres, cles = catalogue.titres(), catalogue.cles()
+        texte_titres = "".join(titres).encode("utf-8")
+        temporaire = self._chemin_instantane + ".tmp"
+        with open(temporaire, "wb") as fichier:
+            fichier.write(ENTETE.pack(MAGIE, generation, inclus, len(titres), len(texte_titres)))
+            fichier.write(array("Q", accumulate(map(len, titres), initial=0)).tobytes())
+            fichier.write(array("Q", accumulate(map(len, cles), initial=0)).tobytes())
+            fichier.write(texte_titres)
+            fichier.write("".join(cles).encode("utf-8"))
+            fichier.flush()
+            os.fsync(fichier.fileno())
+        # Le journal de la nouvelle génération existe avant que l'instantané soit visible
+        os.close(os.open(self._chemin_journal(generation), os.O_WRONLY | os.O_CREAT, 0o644))
+        os.replace(temporaire, self._chemin_instantane)
+
+    # --- Synchronisation entre workers -----------------------------------------
+
+    def _rejouer(self):
+        """Appliquer les lignes complètes écrites dans le journal depuis la dernière lecture"""
+        taille = os.fstat(self._journal).st_size
+        if taille <= self._position:
+            return
+        donnees = os.pread(self._journal, taille - self._position, self._position)
+        # Une ligne en cours d'écriture par un autre worker sera lue la prochaine fois
+        fin = donnees.rfind(b"\n") + 1
+        lignes = donnees[:fin].splitlines()
+        self._catalogue.appliquer((ligne[:1] == b"+", json.loads(ligne[1:])) for ligne in lignes)
+        self._lignes += len(lignes)
+        self._position += fin
+
+    def _rattraper(self, verrouille=False):
+        """Se mettre à jour avec les écritures et les instantanés des autres workers
+
+        `verrouille` : l'appelant détient déjà le verrou exclusif du fichier.
+        """
+        self._rejouer()
+        try:
+            identite = os.stat(self._chemin_instantane)
+        except FileNotFoundError:
+            return
+        if (identite.st_ino, identite.st_mtime_ns) == self._instantane:
+            return
+
+        # Nouvel instantané : il a été écrit sous verrou, journal précédent complet
+        self._rejouer()
+        if verrouille:
+            self._suivre_instantane()
+        else:
+            with self._verrou_fichier(fcntl.LOCK_SH):
+                self._suivre_instantane()
+
+    def _suivre_instantane(self):
+        with open(self._chemin_instantane, "rb") as fichier:
+            identite = os.fstat(fichier.fileno())
+            generation, inclus, _, _ = self._lire_entete(fichier)
+        if generation == self.generation + 1 and inclus == self._position:
+            # Simple repli du journal que l'on a entièrement rejoué : l'état est identique
+            self._instantane = (identite.st_ino, identite.st_mtime_ns)
+            self._ouvrir_journal(generation)
+            self._rejouer()
+        elif (identite.st_ino, identite.st_mtime_ns) != self._instantane:
+            self._charger()
+
+    def _ecrire(self, operation, titre):
+        ligne = operation + json.dumps(titre, ensure_ascii=False).encode("utf-8") + b"\n"
+        os.write(self._journal, ligne)
+        if self.fsync:
+            os.fsync(self._journal)
+        self._position += len(ligne)
+        self._lignes += 1
+
+    def _replier_journal(self):
+        """Écrire l'état courant dans un nouvel instantané et repartir d'un journal vide"""
+        ancien = self.generation
+        self._ecrire_instantane(self._catalogue, ancien + 1, inclus=self._position)
+        identite = os.stat(self._chemin_instantane)
+        self._instantane = (identite.st_ino, identite.st_mtime_ns)
+        self._ouvrir_journal(ancien + 1)
+        # Les workers qui le lisent encore gardent leur descripteur ouvert
+        os.remove(self._chemin_journal(ancien))
+
+    # --- Interface de CatalogueLivres ---------------------------------------
+
+    def ajouter(self, titre):
+        with self._verrou_fichier(fcntl.LOCK_EX):
+            self._rattraper(verrouille=True)
+            if titre in self._catalogue:
+                return False
+            self._ecrire(b"+", titre)
+            self._catalogue.ajouter(titre)
+            if self._lignes >= self.seuil_instantane:
+                self._replier_journal()
+            return True
+
+    def supprimer(self, titre):
+        with self._verrou_fichier(fcntl.LOCK_EX):
+            self._rattraper(verrouille=True)
+            if titre not in self._catalogue:
+                return False
+            self._ecrire(b"-", titre)
+            self._catalogue.supprimer(titre)
+            if self._lignes >= self.seuil_instantane:
+                self._replier_journal()
+            return True
+
+    def remplacer(self, titres):
+        """Remplacer tout le catalogue (nouvel instantané, rechargé par les autres workers)"""
+        with self._verrou_fichier(fcntl.LOCK_EX):
+            self._rattraper(verrouille=True)
+            catalogue = CatalogueLivres(titres)
+            ancien = self.generation
+            self._ecrire_instantane(catalogue, ancien + 1, inclus=-1)
+            os.remove(self._chemin_journal(ancien))
+            self._charger()
+
+    @property
+    def version(self):
+        with self._verrou:
+            self._rattraper()
+            return self._rechargements, self._catalogue.version
+
+    def __len__(self):
+        with self._verrou:
+            self._rattraper()
+            return len(self._catalogue)
+
+    def __contains__(self, titre):
+        with self._verrou:
+            self._rattraper()
+            return titre in self._catalogue
+
+    def titres(self):
+        with self._verrou:
+            self._rattraper()
+            return self._catalogue.titres()
+
+    def rechercher(self, terme, limite=None):
+        with self._verrou:
+            self._rattraper()
+            return self._catalogue.rechercher(terme, limite)
+
+    def rechercher_prefixe(self, terme, limite=None):
+        with self._verrou:
+            self._rattraper()
+            return self._catalogue.rechercher_prefixe(terme, limite)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Les modules de l'application s'importent par leur nom (comme dans l'image Docker).
+# Ajouté en fin de chemin : app_postgres a des modules de même nom (librairie, journal...)
+# et ses tests doivent trouver les siens
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
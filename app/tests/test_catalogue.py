@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+import catalogue
+from catalogue import TAILLE_LOT, CatalogueLivres, normaliser
+
+
+@pytest.mark.parametrize("titre, cle", [
+    ("Le Petit Prince", "le petit prince"),
+    ("  Le   Petit\tPrince ", "le petit prince"),
+    ("L'Écume des Jours", "l'ecume des jours"),
+    ("Straße", "strasse"),
+    ("Ｌｅ ｌｉｖｒｅ", "le livre"),
+])
+def test_normaliser(titre, cle):
+    assert normaliser(titre) == cle
+
+
+@pytest.fixture
+def petits_blocs(monkeypatch):
+    # Plusieurs blocs de recherche dès quelques titres
+    monkeypatch.setattr(catalogue, "TAILLE_BLOC", 3)
+
+
+def test_ajouter_et_appartenance():
+    livres = CatalogueLivres(["Germinal", "GERMINAL", "Nana"])
+    assert livres.titres() == ["Germinal", "Nana"]
+    assert livres.ajouter("L'Assommoir")
+    assert not livres.ajouter("l'assommoir")
+    assert not livres.ajouter("nána")
+    assert len(livres) == 3
+    assert "germinal" in livres and "Thérèse Raquin" not in livres
+
+
+def test_supprimer_et_compacter(petits_blocs):
+    titres = [f"Tome {i}" for i in range(10)]
+    livres = CatalogueLivres(titres)
+    assert not livres.supprimer("Tome 42")
+    for i in range(6):
+        assert livres.supprimer(f"TOME {i}")
+    # Plus de la moitié des cases vides : le catalogue a été compacté
+    assert livres._supprimes == 0 and len(livres._titres) == 4
+    assert livres.titres() == titres[6:]
+    assert livres.rechercher("tome") == titres[6:]
+    assert livres.rechercher_prefixe("tome 8") == ["Tome 8"]
+    assert "Tome 3" not in livres and "Tome 7" in livres
+    assert livres.ajouter("Tome 3")
+    assert livres.titres() == titres[6:] + ["Tome 3"]
+
+
+def test_rechercher_sous_chaine(petits_blocs):
+    livres = CatalogueLivres(["Les Misérables", "Notre-Dame de Paris", "ab", "cd", "Misère et misère", "Paris"])
+    assert livres.rechercher("MISER") == ["Les Misérables", "Misère et misère"]
+    assert livres.rechercher("paris", limite=1) == ["Notre-Dame de Paris"]
+    assert livres.rechercher("paris") == ["Notre-Dame de Paris", "Paris"]
+    # Une occurrence ne s'étend pas sur deux titres voisins
+    assert livres.rechercher("b c") == []
+    assert livres.rechercher("   ") == []
+
+
+def test_rechercher_apres_modification(petits_blocs):
+    livres = CatalogueLivres(["Alpha", "Beta", "Gamma", "Delta"])
+    assert livres.rechercher("ta") == ["Beta", "Delta"]
+    livres.supprimer("Beta")
+    livres.ajouter("Zeta")
+    # Seuls les blocs modifiés sont reconstruits
+    assert livres.rechercher("ta") == ["Delta", "Zeta"]
+
+
+def test_rechercher_prefixe():
+    livres = CatalogueLivres(["Candide", "Le Cid", "Le Horla", "le comte de Monte-Cristo", "Les Misérables"])
+    assert livres.rechercher_prefixe("le c") == ["Le Cid", "le comte de Monte-Cristo"]
+    assert livres.rechercher_prefixe("LE", limite=2) == ["Le Cid", "le comte de Monte-Cristo"]
+    assert livres.rechercher_prefixe("Les Mise") == ["Les Misérables"]
+    assert livres.rechercher_prefixe("Z") == []
+
+
+def test_titres_partages_jusqu_a_modification():
+    livres = CatalogueLivres(["Germinal"])
+    vue, version = livres.titres(), livres.version
+    assert livres.titres() is vue
+    livres.ajouter("Nana")
+    assert livres.version > version
+    assert vue == ["Germinal"] and livres.titres() == ["Germinal", "Nana"]
+
+
+def test_depuis_entrees():
+    source = CatalogueLivres(["Germinal", "Nana", "L'Œuvre"])
+    copie = CatalogueLivres.depuis_entrees(source.titres(), source.cles())
+    assert copie.titres() == source.titres()
+    assert copie.rechercher_prefixe("") == source.rechercher_prefixe("")
+    assert "L'ŒUVRE" in copie
+
+
+@pytest.mark.parametrize("nombre", [TAILLE_LOT // 2, TAILLE_LOT * 20])
+def test_appliquer_equivaut_aux_operations_une_a_une(petits_blocs, nombre):
+    hasard = random.Random(nombre)
+    initiaux = [f"Livre {i}" for i in range(50)]
+    operations = [(hasard.random() < 0.6, f"{hasard.choice(['livre', 'LIVRE', 'Livré'])} {hasard.randrange(80)}")
+                  for _ in range(nombre)]
+
+    attendu = CatalogueLivres(initiaux)
+    for ajout, titre in operations:
+        attendu.ajouter(titre) if ajout else attendu.supprimer(titre)
+    livres = CatalogueLivres(initiaux)
+    livres.appliquer(operations)
+
+    assert livres.titres() == attendu.titres()
+    assert livres.cles() == attendu.cles()
+    assert livres.rechercher_prefixe("") == attendu.rechercher_prefixe("")
+    assert livres.rechercher("1") == attendu.rechercher("1")
+    assert len(livres) == len(attendu)
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from persistance import CataloguePersistant
+
+
+def fichiers(repertoire):
+    return sorted(nom for nom in os.listdir(repertoire) if nom != "catalogue.lock")
+
+
+def test_premier_demarrage_puis_rechargement(tmp_path):
+    catalogue = CataloguePersistant(tmp_path, ["Germinal", "Nana"])
+    assert catalogue.titres() == ["Germinal", "Nana"]
+    assert fichiers(tmp_path) == ["catalogue.1.log", "catalogue.snap"]
+    # Les titres initiaux ne servent qu'à créer le premier instantané
+    assert CataloguePersistant(tmp_path, ["Autre"]).titres() == ["Germinal", "Nana"]
+
+
+def test_journal_rejoue_au_demarrage(tmp_path):
+    catalogue = CataloguePersistant(tmp_path, ["Germinal", "Nana"])
+    assert catalogue.ajouter("L'Œuvre — tome 1")
+    assert not catalogue.ajouter("germinal")
+    assert catalogue.supprimer("NANA")
+    assert not catalogue.supprimer("Nana")
+    lignes = (tmp_path / "catalogue.1.log").read_bytes().splitlines()
+    assert lignes == ['+"L\'Œuvre — tome 1"'.encode(), b'-"NANA"']
+
+    relu = CataloguePersistant(tmp_path)
+    assert relu.titres() == ["Germinal", "L'Œuvre — tome 1"]
+    assert relu.rechercher("œuvre") == ["L'Œuvre — tome 1"]
+    assert relu.rechercher_prefixe("ger") == ["Germinal"]
+
+
+def test_ecritures_des_autres_workers(tmp_path):
+    premier = CataloguePersistant(tmp_path, ["Germinal"])
+    second = CataloguePersistant(tmp_path)
+    version = second.version
+    premier.ajouter("Nana")
+    assert "Nana" in second and len(second) == 2
+    assert second.version != version
+    # Le second écrit après avoir rejoué les lignes du premier
+    assert not second.ajouter("nana")
+    second.supprimer("Germinal")
+    assert premier.titres() == ["Nana"]
+
+
+def test_ligne_incomplete_ignoree_jusqu_a_sa_fin(tmp_path):
+    catalogue = CataloguePersistant(tmp_path, ["Germinal"])
+    journal = tmp_path / "catalogue.1.log"
+    with open(journal, "ab") as fichier:
+        fichier.write(b'+"Na')
+        fichier.flush()
+        assert catalogue.titres() == ["Germinal"]
+        fichier.write(b'na"\n')
+    assert catalogue.titres() == ["Germinal", "Nana"]
+
+
+def test_repli_du_journal_en_instantane(tmp_path):
+    premier = CataloguePersistant(tmp_path, ["Titre 0"], seuil_instantane=5)
+    second = CataloguePersistant(tmp_path, seuil_instantane=5)
+    for i in range(1, 8):
+        premier.ajouter(f"Titre {i}")
+    premier.supprimer("Titre 3")
+    # Cinq lignes : nouvel instantané (génération 2), journal précédent supprimé
+    assert fichiers(tmp_path) == ["catalogue.2.log", "catalogue.snap"]
+    attendus = [f"Titre {i}" for i in range(8) if i != 3]
+    assert premier.titres() == attendus
+    assert second.titres() == attendus
+    assert second.generation == 2
+    # Le second a suivi le repli sans recharger l'instantané
+    assert second._rechargements == 1
+    assert CataloguePersistant(tmp_path).titres() == attendus
+
+
+def test_remplacer(tmp_path):
+    premier = CataloguePersistant(tmp_path, ["Germinal", "Nana"])
+    second = CataloguePersistant(tmp_path)
+    premier.ajouter("Au Bonheur des Dames")
+    version = second.version
+    premier.remplacer(["Candide", "candide", "Zadig"])
+    assert fichiers(tmp_path) == ["catalogue.2.log", "catalogue.snap"]
+    assert premier.titres() == ["Candide", "Zadig"]
+    assert second.titres() == ["Candide", "Zadig"]
+    assert second.version != version
+    second.ajouter("Micromégas")
+    assert premier.titres() == ["Candide", "Zadig", "Micromégas"]
+
+
+def test_instantane_invalide(tmp_path):
+    (tmp_path / "catalogue.snap").write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError, match="instantané"):
+        CataloguePersistant(tmp_path)
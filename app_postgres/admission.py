@@ -0,0 +1,127 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metriques import REQUETES_REJETEES, route_courante
+
+logger = logging.getLogger("librairie.admission")
+
+
+class SeauxJetons:
+    """Limite de débit par client (seau à jetons), propre à un worker
+
+    Chaque client dispose de `capacite` jetons, rendus au rythme de `debit` par
+    seconde ; une requête en consomme un. Seuls les `max_clients` clients vus le
+    plus récemment sont gardés : un client oublié repart d'un seau plein.
+    """
+
+    def __init__(self, debit, capacite, max_clients=10000):
+        self.debit = debit
+        self.capacite = max(1.0, capacite)
+        self.max_clients = max_clients
+        self._seaux = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def prendre(self, client):
+        """Consommer un jeton : 0 si la requête passe, sinon le délai (s) avant le prochain jeton"""
+        maintenant = time.monotonic()
+        with self._verrou:
+            jetons, instant = self._seaux.pop(client, (self.capacite, maintenant))
+            jetons = min(self.capacite, jetons + (maintenant - instant) * self.debit)
+            if jetons >= 1:
+                jetons -= 1
+                attente = 0.0
+            else:
+                attente = (1 - jetons) / self.debit
+            # Réinséré en fin : les clients les moins récents sont en tête
+            self._seaux[client] = (jetons, maintenant)
+            if len(self._seaux) > self.max_clients:
+                self._seaux.popitem(last=False)
+        return attente
+
+
+def instant_reception(entete):
+    """Instant (epoch, s) de X-Request-Start posé par le proxy : "t=<s|ms|µs>" ; None si illisible"""
+    if not entete:
+        return None
+    try:
+        valeur = float(entete.removeprefix("t="))
+    except ValueError:
+        return None
+    # Secondes (nginx ${msec}), millisecondes ou microsecondes selon l'ordre de grandeur
+    while valeur > 1e11:
+        valeur /= 1000
+    return valeur
+
+
+def controler_admission(app, couteuses=(), exemptees=(), proxys_de_confiance=0):
+    """Refuser les requêtes d'une application Flask plutôt que de laisser la base saturer
+
+    - RATE_LIMIT_PER_SECOND / RATE_LIMIT_BURST : débit par client et par worker
+      (0 : pas de limite), au-delà 429. Le client est l'adresse distante : sans
+      `proxys_de_confiance` (TRUSTED_PROXIES), derrière un répartiteur de charge,
+      tous les clients partagent un seul seau ;
+    - EXPENSIVE_MAX_CONCURRENCY : routes `couteuses` traitées en même temps par
+      un worker (0, par défaut : pas de limite) ; une requête qui attend sa place plus de
+      EXPENSIVE_MAX_WAIT_MS reçoit un 503 ;
+    - MAX_QUEUE_TIME_MS : 503 pour une requête restée plus longtemps en file
+      devant l'application, d'après X-Request-Start (0 : désactivé).
+
+    Les refus portent Retry-After et sont comptés par route et par raison. Les
+    routes `exemptees` (sondes, métriques) ne sont jamais refusées.
+    """
+    from flask import g, jsonify, request
+
+    debit = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+    seaux = SeauxJetons(debit, float(os.getenv("RATE_LIMIT_BURST") or 2 * debit)) if debit > 0 else None
+    if seaux is not None and proxys_de_confiance <= 0:
+        logger.warning(
+            "RATE_LIMIT_PER_SECOND sans TRUSTED_PROXIES : derrière un répartiteur de charge, "
+            "tous les clients partagent la limite de son adresse"
+        )
+    limite = int(os.getenv("EXPENSIVE_MAX_CONCURRENCY", "0"))
+    places = threading.BoundedSemaphore(limite) if limite > 0 else None
+    attente_max = float(os.getenv("EXPENSIVE_MAX_WAIT_MS", "500")) / 1000
+    file_max = float(os.getenv("MAX_QUEUE_TIME_MS", "0")) / 1000
+    delai_reessai = os.getenv("RETRY_AFTER_SECONDS", "1")
+
+    def refuser(statut, raison, message, delai):
+        REQUETES_REJETEES.labels(route_courante(request), raison).inc()
+        reponse = jsonify({"error": message})
+        reponse.status_code = statut
+        reponse.headers["Retry-After"] = str(delai)
+        return reponse
+
+    @app.before_request
+    def admettre():
+        if request.endpoint in exemptees:
+            return None
+        if file_max > 0:
+            recue = instant_reception(request.headers.get("X-Request-Start"))
+            if recue is not None and time.time() - recue > file_max:
+                return refuser(503, "queue_time", "Service surchargé, réessayer plus tard", delai_reessai)
+        if seaux is not None:
+            attente = seaux.prendre(request.remote_addr or "")
+            if attente > 0:
+                return refuser(429, "rate_limit", "Trop de requêtes", math.ceil(attente))
+        if places is not None and request.endpoint in couteuses:
+            if not places.acquire(timeout=attente_max):
+                return refuser(503, "concurrency", "Service surchargé, réessayer plus tard", delai_reessai)
+            g.admission_place = True
+        return None
+
+    @app.after_request
+    def garder_place_pendant_le_flux(reponse):
+        # Réponse en flux (export) : la base est lue pendant l'envoi du corps, la place
+        # n'est rendue qu'une fois celui-ci terminé, même pour un client lent
+        if reponse.is_streamed and g.pop("admission_place", False):
+            reponse.call_on_close(places.release)
+        return reponse
+
+    @app.teardown_request
+    def liberer_place(exception=None):
+        if g.pop("admission_place", False):
+            places.release()
@@ -0,0 +1,153 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from metriques import REQUETES_CACHE
+
+logger = logging.getLogger("librairie.cache")
+
+# Canal PostgreSQL sur lequel les écritures annoncent la librairie modifiée
+CANAL_INVALIDATION = "librairie_modifiee"
+
+# Portée des entrées qui dépendent de toutes les librairies (liste des librairies) :
+# invalidées par la modification de n'importe laquelle
+PORTEE_TOUTES = "*"
+
+
+class CacheLRU:
+    """Cache mémoire borné (LRU) avec durée de vie, invalidable par librairie
+
+    Les clés sont des tuples dont le premier élément est l'identifiant de la
+    librairie concernée, ce qui permet d'invalider toutes ses entrées d'un coup.
+    """
+
+    def __init__(self, taille_max=1024, duree_vie=30.0):
+        self.taille_max = taille_max
+        self.duree_vie = duree_vie
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        # Génération par librairie : une valeur calculée pendant une invalidation n'est pas stockée
+        self._generations = {}
+        self._generation_globale = 0
+        # Date (monotonic) de la dernière invalidation de chaque portée, None pour tout le cache
+        self._invalidations = {}
+        self.succes = 0
+        self.echecs = 0
+
+    @property
+    def actif(self):
+        return self.taille_max > 0 and self.duree_vie > 0
+
+    def obtenir(self, cle, calculer):
+        """Renvoyer la valeur en cache pour `cle`, ou la calculer et la mémoriser"""
+        if not self.actif:
+            return calculer()
+
+        portee = cle[0]
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[0] > time.monotonic():
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                REQUETES_CACHE.labels("hit").inc()
+                return entree[1]
+            self.echecs += 1
+            REQUETES_CACHE.labels("miss").inc()
+            generation = (self._generation_globale, self._generations.get(portee, 0))
+
+        valeur = calculer()
+
+        with self._verrou:
+            if generation == (self._generation_globale, self._generations.get(portee, 0)):
+                self._entrees[cle] = (time.monotonic() + self.duree_vie, valeur)
+                self._entrees.move_to_end(cle)
+                while len(self._entrees) > self.taille_max:
+                    self._entrees.popitem(last=False)
+        return valeur
+
+    def invalider(self, portee=None):
+        """Oublier les entrées d'une librairie, ou tout le cache si `portee` vaut None"""
+        with self._verrou:
+            maintenant = time.monotonic()
+            self._invalidations[portee] = maintenant
+            if portee is None:
+                self._generation_globale += 1
+                self._entrees.clear()
+                return
+            for concernee in (portee, PORTEE_TOUTES):
+                self._generations[concernee] = self._generations.get(concernee, 0) + 1
+            self._invalidations[PORTEE_TOUTES] = maintenant
+            for cle in [cle for cle in self._entrees if cle[0] in (portee, PORTEE_TOUTES)]:
+                del self._entrees[cle]
+
+    def modifiee_recemment(self, portee, delai):
+        """Vrai si la portée (ou tout le cache) a été invalidée il y a moins de `delai` secondes"""
+        limite = time.monotonic() - delai
+        with self._verrou:
+            return max(self._invalidations.get(portee, 0.0), self._invalidations.get(None, 0.0)) > limite
+
+    def stats(self):
+        with self._verrou:
+            total = self.succes + self.echecs
+            return {
+                "entrees": len(self._entrees),
+                "taille_max": self.taille_max,
+                "succes": self.succes,
+                "echecs": self.echecs,
+                "taux_succes": round(self.succes / total, 4) if total else None,
+            }
+
+
+class EcouteurInvalidation(threading.Thread):
+    """Thread qui écoute les NOTIFY des autres workers et pods pour invalider le cache local"""
+
+    def __init__(self, db_params, cache, canal=CANAL_INVALIDATION, delai_reconnexion=5.0):
+        super().__init__(name="ecouteur-invalidation", daemon=True)
+        self.db_params = dict(db_params)
+        self.cache = cache
+        self.canal = canal
+        self.delai_reconnexion = delai_reconnexion
+        self._arret = threading.Event()
+        # Écrire dans ce tube réveille l'attente des notifications (arrêt immédiat)
+        self._reveil_lecture, self._reveil_ecriture = os.pipe()
+
+    def arreter(self):
+        self._arret.set()
+        os.write(self._reveil_ecriture, b"x")
+
+    def run(self):
+        while not self._arret.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.db_params)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.canal}")
+                # Des notifications ont pu être manquées pendant la (re)connexion
+                self.cache.invalider()
+                self._ecouter(conn)
+            except psycopg2.Error as e:
+                logger.warning("Écoute des invalidations interrompue : %s", e)
+            finally:
+                if conn is not None:
+                    conn.close()
+            self._arret.wait(self.delai_reconnexion)
+        os.close(self._reveil_lecture)
+        os.close(self._reveil_ecriture)
+
+    def _ecouter(self, conn):
+        while not self._arret.is_set():
+            prets, _, _ = select.select([conn, self._reveil_lecture], [], [], self.delai_reconnexion)
+            if conn not in prets:
+                continue
+            conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                portee = int(notification.payload) if notification.payload.isdigit() else None
+                self.cache.invalider(portee)
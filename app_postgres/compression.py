@@ -0,0 +1,74 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli est facultatif : gzip seul
+    brotli = None
+
+# Types de contenu compressés (les réponses de l'API sont du texte)
+TYPES_COMPRESSIBLES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"}
+
+# Codages proposés, du préféré au moins bon à qualité égale pour le client
+CODAGES = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Corps plus petits laissés tels quels : l'en-tête gzip et le temps CPU ne valent pas le gain
+TAILLE_MIN = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+# Niveaux rapides, adaptés à des réponses produites à la volée
+NIVEAU_GZIP = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+QUALITE_BROTLI = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+
+def choisir_codage(requete, taille):
+    """Codage à appliquer à un corps de `taille` octets d'après Accept-Encoding (None : aucun)"""
+    if taille < TAILLE_MIN:
+        return None
+    return requete.accept_encodings.best_match(CODAGES)
+
+
+def compresser(corps, codage):
+    if codage == "br":
+        return brotli.compress(corps, quality=QUALITE_BROTLI)
+    # mtime=0 : même corps, mêmes octets compressés
+    return gzip.compress(corps, compresslevel=NIVEAU_GZIP, mtime=0)
+
+
+def marquer_codage(reponse, codage):
+    """En-têtes d'un corps compressé : Content-Encoding, et ETag rendu faible
+
+    Un ETag fort désigne des octets précis, que la compression change ; faible,
+    il reste comparable (If-None-Match) d'un codage à l'autre.
+    """
+    reponse.headers["Content-Encoding"] = codage
+    etag, faible = reponse.get_etag()
+    if etag and not faible:
+        reponse.set_etag(etag, weak=True)
+
+
+def compresser_reponses(app):
+    """Compresser (brotli ou gzip, selon Accept-Encoding) les réponses d'une application Flask
+
+    Seules les réponses 200 textuelles d'au moins COMPRESSION_MIN_BYTES octets sont
+    compressées ; les flux (export) et les corps déjà compressés sont laissés tels quels.
+    """
+    from flask import request
+
+    @app.after_request
+    def compresser_reponse(reponse):
+        if reponse.mimetype not in TYPES_COMPRESSIBLES and reponse.status_code != 304:
+            return reponse
+        # Les caches partagés (CDN) doivent garder une version par codage
+        reponse.vary.add("Accept-Encoding")
+        if (
+            reponse.status_code != 200
+            or reponse.is_streamed
+            or reponse.direct_passthrough
+            or "Content-Encoding" in reponse.headers
+        ):
+            return reponse
+        corps = reponse.get_data()
+        codage = choisir_codage(request, len(corps))
+        if codage is not None:
+            reponse.set_data(compresser(corps, codage))
+            marquer_codage(reponse, codage)
+        return reponse
@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+
+# Colonnes acceptées pour un livre, dans l'ordre de la table livres
+COLONNES_LIVRE = ("titre", "auteur", "isbn", "annee_publication")
+
+# Longueurs maximales imposées par le schéma de la table livres
+LONGUEURS_MAX = {"titre": 200, "auteur": 100, "isbn": 20}
+
+# Années de publication acceptées : bien en deçà des bornes de la colonne INTEGER,
+# qu'une valeur hors bornes ferait échouer tout le COPY ou tout le lot
+ANNEE_MIN = -9999
+ANNEE_MAX = 9999
+
+
+class _FluxBrut(io.RawIOBase):
+    """Adapter un objet qui n'a que read(n) (corps de requête de gunicorn) à io"""
+
+    def __init__(self, flux):
+        self._flux = flux
+
+    def readable(self):
+        return True
+
+    def readinto(self, tampon):
+        donnees = self._flux.read(len(tampon))
+        tampon[:len(donnees)] = donnees
+        return len(donnees)
+
+
+def ouvrir_texte(flux_binaire):
+    """Lire un flux binaire (corps de requête) comme du texte UTF-8, ligne à ligne"""
+    if not isinstance(flux_binaire, io.BufferedIOBase):
+        if not isinstance(flux_binaire, io.RawIOBase):
+            flux_binaire = _FluxBrut(flux_binaire)
+        flux_binaire = io.BufferedReader(flux_binaire)
+    return io.TextIOWrapper(flux_binaire, encoding="utf-8", newline="")
+
+
+def lire_jsonl(flux_texte):
+    """Parcourir un flux JSON Lines : un objet livre par ligne (None si la ligne est illisible)"""
+    for ligne in flux_texte:
+        ligne = ligne.strip()
+        if not ligne:
+            continue
+        try:
+            livre = json.loads(ligne)
+        except ValueError:
+            yield None
+            continue
+        yield livre if isinstance(livre, dict) else None
+
+
+def lire_csv(flux_texte):
+    """Parcourir un flux CSV avec une ligne d'en-tête (titre,auteur,isbn,annee_publication)"""
+    for livre in csv.DictReader(flux_texte):
+        yield livre
+
+
+class LectureLivres:
+    """Livres lus par lire_jsonl ou lire_csv, jusqu'à la première erreur de lecture
+
+    Un corps qui n'est pas en UTF-8 ou un CSV illisible (champ trop long) lève une
+    exception au milieu du flux, après des lots déjà importés : la lecture s'arrête,
+    la ligne fautive compte comme rejetée (None) et l'erreur est gardée dans `erreur`.
+    """
+
+    def __init__(self, livres):
+        self._livres = livres
+        self.erreur = None
+
+    def __iter__(self):
+        try:
+            yield from self._livres
+        except (UnicodeDecodeError, csv.Error) as e:
+            self.erreur = e
+            yield None
+
+
+def normaliser_livre(livre):
+    """Valider un livre importé et le convertir en tuple pour COPY (None s'il est rejeté)"""
+    if not isinstance(livre, dict):
+        return None
+
+    # "nomLivre" est le nom de champ utilisé par POST /livres
+    titre = livre.get("titre", livre.get("nomLivre"))
+    if not isinstance(titre, str) or not titre.strip():
+        return None
+
+    valeurs = {"titre": titre.strip()}
+    for colonne in ("auteur", "isbn"):
+        valeur = livre.get(colonne)
+        if valeur in (None, ""):
+            valeurs[colonne] = None
+        elif isinstance(valeur, str):
+            valeurs[colonne] = valeur.strip()
+        else:
+            return None
+
+    for colonne, longueur in LONGUEURS_MAX.items():
+        if valeurs[colonne] is not None and len(valeurs[colonne]) > longueur:
+            return None
+
+    annee = livre.get("annee_publication")
+    if annee in (None, ""):
+        valeurs["annee_publication"] = None
+    else:
+        try:
+            valeurs["annee_publication"] = int(annee)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        if not ANNEE_MIN <= valeurs["annee_publication"] <= ANNEE_MAX:
+            return None
+
+    return tuple(valeurs[colonne] for colonne in COLONNES_LIVRE)
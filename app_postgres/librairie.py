@@ -1,12 +1,92 @@
 import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import csv
+import functools
+import inspect
+import io
+import logging
 import os
+import re
+import time
 from dotenv import load_dotenv
+from flux_livres import COLONNES_LIVRE, normaliser_livre
+from migrations import appliquer_migrations
+from cache import CANAL_INVALIDATION, PORTEE_TOUTES, CacheLRU, EcouteurInvalidation
+from metriques import DUREE_DB, LECTURES, REQUETES_SQL
+from pool import PoolConnexions, RepartiteurLectures, compteur_requetes, lecture_primaire, methode_courante
 
 # Charger les variables d'environnement depuis un fichier .env
 load_dotenv()
 
+logger = logging.getLogger("librairie.db")
+
+# Champs d'un livre renvoyés par l'API, dans l'ordre des requêtes SELECT
+CHAMPS_LIVRE = ("id", "titre", "auteur", "isbn", "annee_publication")
+
+# Vues matérialisées des statistiques (migration 8), dans leur ordre de rafraîchissement :
+# stats_catalogue d'abord, l'état des tables qu'elle garde ne doit pas être plus récent que les autres
+VUES_STATISTIQUES = ("stats_catalogue", "stats_librairies", "stats_auteurs", "stats_annees")
+
+# Classements servis par /stats/<dimension> : requête sur la vue et noms des colonnes
+CLASSEMENTS_STATISTIQUES = {
+    "librairies": (
+        """
+        SELECT s.librairie_id, l.nom, s.livres
+        FROM stats_librairies s
+        JOIN librairies l ON l.id = s.librairie_id
+        ORDER BY s.livres DESC, s.librairie_id
+        LIMIT %s
+        """,
+        ("librairie_id", "nom", "livres"),
+    ),
+    "auteurs": (
+        "SELECT auteur, livres FROM stats_auteurs ORDER BY livres DESC, auteur LIMIT %s",
+        ("auteur", "livres"),
+    ),
+    "annees": (
+        "SELECT annee_publication, livres FROM stats_annees ORDER BY annee_publication DESC LIMIT %s",
+        ("annee_publication", "livres"),
+    ),
+}
+
+# Clé du verrou consultatif qui évite deux rafraîchissements simultanés des statistiques
+CLE_VERROU_STATISTIQUES = 4_815_162_343
+
+
+def mesure_db(methode):
+    """Mesurer la durée et le nombre de requêtes SQL d'une méthode de LibrairieDB (/metrics)"""
+    nom = methode.__name__.lstrip("_")
+    
+    def enregistrer(debut, requetes_avant):
+        DUREE_DB.labels(nom).observe(time.perf_counter() - debut)
+        REQUETES_SQL.labels(nom).inc(max(0, compteur_requetes() - requetes_avant))
+    
+    if inspect.isgeneratorfunction(methode):
+        # Générateur : mesuré jusqu'à son épuisement ou sa fermeture
+        @functools.wraps(methode)
+        def generateur_mesure(*args, **kwargs):
+            debut, requetes_avant = time.perf_counter(), compteur_requetes()
+            jeton = methode_courante.set(nom)
+            try:
+                yield from methode(*args, **kwargs)
+            finally:
+                methode_courante.reset(jeton)
+                enregistrer(debut, requetes_avant)
+        return generateur_mesure
+    
+    @functools.wraps(methode)
+    def methode_mesuree(*args, **kwargs):
+        debut, requetes_avant = time.perf_counter(), compteur_requetes()
+        jeton = methode_courante.set(nom)
+        try:
+            return methode(*args, **kwargs)
+        finally:
+            methode_courante.reset(jeton)
+            enregistrer(debut, requetes_avant)
+    return methode_mesuree
+
+
 class LibrairieDB:
     def __init__(self):
         # Récupérer les informations de connexion depuis les variables d'environnement
@@ -15,17 +95,135 @@ class LibrairieDB:
             "port": os.getenv("DB_PORT", "5432"),
             "user": os.getenv("DB_USER", "postgres"),
             "password": os.getenv("DB_PASSWORD", ""),
+            # Une connexion ou une vérification ne doit pas bloquer indéfiniment un worker :
+            # délai de connexion, keepalives TCP, et abandon d'un envoi resté sans accusé
+            # de réception (connexion à moitié ouverte après une panne réseau)
+            "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+            "keepalives": 1,
+            "keepalives_idle": int(os.getenv("DB_KEEPALIVES_IDLE", "30")),
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+            "tcp_user_timeout": int(os.getenv("DB_TCP_USER_TIMEOUT_MS", "10000")),
         }
         self.db_name = os.getenv("DB_NAME", "librairie_db")
+        # Réplicas en lecture seule, "hote[:port]" séparés par des virgules (vide : tout va au primaire)
+        self.repliques = [
+            hote.strip() for hote in os.getenv("DB_REPLICA_HOSTS", "").split(",") if hote.strip()
+        ]
+        # Retard de réplication toléré : au-delà, un réplica est écarté ; une librairie
+        # modifiée depuis moins longtemps est lue sur le primaire
+        self.retard_max_repliques = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+        # Instructions préparées côté serveur pour les requêtes fréquentes (false derrière PgBouncer en mode transaction)
+        self.instructions_preparees = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true"
+        self._pool = None
+        self._lectures = None
+        self._ecouteur = None
+        self._ecouteur_pid = None
+        self._recherche_indexee = None
+        self._cache = CacheLRU(
+            taille_max=int(os.getenv("CACHE_TAILLE_MAX", "1024")),
+            duree_vie=float(os.getenv("CACHE_TTL", "30")),
+        )
         
-        # Créer la base de données si elle n'existe pas
-        self.create_database()
-        
-        # Mettre à jour les paramètres pour inclure le nom de la base de données
+        # Aucune connexion n'est ouverte ici : la base et le schéma sont préparés
+        # par migrer() (init-container ou DB_AUTO_MIGRATE), les connexions au premier usage
         self.db_params["dbname"] = self.db_name
+    
+    @property
+    def pool(self):
+        """Pool de connexions, créé au premier usage dans chaque worker"""
+        if self._pool is None:
+            self._pool = PoolConnexions(
+                self.db_params,
+                taille_min=int(os.getenv("DB_POOL_MIN", "1")),
+                taille_max=int(os.getenv("DB_POOL_MAX", "10")),
+                delai_attente=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                intervalle_verification=float(os.getenv("DB_POOL_CHECK_INTERVAL", "30")),
+                instructions_preparees=self.instructions_preparees,
+            )
+        return self._pool
+    
+    @property
+    def lectures(self):
+        """Répartiteur des lectures entre les réplicas (None sans réplica), créé au premier usage"""
+        if self._lectures is None and self.repliques:
+            pools = []
+            for replique in self.repliques:
+                hote, _, port = replique.partition(":")
+                pools.append(PoolConnexions(
+                    # Un réplica injoignable doit être écarté vite, pas bloquer la requête
+                    {**self.db_params, "host": hote, "port": port or self.db_params["port"],
+                     "connect_timeout": int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))},
+                    taille_min=0,
+                    taille_max=int(os.getenv("DB_POOL_MAX", "10")),
+                    delai_attente=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                    intervalle_verification=float(os.getenv("DB_POOL_CHECK_INTERVAL", "30")),
+                    instructions_preparees=self.instructions_preparees,
+                ))
+            self._lectures = RepartiteurLectures(
+                pools,
+                self.pool,
+                retard_max=self.retard_max_repliques,
+                intervalle_verification=float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5")),
+            )
+        return self._lectures
+    
+    def connexion_lecture(self, portee=None):
+        """Connexion pour une lecture seule : réplica si possible, sinon primaire
+        
+        Le primaire est gardé quand la requête HTTP doit lire ses propres écritures
+        (lecture_primaire) ou quand la portée (librairie) a été modifiée depuis moins
+        de DB_REPLICA_MAX_LAG secondes : un réplica en retard remettrait en cache
+        l'état d'avant la modification.
+        """
+        if (
+            self.lectures is None
+            or lecture_primaire.get()
+            or self._cache.modifiee_recemment(portee, self.retard_max_repliques)
+        ):
+            if self.repliques:
+                LECTURES.labels("primary").inc()
+            return self.pool.connexion()
+        return self.lectures.connexion()
+    
+    @property
+    def cache(self):
+        """Cache des lectures, invalidé par les écritures de tous les workers (LISTEN/NOTIFY)"""
+        self._ecouter_invalidations()
+        return self._cache
+    
+    def _ecouter_invalidations(self):
+        if self._cache.actif and self._ecouteur_pid != os.getpid():
+            # Un thread d'écoute par processus : il ne survit pas au fork des workers
+            self._ecouteur_pid = os.getpid()
+            self._ecouteur = EcouteurInvalidation(self.db_params, self._cache)
+            self._ecouteur.start()
+    
+    def fermer(self):
+        """Fermer les connexions de ce processus et arrêter l'écoute des invalidations
         
-        # Créer les tables si elles n'existent pas
-        self.create_tables()
+        Appelé par le maître gunicorn avant le fork des workers (preload_app) : les
+        connexions ouvertes au chargement (migrations, librairie CGI) ne doivent pas
+        être héritées, un worker qui libère son double ferme la session du maître.
+        """
+        if self._ecouteur is not None and self._ecouteur_pid == os.getpid():
+            self._ecouteur.arreter()
+            self._ecouteur.join(timeout=5)
+        self._ecouteur = None
+        self._ecouteur_pid = None
+        if self._pool is not None:
+            self._pool.fermer()
+        if self._lectures is not None:
+            self._lectures.fermer()
+    
+    def initialiser_worker(self):
+        """Ouvrir dans un worker démarré les connexions minimales du pool et l'écoute des invalidations"""
+        self.pool.remplir()
+        self._ecouter_invalidations()
+    
+    def _signaler_modification(self, cursor, librairie_id):
+        """Annoncer aux autres workers, au commit, qu'une librairie a changé"""
+        cursor.executer_prepare("SELECT pg_notify(%s, %s)", (CANAL_INVALIDATION, str(librairie_id)))
     
     def create_database(self):
         """Créer la base de données si elle n'existe pas déjà"""
@@ -40,156 +238,545 @@ class LibrairieDB:
         
         if not exists:
             cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(self.db_name)))
-            print(f"Base de données '{self.db_name}' créée avec succès.")
+            logger.info("Base de données '%s' créée avec succès.", self.db_name)
         else:
-            print(f"La base de données '{self.db_name}' existe déjà.")
+            logger.info("La base de données '%s' existe déjà.", self.db_name)
         
         cursor.close()
         conn.close()
     
     def create_tables(self):
-        """Créer les tables nécessaires pour la librairie"""
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
-        
-        # Table des librairies
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS librairies (
-                id SERIAL PRIMARY KEY,
-                nom VARCHAR(100) NOT NULL,
-                adresse TEXT NOT NULL,
-                date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Table des livres
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS livres (
-                id SERIAL PRIMARY KEY,
-                titre VARCHAR(200) NOT NULL,
-                auteur VARCHAR(100),
-                isbn VARCHAR(20) UNIQUE,
-                annee_publication INTEGER,
-                date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Table de relation entre librairies et livres (many-to-many)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS librairie_livres (
-                librairie_id INTEGER REFERENCES librairies(id) ON DELETE CASCADE,
-                livre_id INTEGER REFERENCES livres(id) ON DELETE CASCADE,
-                date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (librairie_id, livre_id)
-            )
-        """)
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("Tables créées avec succès.")
+        """Créer ou mettre à jour les tables nécessaires pour la librairie"""
+        appliquees = appliquer_migrations(self.db_params)
+        self._recherche_indexee = None
+        if appliquees:
+            logger.info("Migrations appliquées : %s", appliquees)
+        return appliquees
+    
+    def migrer(self):
+        """Créer la base si besoin puis appliquer les migrations du schéma"""
+        self.create_database()
+        return self.create_tables()
+    
+    @property
+    def recherche_indexee(self):
+        """Vrai si les index de recherche (pg_trgm, unaccent) sont présents, lu une fois"""
+        if self._recherche_indexee is None:
+            with self.pool.connexion() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT to_regclass('livres_recherche_idx') IS NOT NULL AND to_regclass('livres_titre_trgm_idx') IS NOT NULL"
+                )
+                self._recherche_indexee = cursor.fetchone()[0]
+                cursor.close()
+        return self._recherche_indexee
     
+    @mesure_db
     def ajouter_librairie(self, nom, adresse):
         """Ajouter une nouvelle librairie"""
         if not isinstance(nom, str) or not isinstance(adresse, str):
-            print("Attention: le nom et l'adresse doivent être des chaînes de caractères")
+            logger.warning("Le nom et l'adresse doivent être des chaînes de caractères")
             return None
         
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "INSERT INTO librairies (nom, adresse) VALUES (%s, %s) RETURNING id",
-            (nom, adresse)
-        )
-        librairie_id = cursor.fetchone()[0]
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO librairies (nom, adresse) VALUES (%s, %s) RETURNING id",
+                (nom, adresse)
+            )
+            librairie_id = cursor.fetchone()[0]
+            # Une absence mise en cache par un worker (404) ne doit pas survivre à la création
+            self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        self.cache.invalider(librairie_id)
         
-        print(f"Librairie '{nom}' ajoutée avec succès (ID: {librairie_id}).")
+        logger.info("Librairie ajoutée", extra={"nom": nom, "librairie_id": librairie_id})
         return librairie_id
     
+    @mesure_db
+    def modifier_librairie(self, librairie_id, nom=None, adresse=None):
+        """Mettre à jour le nom et/ou l'adresse d'une librairie"""
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE librairies SET nom = COALESCE(%s, nom), adresse = COALESCE(%s, adresse), "
+                "modifiee_le = clock_timestamp() WHERE id = %s",
+                (nom, adresse, librairie_id)
+            )
+            self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        self.cache.invalider(librairie_id)
+    
+    @mesure_db
     def ajouter_livre(self, titre, auteur=None, isbn=None, annee_publication=None):
         """Ajouter un nouveau livre"""
         if not isinstance(titre, str):
-            print("Attention: le titre doit être une chaîne de caractères")
+            logger.warning("Le titre doit être une chaîne de caractères")
             return None
         
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "INSERT INTO livres (titre, auteur, isbn, annee_publication) VALUES (%s, %s, %s, %s) RETURNING id",
-            (titre, auteur, isbn, annee_publication)
-        )
-        livre_id = cursor.fetchone()[0]
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO livres (titre, auteur, isbn, annee_publication) VALUES (%s, %s, %s, %s) RETURNING id",
+                (titre, auteur, isbn, annee_publication)
+            )
+            livre_id = cursor.fetchone()[0]
+            cursor.close()
         
-        print(f"Livre '{titre}' ajouté avec succès (ID: {livre_id}).")
+        logger.debug("Livre ajouté", extra={"titre": titre, "livre_id": livre_id})
         return livre_id
     
+    @mesure_db
     def ajouter_livre_a_librairie(self, librairie_id, livre_id):
         """Ajouter un livre existant à une librairie"""
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO librairie_livres (librairie_id, livre_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                (librairie_id, livre_id)
+            )
+            
+            if cursor.rowcount > 0:
+                logger.debug("Livre ajouté à la librairie", extra={"librairie_id": librairie_id, "livre_id": livre_id})
+            else:
+                logger.debug("Livre déjà présent dans cette librairie", extra={"librairie_id": librairie_id})
+            
+            self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        self.cache.invalider(librairie_id)
+    
+    @mesure_db
+    def ajouter_titre_a_librairie(self, librairie_id, titre, auteur=None, isbn=None, annee_publication=None):
+        """Créer le livre si besoin et le lier à la librairie en une seule requête
         
-        # Vérifier si le livre est déjà présent dans la librairie
-        cursor.execute(
-            "SELECT 1 FROM librairie_livres WHERE librairie_id = %s AND livre_id = %s",
-            (librairie_id, livre_id)
-        )
-        existe = cursor.fetchone()
+        Renvoie True si le livre a été ajouté à la librairie, False s'il y était déjà.
+        """
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            # L'upsert sur lower(titre) rend l'opération sûre entre workers concurrents ;
+            # le DO UPDATE complète les informations manquantes et renvoie l'id existant
+            cursor.executer_prepare("""
+                WITH livre AS (
+                    INSERT INTO livres (titre, auteur, isbn, annee_publication)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (lower(titre)) DO UPDATE SET
+                        auteur = COALESCE(livres.auteur, EXCLUDED.auteur),
+                        isbn = COALESCE(livres.isbn, EXCLUDED.isbn),
+                        annee_publication = COALESCE(livres.annee_publication, EXCLUDED.annee_publication)
+                    RETURNING id
+                )
+                INSERT INTO librairie_livres (librairie_id, livre_id)
+                SELECT %s, id FROM livre
+                ON CONFLICT DO NOTHING
+            """, (titre, auteur, isbn, annee_publication, librairie_id))
+            ajoute = cursor.rowcount > 0
+            if ajoute:
+                self._signaler_modification(cursor, librairie_id)
+            cursor.close()
         
-        if existe:
-            print("Attention: le livre est déjà présent dans cette librairie")
+        if ajoute:
+            self.cache.invalider(librairie_id)
+            logger.debug("Livre ajouté à la librairie", extra={"librairie_id": librairie_id, "titre": titre})
         else:
-            cursor.execute(
-                "INSERT INTO librairie_livres (librairie_id, livre_id) VALUES (%s, %s)",
-                (librairie_id, livre_id)
+            logger.debug("Livre déjà présent dans cette librairie", extra={"librairie_id": librairie_id})
+        return ajoute
+    
+    @mesure_db
+    def importer_livres(self, librairie_id, livres, taille_lot=5000, progression=None):
+        """Importer en masse des livres dans une librairie via COPY, par lots
+        
+        `livres` est un itérable de dictionnaires (titre, auteur, isbn, annee_publication),
+        consommé au fil de l'eau. Chaque lot est chargé dans une table temporaire puis
+        fusionné dans livres et librairie_livres dans sa propre transaction.
+        `progression(rapport)` est appelée après chaque lot fusionné.
+        """
+        rapport = {"inseres": 0, "doublons": 0, "rejetes": 0, "livres_crees": 0}
+        lot = []
+        
+        for livre in livres:
+            ligne = normaliser_livre(livre)
+            if ligne is None:
+                rapport["rejetes"] += 1
+                continue
+            lot.append(ligne)
+            if len(lot) >= taille_lot:
+                self._fusionner_lot(librairie_id, lot, rapport)
+                lot = []
+                if progression is not None:
+                    progression(rapport)
+        
+        if lot:
+            self._fusionner_lot(librairie_id, lot, rapport)
+            if progression is not None:
+                progression(rapport)
+        
+        logger.info("Import terminé", extra={"librairie_id": librairie_id, **rapport})
+        return rapport
+    
+    def _fusionner_lot(self, librairie_id, lot, rapport):
+        """Charger un lot par COPY dans la table de transit et le fusionner"""
+        tampon = io.StringIO()
+        csv.writer(tampon).writerows(lot)
+        tampon.seek(0)
+        
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TEMPORARY TABLE IF NOT EXISTS import_livres (
+                    titre TEXT,
+                    auteur TEXT,
+                    isbn TEXT,
+                    annee_publication INTEGER
+                ) ON COMMIT DELETE ROWS
+            """)
+            cursor.copy_expert(
+                "COPY import_livres ({}) FROM STDIN WITH (FORMAT csv)".format(", ".join(COLONNES_LIVRE)),
+                tampon
             )
-            print("Livre ajouté à la librairie avec succès.")
+            
+            # Nouveaux titres du catalogue (le premier exemplaire d'un titre dans le lot l'emporte)
+            cursor.execute("""
+                INSERT INTO livres (titre, auteur, isbn, annee_publication)
+                SELECT DISTINCT ON (lower(titre)) titre, auteur, isbn, annee_publication
+                FROM import_livres
+                ORDER BY lower(titre)
+                ON CONFLICT DO NOTHING
+            """)
+            rapport["livres_crees"] += cursor.rowcount
+            
+            # Liens vers la librairie pour tous les titres désormais présents
+            cursor.execute("""
+                INSERT INTO librairie_livres (librairie_id, livre_id)
+                SELECT DISTINCT %s, l.id
+                FROM import_livres i
+                JOIN livres l ON lower(l.titre) = lower(i.titre)
+                ON CONFLICT DO NOTHING
+            """, (librairie_id,))
+            inseres = cursor.rowcount
+            
+            # Titres non insérés à cause d'un conflit d'ISBN avec un autre livre
+            cursor.execute("""
+                SELECT count(*)
+                FROM import_livres i
+                WHERE NOT EXISTS (SELECT 1 FROM livres l WHERE lower(l.titre) = lower(i.titre))
+            """)
+            rejetes = cursor.fetchone()[0]
+            self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        self.cache.invalider(librairie_id)
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        rapport["inseres"] += inseres
+        rapport["rejetes"] += rejetes
+        rapport["doublons"] += len(lot) - inseres - rejetes
     
+    @mesure_db
     def supprimer_livre_de_librairie(self, librairie_id, livre_id):
         """Supprimer un livre d'une librairie"""
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM librairie_livres WHERE librairie_id = %s AND livre_id = %s",
+                (librairie_id, livre_id)
+            )
+            
+            if cursor.rowcount > 0:
+                logger.debug("Livre supprimé de la librairie", extra={"librairie_id": librairie_id, "livre_id": livre_id})
+            else:
+                logger.debug("Livre non trouvé dans cette librairie", extra={"librairie_id": librairie_id, "livre_id": livre_id})
+            
+            self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        self.cache.invalider(librairie_id)
+    
+    @mesure_db
+    def supprimer_titre_de_librairie(self, librairie_id, titre):
+        """Retirer un livre d'une librairie à partir de son titre (casse ignorée)
         
-        cursor.execute(
-            "DELETE FROM librairie_livres WHERE librairie_id = %s AND livre_id = %s",
-            (librairie_id, livre_id)
-        )
+        Renvoie True si le livre a été retiré, False s'il n'était pas dans la librairie.
+        """
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare("""
+                DELETE FROM librairie_livres ll
+                USING livres l
+                WHERE ll.livre_id = l.id
+                  AND ll.librairie_id = %s
+                  AND lower(l.titre) = lower(%s)
+            """, (librairie_id, titre))
+            supprime = cursor.rowcount > 0
+            if supprime:
+                self._signaler_modification(cursor, librairie_id)
+            cursor.close()
         
-        if cursor.rowcount > 0:
-            print("Livre supprimé de la librairie avec succès.")
-        else:
-            print("Livre non trouvé dans cette librairie.")
+        if supprime:
+            self.cache.invalider(librairie_id)
+            logger.debug("Livre supprimé de la librairie", extra={"librairie_id": librairie_id, "titre": titre})
+        return supprime
+    
+    @mesure_db
+    def appliquer_operations(self, librairie_id, operations):
+        """Appliquer une suite d'ajouts et de retraits de livres en une seule transaction
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        `operations` est une liste de dictionnaires {"op": "add" ou "remove", "titre"
+        (ou "nomLivre"), "auteur", "isbn", "annee_publication"}, appliqués dans l'ordre.
+        Renvoie le résultat de chacune : "ajoute", "deja_present", "supprime",
+        "absent", "invalide" ou "rejete" (ISBN déjà porté par un autre livre : le
+        titre reste dans l'état où l'avaient laissé les opérations précédentes).
+        Comme pour l'import, un livre déjà au catalogue garde ses informations ; un
+        livre créé par un ajout reste au catalogue même s'il est retiré ensuite.
+        """
+        resultats = [None] * len(operations)
+        valides = []
+        for position, operation in enumerate(operations):
+            ligne = normaliser_livre(operation)
+            if ligne is None or operation.get("op") not in ("add", "remove"):
+                resultats[position] = "invalide"
+            else:
+                valides.append((position, operation["op"] == "add", ligne))
+        if not valides:
+            return resultats
+        
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            # Les lots d'une même librairie s'appliquent l'un après l'autre
+            cursor.execute("SELECT 1 FROM librairies WHERE id = %s FOR UPDATE", (librairie_id,))
+            # Clé de chaque titre (lower de PostgreSQL, comme l'index unique), présence
+            # initiale dans la librairie et existence du livre au catalogue
+            cursor.execute("""
+                SELECT lower(e.titre), ll.livre_id IS NOT NULL, l.id IS NOT NULL
+                FROM unnest(%s::text[]) WITH ORDINALITY AS e(titre, rang)
+                LEFT JOIN livres l ON lower(l.titre) = lower(e.titre)
+                LEFT JOIN librairie_livres ll ON ll.livre_id = l.id AND ll.librairie_id = %s
+                ORDER BY e.rang
+            """, ([ligne[0] for _, _, ligne in valides], librairie_id))
+            lignes = cursor.fetchall()
+            
+            # Les livres ajoutés absents du catalogue sont d'abord créés (avec la ligne du
+            # premier ajout) : un titre qui n'a pas pu l'être (ISBN déjà porté par un autre
+            # livre) voit tous ses ajouts rejetés, sans effet sur son état dans le lot
+            a_creer = {}
+            for (_, ajout, ligne), (cle, _, existe) in zip(valides, lignes):
+                if ajout and not existe:
+                    a_creer.setdefault(cle, ligne)
+            rejetes = self._creer_livres(cursor, list(a_creer.values())) if a_creer else set()
+            
+            # Les opérations sont rejouées en mémoire dans l'ordre ; seul l'état final
+            # de chaque titre est ensuite écrit, en quelques requêtes ensemblistes
+            initial = {cle: present for cle, present, _ in lignes}
+            etat = dict(initial)
+            for (position, ajout, _), (cle, _, _) in zip(valides, lignes):
+                if ajout and cle in rejetes:
+                    resultats[position] = "rejete"
+                    continue
+                if ajout:
+                    resultats[position] = "deja_present" if etat[cle] else "ajoute"
+                else:
+                    resultats[position] = "supprime" if etat[cle] else "absent"
+                etat[cle] = ajout
+            ajouts = [cle for cle, present in etat.items() if present and not initial[cle]]
+            retraits = [cle for cle, present in etat.items() if initial[cle] and not present]
+            
+            lies = self._lier_titres(cursor, librairie_id, ajouts) if ajouts else 0
+            if retraits:
+                cursor.execute("""
+                    DELETE FROM librairie_livres ll
+                    USING livres l
+                    WHERE ll.livre_id = l.id
+                      AND ll.librairie_id = %s
+                      AND lower(l.titre) = ANY(%s)
+                """, (librairie_id, retraits))
+            modifie = lies > 0 or bool(retraits)
+            if modifie:
+                self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        
+        if modifie:
+            self.cache.invalider(librairie_id)
+        logger.debug("Lot appliqué", extra={"librairie_id": librairie_id, "ajouts": lies, "retraits": len(retraits)})
+        return resultats
+    
+    @mesure_db
+    def remplacer_livres(self, librairie_id, titres):
+        """Remplacer les livres d'une librairie par `titres`, en une seule transaction
+        
+        Seuls les liens qui changent sont écrits : retrait des livres absents de la
+        liste, puis ajout des nouveaux. Renvoie le nombre d'ajouts, de retraits et
+        de titres rejetés (invalides ou ISBN en conflit).
+        """
+        lignes = [normaliser_livre({"titre": titre}) for titre in titres]
+        valides = [ligne for ligne in lignes if ligne is not None]
+        
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM librairies WHERE id = %s FOR UPDATE", (librairie_id,))
+            cursor.execute("""
+                DELETE FROM librairie_livres ll
+                USING livres l
+                WHERE ll.livre_id = l.id
+                  AND ll.librairie_id = %s
+                  AND lower(l.titre) <> ALL (SELECT lower(t) FROM unnest(%s::text[]) AS t)
+            """, (librairie_id, [ligne[0] for ligne in valides]))
+            retraits = cursor.rowcount
+            lies, rejetes = self._lier_livres(cursor, librairie_id, valides) if valides else (0, set())
+            if lies or retraits:
+                self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        
+        if lies or retraits:
+            self.cache.invalider(librairie_id)
+        return {"ajouts": lies, "retraits": retraits, "rejetes": len(lignes) - len(valides) + len(rejetes)}
+    
+    def _lier_livres(self, cursor, librairie_id, lignes):
+        """Créer les livres manquants et les lier à la librairie (lignes de normaliser_livre)
+        
+        Renvoie le nombre de liens créés et les clés (lower(titre)) des titres qui
+        n'ont pas pu être créés à cause d'un ISBN déjà utilisé.
+        """
+        rejetes = self._creer_livres(cursor, lignes)
+        return self._lier_titres(cursor, librairie_id, [ligne[0] for ligne in lignes]), rejetes
+    
+    def _creer_livres(self, cursor, lignes):
+        """Créer les livres absents du catalogue (lignes de normaliser_livre)
+        
+        Renvoie les clés (lower(titre)) des titres qui n'ont pas pu être créés à
+        cause d'un ISBN déjà utilisé.
+        """
+        titres, auteurs, isbns, annees = (list(colonne) for colonne in zip(*lignes))
+        cursor.execute("""
+            INSERT INTO livres (titre, auteur, isbn, annee_publication)
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::int[])
+            ON CONFLICT DO NOTHING
+        """, (titres, auteurs, isbns, annees))
+        cursor.execute("""
+            SELECT lower(e.titre)
+            FROM unnest(%s::text[]) AS e(titre)
+            WHERE NOT EXISTS (SELECT 1 FROM livres l WHERE lower(l.titre) = lower(e.titre))
+        """, (titres,))
+        return {ligne[0] for ligne in cursor.fetchall()}
+    
+    def _lier_titres(self, cursor, librairie_id, titres):
+        """Lier à la librairie les livres existants de ces titres (casse ignorée), nombre de liens créés"""
+        cursor.execute("""
+            INSERT INTO librairie_livres (librairie_id, livre_id)
+            SELECT %s, l.id
+            FROM unnest(%s::text[]) AS e(titre)
+            JOIN livres l ON lower(l.titre) = lower(e.titre)
+            ON CONFLICT DO NOTHING
+        """, (librairie_id, titres))
+        return cursor.rowcount
+    
+    @mesure_db
+    def vider_librairie(self, librairie_id):
+        """Retirer tous les livres d'une librairie"""
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM librairie_livres WHERE librairie_id = %s", (librairie_id,))
+            self._signaler_modification(cursor, librairie_id)
+            cursor.close()
+        self.cache.invalider(librairie_id)
     
     def obtenir_librairie(self, librairie_id):
-        """Obtenir les informations d'une librairie par son ID"""
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
+        """Obtenir les informations d'une librairie par son ID (valeur en cache, à ne pas modifier)"""
+        return self.cache.obtenir((librairie_id, "librairie"), lambda: self._lire_librairie(librairie_id))
+    
+    @mesure_db
+    def _lire_librairie(self, librairie_id):
+        with self.connexion_lecture(librairie_id) as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare(
+                "SELECT id, nom, adresse, modifiee_le FROM librairies WHERE id = %s",
+                (librairie_id,)
+            )
+            librairie = cursor.fetchone()
+            cursor.close()
+        
+        if librairie:
+            return {
+                "id": librairie[0],
+                "nom": librairie[1],
+                "adresse": librairie[2],
+                "modifiee_le": librairie[3]
+            }
+        return None
+    
+    def date_modification(self, portee):
+        """Date de dernière modification d'une librairie, ou de la plus récente (PORTEE_TOUTES)
+        
+        Tenue à jour par les triggers de la migration 6 ; None si la librairie n'existe pas.
+        Valeur en cache, invalidée avec la librairie.
+        """
+        if portee != PORTEE_TOUTES:
+            librairie = self.obtenir_librairie(portee)
+            return librairie["modifiee_le"] if librairie else None
+        return self.cache.obtenir((PORTEE_TOUTES, "modifiee_le"), self._lire_date_modification)
+    
+    @mesure_db
+    def _lire_date_modification(self):
+        with self.connexion_lecture(PORTEE_TOUTES) as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare("SELECT max(modifiee_le) FROM librairies")
+            date = cursor.fetchone()[0]
+            cursor.close()
+        return date
+    
+    def lister_librairies(self, limite=None, apres=None):
+        """Lister les librairies avec leur nombre de livres, triées par (nom, id)
         
-        cursor.execute(
-            "SELECT id, nom, adresse FROM librairies WHERE id = %s",
-            (librairie_id,)
+        `apres` est le couple (nom, id) de la dernière librairie de la page précédente.
+        Renvoie la page et le couple de la page suivante (None s'il n'y en a plus) ;
+        le résultat, en cache jusqu'à la modification d'une librairie, ne doit pas être modifié.
+        """
+        return self.cache.obtenir(
+            (PORTEE_TOUTES, "librairies", limite, apres),
+            lambda: self._lire_librairies(limite, apres)
         )
-        librairie = cursor.fetchone()
+    
+    @mesure_db
+    def _lire_librairies(self, limite, apres):
+        condition = sql.SQL("WHERE (nom, id) > (%s, %s)") if apres else sql.SQL("")
+        params = (list(apres) if apres else []) + [limite]
         
-        cursor.close()
-        conn.close()
+        with self.connexion_lecture(PORTEE_TOUTES) as conn:
+            cursor = conn.cursor()
+            # La page est choisie d'abord, puis ses livres comptés en un seul GROUP BY
+            # (parcours de la clé primaire de librairie_livres, sans lire les livres)
+            cursor.execute(sql.SQL("""
+                WITH page AS (
+                    SELECT id, nom, adresse
+                    FROM librairies
+                    {condition}
+                    ORDER BY nom, id
+                    LIMIT %s
+                )
+                SELECT p.id, p.nom, p.adresse, count(ll.livre_id)
+                FROM page p
+                LEFT JOIN librairie_livres ll ON ll.librairie_id = p.id
+                GROUP BY p.id, p.nom, p.adresse
+                ORDER BY p.nom, p.id
+            """).format(condition=condition), params)
+            lignes = cursor.fetchall()
+            cursor.close()
+        
+        librairies = [
+            {"id": ligne[0], "nom": ligne[1], "adresse": ligne[2], "nombre_livres": ligne[3]}
+            for ligne in lignes
+        ]
+        suivant = None
+        if limite is not None and len(lignes) == limite:
+            suivant = (lignes[-1][1], lignes[-1][0])
+        return librairies, suivant
+    
+    @mesure_db
+    def obtenir_librairie_par_nom(self, nom):
+        """Obtenir les informations de la première librairie portant ce nom"""
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, nom, adresse FROM librairies WHERE nom = %s ORDER BY id LIMIT 1",
+                (nom,)
+            )
+            librairie = cursor.fetchone()
+            cursor.close()
         
         if librairie:
             return {
@@ -199,67 +786,346 @@ class LibrairieDB:
             }
         return None
     
-    def obtenir_livres_de_librairie(self, librairie_id):
+    @mesure_db
+    def obtenir_ou_creer_librairie(self, nom, adresse):
+        """Obtenir la librairie portant ce nom, en la créant si elle n'existe pas
+        
+        Renvoie les informations de la librairie et True si elle vient d'être créée.
+        Une simple lecture suffit quand elle existe déjà.
+        """
+        librairie = self.obtenir_librairie_par_nom(nom)
+        if librairie:
+            return librairie, False
+        
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            # Verrou de transaction par nom : deux workers qui démarrent ensemble
+            # ne créent pas chacun leur librairie
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"librairie:{nom}",))
+            cursor.execute("SELECT id FROM librairies WHERE nom = %s ORDER BY id LIMIT 1", (nom,))
+            existante = cursor.fetchone()
+            if existante:
+                librairie_id, creee = existante[0], False
+            else:
+                cursor.execute(
+                    "INSERT INTO librairies (nom, adresse) VALUES (%s, %s) RETURNING id",
+                    (nom, adresse)
+                )
+                librairie_id, creee = cursor.fetchone()[0], True
+            cursor.close()
+        
+        if creee:
+            logger.info("Librairie ajoutée", extra={"nom": nom, "librairie_id": librairie_id})
+        return self.obtenir_librairie_par_nom(nom), creee
+    
+    def obtenir_livres_de_librairie(self, librairie_id, champs=None):
         """Obtenir tous les livres d'une librairie"""
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
+        livres, _ = self.obtenir_page_livres_de_librairie(librairie_id, champs=champs)
+        return livres
+    
+    def obtenir_page_livres_de_librairie(self, librairie_id, limite=None, apres=None, champs=None):
+        """Obtenir une page de livres d'une librairie, triée par (titre, id)
         
-        cursor.execute("""
-            SELECT l.id, l.titre, l.auteur, l.isbn, l.annee_publication
-            FROM livres l
-            JOIN librairie_livres ll ON l.id = ll.livre_id
-            WHERE ll.librairie_id = %s
-            ORDER BY l.titre
-        """, (librairie_id,))
-        
-        livres = []
-        for livre in cursor.fetchall():
-            livres.append({
-                "id": livre[0],
-                "titre": livre[1],
-                "auteur": livre[2],
-                "isbn": livre[3],
-                "annee_publication": livre[4]
-            })
+        `apres` est le couple (titre, id) du dernier livre de la page précédente et
+        `champs` restreint les colonnes lues. Renvoie la page et le couple à passer
+        en `apres` pour la page suivante (None s'il n'y en a plus). Le résultat
+        est mis en cache et ne doit pas être modifié.
+        """
+        champs = valider_champs(champs)
+        return self.cache.obtenir(
+            (librairie_id, "livres", champs, limite, apres),
+            lambda: self._lire_page_livres(librairie_id, limite, apres, champs)
+        )
+    
+    @mesure_db
+    def _lire_page_livres(self, librairie_id, limite, apres, champs):
+        """Lire une page de livres en base (sans passer par le cache)"""
+        # titre et id sont toujours lus en fin de ligne : ils forment le curseur
+        colonnes = sql.SQL(", ").join(
+            sql.SQL("l.{}").format(sql.Identifier(champ)) for champ in champs + ("titre", "id")
+        )
+        condition = sql.SQL("AND (l.titre, l.id) > (%s, %s)") if apres else sql.SQL("")
+        params = [librairie_id] + (list(apres) if apres else []) + [limite]
         
-        cursor.close()
-        conn.close()
+        with self.connexion_lecture(librairie_id) as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare(sql.SQL("""
+                SELECT {colonnes}
+                FROM livres l
+                JOIN librairie_livres ll ON l.id = ll.livre_id
+                WHERE ll.librairie_id = %s {condition}
+                ORDER BY l.titre, l.id
+                LIMIT %s
+            """).format(colonnes=colonnes, condition=condition), params)
+            lignes = cursor.fetchall()
+            cursor.close()
+        
+        livres = _livres_depuis_lignes((ligne[:-2] for ligne in lignes), champs)
+        suivant = None
+        if limite is not None and len(lignes) == limite:
+            suivant = tuple(lignes[-1][-2:])
+        return livres, suivant
+    
+    @mesure_db
+    def lire_page_livres_json(self, librairie_id, limite=None, apres=None, champs=None, titres_seuls=False):
+        """Lire une page de livres déjà sérialisée en JSON par PostgreSQL
+        
+        Même tri, même curseur et même projection que obtenir_page_livres_de_librairie,
+        sans tuple ni dictionnaire par livre côté Python : le corps est renvoyé tel
+        quel (texte JSON), avec le couple `apres` de la page suivante. `titres_seuls`
+        donne une liste de titres plutôt que d'objets. Le texte est compact et les clés
+        triées, comme celui de jsonify, à ceci près que les caractères non ASCII ne sont
+        pas échappés. Pas de cache ici : le corps est destiné au cache des réponses HTTP.
+        """
+        champs = valider_champs(champs)
+        # row_to_json (compact, contrairement à json_agg et json_build_object) reprend les
+        # colonnes dans l'ordre : avec titre et id, celles de la page sont exactement les
+        # champs triés ; sinon titre et id sont lus en plus pour le curseur et chaque
+        # livre est construit à partir des seuls champs demandés
+        complets = {"titre", "id"} <= set(champs)
+        if titres_seuls:
+            element = sql.SQL("to_json(p.titre)::text")
+        elif complets:
+            element = sql.SQL("row_to_json(p)::text")
+        else:
+            element = sql.SQL("(SELECT row_to_json(c) FROM (SELECT {}) c)::text").format(sql.SQL(", ").join(
+                sql.SQL("p.{}").format(sql.Identifier(champ)) for champ in sorted(champs)
+            ))
+        champs = tuple(sorted(champs)) if complets else tuple(dict.fromkeys(champs + ("titre", "id")))
+        colonnes = sql.SQL(", ").join(sql.SQL("l.{}").format(sql.Identifier(champ)) for champ in champs)
+        condition = sql.SQL("AND (l.titre, l.id) > (%s, %s)") if apres else sql.SQL("")
+        params = [librairie_id] + (list(apres) if apres else []) + [limite]
+        
+        with self.connexion_lecture(librairie_id) as conn:
+            cursor = conn.cursor()
+            # L'ordre de la sous-requête n'est pas garanti aux agrégats : chacun trie la page
+            cursor.executer_prepare(sql.SQL("""
+                SELECT '[' || coalesce(string_agg({element}, ',' ORDER BY p.titre, p.id), '') || ']',
+                       count(*),
+                       (array_agg(p.titre ORDER BY p.titre, p.id))[count(*)],
+                       (array_agg(p.id ORDER BY p.titre, p.id))[count(*)]
+                FROM (
+                    SELECT {colonnes}
+                    FROM livres l
+                    JOIN librairie_livres ll ON l.id = ll.livre_id
+                    WHERE ll.librairie_id = %s {condition}
+                    ORDER BY l.titre, l.id
+                    LIMIT %s
+                ) p
+            """).format(colonnes=colonnes, condition=condition, element=element), params)
+            corps, nombre, dernier_titre, dernier_id = cursor.fetchone()
+            cursor.close()
+        
+        suivant = None
+        if limite is not None and nombre == limite:
+            suivant = (dernier_titre, dernier_id)
+        return corps, suivant
+    
+    @mesure_db
+    def parcourir_livres_de_librairie(self, librairie_id, champs=None, taille_lot=2000):
+        """Parcourir tous les livres d'une librairie par lots, via un curseur côté serveur
+        
+        Générateur de listes de tuples (dans l'ordre de `champs`) : la mémoire utilisée
+        ne dépend que de `taille_lot`, quelle que soit la taille de la librairie.
+        """
+        champs = valider_champs(champs)
+        colonnes = sql.SQL(", ").join(sql.SQL("l.{}").format(sql.Identifier(champ)) for champ in champs)
+        
+        with self.connexion_lecture(librairie_id) as conn:
+            # Curseur nommé : PostgreSQL ne renvoie les lignes qu'au fur et à mesure
+            cursor = conn.cursor(name="export_livres")
+            cursor.itersize = taille_lot
+            try:
+                cursor.execute(sql.SQL("""
+                    SELECT {colonnes}
+                    FROM livres l
+                    JOIN librairie_livres ll ON l.id = ll.livre_id
+                    WHERE ll.librairie_id = %s
+                    ORDER BY l.titre, l.id
+                """).format(colonnes=colonnes), (librairie_id,))
+                while True:
+                    lignes = cursor.fetchmany(taille_lot)
+                    if not lignes:
+                        break
+                    yield lignes
+            finally:
+                cursor.close()
+    
+    @mesure_db
+    def rechercher_livres(self, terme_recherche, limite=None, librairie_id=None):
+        """Rechercher des livres par titre ou auteur (sous-chaîne, casse et accents ignorés)
+        
+        Tout le catalogue, ou les seuls livres de `librairie_id`.
+        """
+        with self.connexion_lecture(librairie_id) as conn:
+            cursor = conn.cursor()
+            
+            terme = "%{}%".format(echapper_like(terme_recherche))
+            filtre, params_filtre = _filtre_librairie(librairie_id, "%s")
+            if self.recherche_indexee:
+                # Servi par les index trigrammes sur livres_sans_accent(titre/auteur)
+                cursor.executer_prepare(sql.SQL("""
+                    SELECT id, titre, auteur, isbn, annee_publication
+                    FROM livres
+                    WHERE (livres_sans_accent(titre) LIKE livres_sans_accent(%s)
+                       OR livres_sans_accent(auteur) LIKE livres_sans_accent(%s)) {filtre}
+                    ORDER BY titre
+                    LIMIT %s
+                """).format(filtre=filtre), (terme, terme, *params_filtre, limite))
+            else:
+                cursor.executer_prepare(sql.SQL("""
+                    SELECT id, titre, auteur, isbn, annee_publication
+                    FROM livres
+                    WHERE (titre ILIKE %s OR auteur ILIKE %s) {filtre}
+                    ORDER BY titre
+                    LIMIT %s
+                """).format(filtre=filtre), (terme, terme, *params_filtre, limite))
+            
+            livres = _livres_depuis_lignes(cursor.fetchall())
+            cursor.close()
         
         return livres
     
-    def rechercher_livres(self, terme_recherche):
-        """Rechercher des livres par titre ou auteur"""
-        conn = psycopg2.connect(**self.db_params)
-        cursor = conn.cursor()
+    @mesure_db
+    def rechercher_livres_par_pertinence(self, terme_recherche, limite=20, librairie_id=None):
+        """Rechercher des livres par mots (préfixes acceptés), classés par pertinence
         
-        terme = f"%{terme_recherche}%"
-        cursor.execute("""
-            SELECT id, titre, auteur, isbn, annee_publication
-            FROM livres
-            WHERE titre ILIKE %s OR auteur ILIKE %s
-            ORDER BY titre
-        """, (terme, terme))
-        
-        livres = []
-        for livre in cursor.fetchall():
-            livres.append({
-                "id": livre[0],
-                "titre": livre[1],
-                "auteur": livre[2],
-                "isbn": livre[3],
-                "annee_publication": livre[4]
-            })
+        Le titre pèse plus que l'auteur ; les fautes de frappe sont rattrapées par
+        similarité de trigrammes. Tout le catalogue, ou les seuls livres de `librairie_id`.
+        """
+        mots = re.findall(r"\w+", terme_recherche)
+        if not mots:
+            return []
+        if not self.recherche_indexee:
+            return self.rechercher_livres(terme_recherche, limite, librairie_id)
         
-        cursor.close()
-        conn.close()
+        # "les miser" -> "les:* & miser:*" (recherche par préfixe de chaque mot)
+        requete = " & ".join(f"{mot}:*" for mot in mots)
+        filtre, _ = _filtre_librairie(librairie_id, "%(librairie_id)s", alias="l")
+        with self.connexion_lecture(librairie_id) as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare(sql.SQL("""
+                SELECT l.id, l.titre, l.auteur, l.isbn, l.annee_publication
+                FROM livres l,
+                     to_tsquery('french', livres_sans_accent(%(requete)s)) AS q,
+                     livres_sans_accent(%(terme)s) AS t
+                WHERE (l.recherche @@ q
+                   OR t <%% livres_sans_accent(l.titre)
+                   OR t <%% livres_sans_accent(l.auteur)) {filtre}
+                ORDER BY ts_rank_cd(l.recherche, q) DESC,
+                         word_similarity(t, livres_sans_accent(l.titre)) DESC,
+                         l.titre
+                LIMIT %(limite)s
+            """).format(filtre=filtre), {
+                "requete": requete, "terme": terme_recherche, "limite": limite, "librairie_id": librairie_id,
+            })
+            
+            livres = _livres_depuis_lignes(cursor.fetchall())
+            cursor.close()
         
         return livres
+    
+    @mesure_db
+    def actualiser_statistiques(self, forcer=False):
+        """Rafraîchir les vues des statistiques si le catalogue a changé depuis leur calcul
+        
+        REFRESH MATERIALIZED VIEW CONCURRENTLY : les lectures de /stats ne sont jamais
+        bloquées. Un seul rafraîchissement à la fois, tous pods confondus ; les autres
+        n'attendent pas. Renvoie vrai si les vues ont été rafraîchies.
+        """
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (CLE_VERROU_STATISTIQUES,))
+            if not cursor.fetchone()[0]:
+                cursor.close()
+                return False
+            if not forcer:
+                # Liens ajoutés ou retirés, livres modifiés (triggers de la migration 6), nouveaux livres
+                cursor.execute("""
+                    SELECT (SELECT max(modifiee_le) FROM librairies) IS DISTINCT FROM s.librairies_modifiees_le
+                        OR (SELECT count(*) FROM librairies) <> s.librairies
+                        OR (SELECT max(id) FROM livres) IS DISTINCT FROM s.dernier_livre_id
+                    FROM stats_catalogue s
+                """)
+                ligne = cursor.fetchone()
+                if ligne is not None and not ligne[0]:
+                    cursor.close()
+                    return False
+            for vue in VUES_STATISTIQUES:
+                cursor.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(sql.Identifier(vue)))
+            cursor.close()
+        return True
+    
+    @mesure_db
+    def lire_statistiques(self):
+        """Totaux du catalogue et date de leur calcul (actualise_le), lus dans stats_catalogue"""
+        champs = ("actualise_le", "livres", "librairies", "liens", "auteurs", "livres_sans_auteur", "livres_sans_annee")
+        with self.connexion_lecture(PORTEE_TOUTES) as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare("SELECT {} FROM stats_catalogue".format(", ".join(champs)))
+            ligne = cursor.fetchone()
+            cursor.close()
+        return dict(zip(champs, ligne)) if ligne else None
+    
+    @mesure_db
+    def lire_classement_statistiques(self, dimension, limite):
+        """Nombre de livres par librairie, par auteur (classés par nombre décroissant) ou par année (récentes d'abord)"""
+        requete, champs = CLASSEMENTS_STATISTIQUES[dimension]
+        with self.connexion_lecture(PORTEE_TOUTES) as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare(requete, (limite,))
+            lignes = cursor.fetchall()
+            cursor.close()
+        return [dict(zip(champs, ligne)) for ligne in lignes]
+    
+    @mesure_db
+    def verifier_connexion(self):
+        """Vérifier qu'une connexion du pool répond et renvoyer l'état du pool (et des réplicas)"""
+        with self.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+        if self.lectures is not None:
+            return {**self.pool.stats(), "repliques": self.lectures.stats()}
+        return self.pool.stats()
+
+
+def echapper_like(terme):
+    """Échapper les caractères spéciaux de LIKE pour une recherche littérale"""
+    return terme.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _filtre_librairie(librairie_id, parametre, alias="livres"):
+    """Condition SQL restreignant une recherche aux livres d'une librairie, et ses paramètres"""
+    if librairie_id is None:
+        return sql.SQL(""), ()
+    return sql.SQL(
+        "AND EXISTS (SELECT 1 FROM librairie_livres ll WHERE ll.livre_id = {alias}.id AND ll.librairie_id = {parametre})"
+    ).format(alias=sql.Identifier(alias), parametre=sql.SQL(parametre)), (librairie_id,)
+
+
+def valider_champs(champs):
+    """Vérifier une projection de champs de livre (tous les champs si None)"""
+    if not champs:
+        return CHAMPS_LIVRE
+    inconnus = [champ for champ in champs if champ not in CHAMPS_LIVRE]
+    if inconnus:
+        raise ValueError(f"Champs inconnus : {', '.join(inconnus)}")
+    return tuple(champs)
+
+
+def _livres_depuis_lignes(lignes, champs=None):
+    """Convertir les lignes lues (dans l'ordre de `champs`) en dictionnaires"""
+    champs = champs or CHAMPS_LIVRE
+    return [dict(zip(champs, livre)) for livre in lignes]
 
 
 # Adapter la classe Librairie pour utiliser la base de données
 class Librairie:
-    def __init__(self, nom, adresse, livres=None):
-        self.db = LibrairieDB()
+    def __init__(self, nom, adresse, livres=None, db=None):
+        # Réutiliser la base (et donc le pool) fournie plutôt que d'en recréer une
+        self.db = db if db is not None else LibrairieDB()
         self.set_nom(nom)
         self.set_adresse(adresse)
         self.id = self.db.ajouter_librairie(nom, adresse)
@@ -267,24 +1133,44 @@ class Librairie:
         if livres:
             self.set_livres(livres)
     
+    @classmethod
+    def charger(cls, db, librairie_id):
+        """Charger une librairie existante par son ID, sans aucune écriture (None si absente)"""
+        infos = db.obtenir_librairie(librairie_id)
+        if infos is None:
+            return None
+        return cls._depuis_infos(db, infos)
+    
+    @classmethod
+    def obtenir_ou_creer(cls, db, nom, adresse, livres=None):
+        """Charger la librairie de ce nom, ou la créer avec ses livres initiaux"""
+        infos, creee = db.obtenir_ou_creer_librairie(nom, adresse)
+        librairie = cls._depuis_infos(db, infos)
+        if creee and livres:
+            librairie.set_livres(livres)
+        return librairie
+    
+    @classmethod
+    def _depuis_infos(cls, db, infos):
+        # Construire l'objet sans passer par __init__, qui insère une nouvelle librairie
+        librairie = cls.__new__(cls)
+        librairie.db = db
+        librairie.id = infos["id"]
+        librairie.__nom = infos["nom"]
+        librairie.__adresse = infos["adresse"]
+        return librairie
+    
     def set_livres(self, livres):
         try:
             if isinstance(livres, list):
-                # Supprimer tous les livres existants et ajouter les nouveaux
-                conn = psycopg2.connect(**self.db.db_params)
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM librairie_livres WHERE librairie_id = %s", (self.id,))
-                conn.commit()
-                cursor.close()
-                conn.close()
-                
-                # Ajouter chaque livre
-                for livre in livres:
-                    self.add_livres(livre)
+                # Différence appliquée en une transaction : seuls les liens qui changent sont écrits
+                bilan = self.db.remplacer_livres(self.id, livres)
+                if bilan["rejetes"]:
+                    logger.warning("Livres rejetés", extra={"librairie_id": self.id, **bilan})
             else:
                 raise ValueError
         except ValueError:
-            print("Attention la liste est incorrecte")
+            logger.warning("La liste de livres est incorrecte")
     
     def set_nom(self, nom):
         try:
@@ -292,16 +1178,11 @@ class Librairie:
                 self.__nom = nom
                 # Mettre à jour dans la base de données si l'ID existe
                 if hasattr(self, 'id') and self.id:
-                    conn = psycopg2.connect(**self.db.db_params)
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE librairies SET nom = %s WHERE id = %s", (nom, self.id))
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
+                    self.db.modifier_librairie(self.id, nom=nom)
             else:
                 raise ValueError
         except ValueError:
-            print("Attention le nom est incorrect")
+            logger.warning("Le nom est incorrect")
     
     def set_adresse(self, adresse):
         try:
@@ -309,16 +1190,11 @@ class Librairie:
                 self.__adresse = adresse
                 # Mettre à jour dans la base de données si l'ID existe
                 if hasattr(self, 'id') and self.id:
-                    conn = psycopg2.connect(**self.db.db_params)
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE librairies SET adresse = %s WHERE id = %s", (adresse, self.id))
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
+                    self.db.modifier_librairie(self.id, adresse=adresse)
             else:
                 raise ValueError
         except ValueError:
-            print("Attention l'adresse est incorrecte")
+            logger.warning("L'adresse est incorrecte")
     
     def get_nom(self):
         return self.__nom
@@ -326,45 +1202,29 @@ class Librairie:
     def get_addresse(self):
         return self.__adresse
     
-    def get_livres(self):
-        return self.db.obtenir_livres_de_librairie(self.id)
+    def get_livres(self, champs=None):
+        return self.db.obtenir_livres_de_librairie(self.id, champs)
+    
+    def get_page_livres(self, limite, apres=None, champs=None):
+        return self.db.obtenir_page_livres_de_librairie(self.id, limite, apres, champs)
+    
+    def iter_livres(self, champs=None):
+        return self.db.parcourir_livres_de_librairie(self.id, champs)
     
     def add_livres(self, livre, auteur=None, isbn=None, annee_publication=None):
         try:
             if not isinstance(livre, str):
                 raise ValueError
         except ValueError:
-            print("Attention le livre donné est incorrect")
+            logger.warning("Le livre donné est incorrect")
             return
         
-        # Vérifier si le livre existe déjà dans la base de données
-        livres_trouves = self.db.rechercher_livres(livre)
-        livre_id = None
-        
-        # Si un livre avec ce titre exact existe, utiliser son ID
-        for l in livres_trouves:
-            if l["titre"].lower() == livre.lower():
-                livre_id = l["id"]
-                break
-        
-        # Si le livre n'existe pas, l'ajouter
-        if not livre_id:
-            livre_id = self.db.ajouter_livre(livre, auteur, isbn, annee_publication)
-        
-        # Ajouter le livre à la librairie
-        self.db.ajouter_livre_a_librairie(self.id, livre_id)
+        # Upsert du livre et ajout à la librairie dans la même transaction
+        self.db.ajouter_titre_a_librairie(self.id, livre, auteur, isbn, annee_publication)
     
     def del_livres(self, livre):
-        # Trouver l'ID du livre
-        livres_trouves = self.db.rechercher_livres(livre)
-        
-        for l in livres_trouves:
-            if l["titre"].lower() == livre.lower():
-                # Supprimer la relation entre le livre et la librairie
-                self.db.supprimer_livre_de_librairie(self.id, l["id"])
-                return
-        
-        print(f"Livre '{livre}' non trouvé dans la librairie")
+        if not self.db.supprimer_titre_de_librairie(self.id, livre):
+            logger.debug("Livre non trouvé dans la librairie", extra={"librairie_id": self.id, "titre": livre})
     
     def index(self, livre=None):
         return "Bienvenu sur le site de la librairie {0} !".format(self.__nom)
@@ -374,9 +1234,10 @@ class Librairie:
 if __name__ == "__main__":
     # Initialiser la base de données
     db = LibrairieDB()
+    db.migrer()
     
     # Créer une librairie
-    librairie = Librairie("Librairie du Centre", "123 Rue de la Paix, 75001 Paris", [])
+    librairie = Librairie("Librairie du Centre", "123 Rue de la Paix, 75001 Paris", [], db=db)
     
     # Ajouter des livres
     librairie.add_livres("L'Étranger", "Albert Camus", "978-2070360024", 1942)
@@ -0,0 +1,285 @@
+import asyncio
+import contextlib
+import logging
+import os
+import re
+
+import asyncpg
+from dotenv import load_dotenv
+
+from cache import CANAL_INVALIDATION
+from librairie import CHAMPS_LIVRE, echapper_like, valider_champs
+from metriques import POOL_EPUISE
+from pool import PoolEpuise
+
+# Charger les variables d'environnement depuis un fichier .env
+load_dotenv()
+
+logger = logging.getLogger("librairie.db")
+
+
+class LibrairieDBAsync:
+    """Accès asynchrone (asyncpg) à la base de la librairie, pour le mode de service async
+
+    Mêmes requêtes que LibrairieDB, avec son propre pool de connexions. Le schéma
+    est préparé par les migrations (voir migrations.py).
+    """
+
+    def __init__(self):
+        self.db_params = {
+            "host": os.getenv("DB_HOST", "localhost"),
+            "port": int(os.getenv("DB_PORT", "5432")),
+            "user": os.getenv("DB_USER", "postgres"),
+            "password": os.getenv("DB_PASSWORD", ""),
+            "database": os.getenv("DB_NAME", "librairie_db"),
+        }
+        self.delai_attente = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+        self.pool = None
+        self.recherche_indexee = False
+
+    async def ouvrir(self):
+        """Créer le pool de connexions (à appeler dans la boucle d'événements du worker)"""
+        self.pool = await asyncpg.create_pool(
+            **self.db_params,
+            min_size=int(os.getenv("DB_POOL_MIN", "1")),
+            max_size=int(os.getenv("DB_POOL_MAX", "10")),
+            timeout=self.delai_attente,
+        )
+        self.recherche_indexee = await self._fetchval(
+            "SELECT to_regclass('livres_recherche_idx') IS NOT NULL AND to_regclass('livres_titre_trgm_idx') IS NOT NULL"
+        )
+
+    async def fermer(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    @contextlib.asynccontextmanager
+    async def connexion(self):
+        """Emprunter une connexion, en attendant au plus `delai_attente` secondes (PoolEpuise sinon)
+
+        Le `timeout` de create_pool ne borne que l'ouverture d'une connexion : sans
+        celui d'acquire, une requête attendrait indéfiniment une place dans un pool plein.
+        """
+        try:
+            conn = await self.pool.acquire(timeout=self.delai_attente)
+        except asyncio.TimeoutError:
+            POOL_EPUISE.inc()
+            raise PoolEpuise(
+                f"Aucune connexion disponible après {self.delai_attente} s "
+                f"({self.pool.get_size()}/{self.pool.get_max_size()} connexions ouvertes)"
+            ) from None
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def _fetch(self, requete, *args):
+        async with self.connexion() as conn:
+            return await conn.fetch(requete, *args)
+
+    async def _fetchrow(self, requete, *args):
+        async with self.connexion() as conn:
+            return await conn.fetchrow(requete, *args)
+
+    async def _fetchval(self, requete, *args):
+        async with self.connexion() as conn:
+            return await conn.fetchval(requete, *args)
+
+    async def obtenir_ou_creer_librairie(self, nom, adresse):
+        """Obtenir la librairie portant ce nom, en la créant si elle n'existe pas"""
+        requete = "SELECT id, nom, adresse FROM librairies WHERE nom = $1 ORDER BY id LIMIT 1"
+        librairie = await self._fetchrow(requete, nom)
+        if librairie is None:
+            async with self.connexion() as conn:
+                async with conn.transaction():
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", f"librairie:{nom}")
+                    librairie = await conn.fetchrow(requete, nom)
+                    if librairie is None:
+                        librairie = await conn.fetchrow(
+                            "INSERT INTO librairies (nom, adresse) VALUES ($1, $2) RETURNING id, nom, adresse",
+                            nom, adresse
+                        )
+                        logger.info("Librairie ajoutée", extra={"nom": nom, "librairie_id": librairie["id"]})
+                        return dict(librairie), True
+        return dict(librairie), False
+
+    async def ajouter_librairie(self, nom, adresse):
+        """Ajouter une nouvelle librairie et renvoyer ses informations"""
+        librairie = await self._fetchrow(
+            "INSERT INTO librairies (nom, adresse) VALUES ($1, $2) RETURNING id, nom, adresse", nom, adresse
+        )
+        logger.info("Librairie ajoutée", extra={"nom": nom, "librairie_id": librairie["id"]})
+        return dict(librairie)
+
+    async def obtenir_librairie(self, librairie_id):
+        """Obtenir les informations d'une librairie par son ID (None si absente)"""
+        librairie = await self._fetchrow("SELECT id, nom, adresse FROM librairies WHERE id = $1", librairie_id)
+        return dict(librairie) if librairie is not None else None
+
+    async def lister_librairies(self, limite=None, apres=None):
+        """Lister les librairies avec leur nombre de livres, triées par (nom, id)
+
+        Même contrat que LibrairieDB.lister_librairies.
+        """
+        params = []
+        condition = ""
+        if apres:
+            condition = "WHERE (nom, id) > ($1, $2)"
+            params += list(apres)
+        params.append(limite)
+
+        lignes = await self._fetch(f"""
+            WITH page AS (
+                SELECT id, nom, adresse
+                FROM librairies
+                {condition}
+                ORDER BY nom, id
+                LIMIT ${len(params)}
+            )
+            SELECT p.id, p.nom, p.adresse, count(ll.livre_id) AS nombre_livres
+            FROM page p
+            LEFT JOIN librairie_livres ll ON ll.librairie_id = p.id
+            GROUP BY p.id, p.nom, p.adresse
+            ORDER BY p.nom, p.id
+        """, *params)
+
+        suivant = None
+        if limite is not None and len(lignes) == limite:
+            suivant = (lignes[-1]["nom"], lignes[-1]["id"])
+        return [dict(ligne) for ligne in lignes], suivant
+
+    async def obtenir_page_livres_de_librairie(self, librairie_id, limite=None, apres=None, champs=None):
+        """Obtenir une page de livres d'une librairie, triée par (titre, id)
+
+        Même contrat que LibrairieDB.obtenir_page_livres_de_librairie.
+        """
+        champs = valider_champs(champs)
+        # Les noms de colonnes viennent de CHAMPS_LIVRE (vérifiés ci-dessus)
+        colonnes = ", ".join(f"l.{champ}" for champ in champs + ("titre", "id"))
+        params = [librairie_id]
+        condition = ""
+        if apres:
+            condition = "AND (l.titre, l.id) > ($2, $3)"
+            params += list(apres)
+        params.append(limite)
+
+        lignes = await self._fetch(f"""
+            SELECT {colonnes}
+            FROM livres l
+            JOIN librairie_livres ll ON l.id = ll.livre_id
+            WHERE ll.librairie_id = $1 {condition}
+            ORDER BY l.titre, l.id
+            LIMIT ${len(params)}
+        """, *params)
+
+        livres = [dict(zip(champs, ligne[:-2])) for ligne in lignes]
+        suivant = None
+        if limite is not None and len(lignes) == limite:
+            suivant = (lignes[-1][-2], lignes[-1][-1])
+        return livres, suivant
+
+    async def ajouter_titre_a_librairie(self, librairie_id, titre, auteur=None, isbn=None, annee_publication=None):
+        """Créer le livre si besoin et le lier à la librairie en une seule requête"""
+        async with self.connexion() as conn:
+            async with conn.transaction():
+                statut = await conn.execute("""
+                    WITH livre AS (
+                        INSERT INTO livres (titre, auteur, isbn, annee_publication)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (lower(titre)) DO UPDATE SET
+                            auteur = COALESCE(livres.auteur, EXCLUDED.auteur),
+                            isbn = COALESCE(livres.isbn, EXCLUDED.isbn),
+                            annee_publication = COALESCE(livres.annee_publication, EXCLUDED.annee_publication)
+                        RETURNING id
+                    )
+                    INSERT INTO librairie_livres (librairie_id, livre_id)
+                    SELECT $5, id FROM livre
+                    ON CONFLICT DO NOTHING
+                """, titre, auteur, isbn, annee_publication, librairie_id)
+                ajoute = statut != "INSERT 0 0"
+                if ajoute:
+                    # Les workers synchrones invalident leur cache sur cette notification
+                    await conn.execute("SELECT pg_notify($1, $2)", CANAL_INVALIDATION, str(librairie_id))
+        return ajoute
+
+    async def supprimer_titre_de_librairie(self, librairie_id, titre):
+        """Retirer un livre d'une librairie à partir de son titre (casse ignorée)"""
+        async with self.connexion() as conn:
+            async with conn.transaction():
+                statut = await conn.execute("""
+                    DELETE FROM librairie_livres ll
+                    USING livres l
+                    WHERE ll.livre_id = l.id
+                      AND ll.librairie_id = $1
+                      AND lower(l.titre) = lower($2)
+                """, librairie_id, titre)
+                supprime = statut != "DELETE 0"
+                if supprime:
+                    await conn.execute("SELECT pg_notify($1, $2)", CANAL_INVALIDATION, str(librairie_id))
+        return supprime
+
+    async def rechercher_livres(self, terme_recherche, limite=None, librairie_id=None):
+        """Rechercher des livres par titre ou auteur (sous-chaîne, casse et accents ignorés)"""
+        terme = "%{}%".format(echapper_like(terme_recherche))
+        filtre = _filtre_librairie(librairie_id, "livres", "$3")
+        if self.recherche_indexee:
+            lignes = await self._fetch(f"""
+                SELECT id, titre, auteur, isbn, annee_publication
+                FROM livres
+                WHERE (livres_sans_accent(titre) LIKE livres_sans_accent($1)
+                   OR livres_sans_accent(auteur) LIKE livres_sans_accent($1)) {filtre}
+                ORDER BY titre
+                LIMIT $2
+            """, terme, limite, *([librairie_id] if filtre else []))
+        else:
+            lignes = await self._fetch(f"""
+                SELECT id, titre, auteur, isbn, annee_publication
+                FROM livres
+                WHERE (titre ILIKE $1 OR auteur ILIKE $1) {filtre}
+                ORDER BY titre
+                LIMIT $2
+            """, terme, limite, *([librairie_id] if filtre else []))
+        return [dict(zip(CHAMPS_LIVRE, ligne)) for ligne in lignes]
+
+    async def rechercher_livres_par_pertinence(self, terme_recherche, limite=20, librairie_id=None):
+        """Rechercher des livres par mots (préfixes acceptés), classés par pertinence"""
+        mots = re.findall(r"\w+", terme_recherche)
+        if not mots:
+            return []
+        if not self.recherche_indexee:
+            return await self.rechercher_livres(terme_recherche, limite, librairie_id)
+
+        requete = " & ".join(f"{mot}:*" for mot in mots)
+        filtre = _filtre_librairie(librairie_id, "l", "$4")
+        lignes = await self._fetch(f"""
+            SELECT l.id, l.titre, l.auteur, l.isbn, l.annee_publication
+            FROM livres l,
+                 to_tsquery('french', livres_sans_accent($1)) AS q,
+                 livres_sans_accent($2) AS t
+            WHERE (l.recherche @@ q
+               OR t <% livres_sans_accent(l.titre)
+               OR t <% livres_sans_accent(l.auteur)) {filtre}
+            ORDER BY ts_rank_cd(l.recherche, q) DESC,
+                     word_similarity(t, livres_sans_accent(l.titre)) DESC,
+                     l.titre
+            LIMIT $3
+        """, requete, terme_recherche, limite, *([librairie_id] if filtre else []))
+        return [dict(zip(CHAMPS_LIVRE, ligne)) for ligne in lignes]
+
+    async def verifier_connexion(self):
+        """Vérifier qu'une connexion du pool répond et renvoyer l'état du pool"""
+        await self._fetchval("SELECT 1")
+        return {
+            "taille_min": self.pool.get_min_size(),
+            "taille_max": self.pool.get_max_size(),
+            "ouvertes": self.pool.get_size(),
+            "libres": self.pool.get_idle_size(),
+            "utilisees": self.pool.get_size() - self.pool.get_idle_size(),
+        }
+
+
+def _filtre_librairie(librairie_id, alias, parametre):
+    """Condition restreignant une recherche aux livres d'une librairie (vide pour tout le catalogue)"""
+    if librairie_id is None:
+        return ""
+    return f"AND EXISTS (SELECT 1 FROM librairie_livres ll WHERE ll.livre_id = {alias}.id AND ll.librairie_id = {parametre})"
@@ -1,61 +1,150 @@
-from librairie import Librairie, LibrairieDB
-from flask import Flask, jsonify, request
+from librairie import CLASSEMENTS_STATISTIQUES, Librairie, LibrairieDB, valider_champs
+from admission import controler_admission
+from cache import PORTEE_TOUTES
+from compression import choisir_codage, compresser, compresser_reponses, marquer_codage
+from flux_livres import LectureLivres, lire_csv, lire_jsonl, ouvrir_texte
+from journal import configurer_journalisation, tracer_requetes
+from metriques import exposer, instrumenter
+from pagination import LIMITE_DEFAUT, encoder_curseur, lire_parametres
+from pool import PoolEpuise, compteur_requetes, lecture_primaire, reinitialiser_compteur_requetes
+from sante import SurveillanceSante
+from travaux import FileTravaux
+from flask import Flask, Response, g, jsonify, request, url_for
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
+import csv
+import io
+import json
+import logging
 import os
+import re
+import time
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
 load_dotenv()
 
+# Journaux JSON écrits par un thread dédié (LOG_LEVEL, LOG_SAMPLE_RATE, LOG_SLOW_QUERY_MS)
+configurer_journalisation()
+logger = logging.getLogger("librairie.app")
+
 app = Flask(__name__)
 
-# Initialiser la base de données
+# Identifiant de requête (X-Request-ID) repris dans les journaux et les requêtes SQL
+tracer_requetes(app)
+
+# Latence et requêtes en cours par route, exposées sur /metrics
+instrumenter(app)
+
+# Adresse du client derrière le répartiteur de charge (X-Forwarded-For) : nombre de
+# proxys de confiance devant l'application, 0 s'ils ne sont pas connus
+PROXYS_DE_CONFIANCE = int(os.getenv("TRUSTED_PROXIES", "0"))
+if PROXYS_DE_CONFIANCE > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXYS_DE_CONFIANCE)
+
+# Contrôle d'admission, avant tout accès à la base : débit par client, puis places
+# limitées pour les routes coûteuses (recherche par sous-chaîne qui parcourt livres,
+# imports, lots d'écritures et exports, qui tiennent une connexion jusqu'au dernier
+# octet envoyé). Refus en 429/503 avec Retry-After.
+controler_admission(
+    app,
+    couteuses={'search_livres', 'bulk_livres', 'patch_livres', 'export_livres'},
+    exemptees={'health_check', 'livez', 'readyz', 'metrics'},
+    proxys_de_confiance=PROXYS_DE_CONFIANCE,
+)
+
+# Aucune connexion libérée avant DB_POOL_TIMEOUT : refus que le client peut réessayer
+@app.errorhandler(PoolEpuise)
+def pool_epuise(e):
+    logger.warning("Pool de connexions épuisé", extra={"raison": str(e)})
+    reponse = jsonify({'error': 'Service surchargé, réessayer plus tard'})
+    reponse.headers['Retry-After'] = os.getenv("RETRY_AFTER_SECONDS", "1")
+    return reponse, 503
+
+# Réponses compressées (brotli ou gzip) selon Accept-Encoding, au-delà de COMPRESSION_MIN_BYTES
+compresser_reponses(app)
+
+# Mesurer le temps de démarrage du worker
+debut_demarrage = time.perf_counter()
+
+# Initialiser la base de données (aucune connexion n'est ouverte ici)
 db = LibrairieDB()
+# Retrouvée par gunicorn.conf.py pour fermer les connexions du maître avant le fork
+# des workers (preload_app) et ouvrir celles de chaque worker
+app.extensions["librairie_db"] = db
+
+# Disponibilité servie par /readyz, vérifiée en arrière-plan dans chaque worker
+sante = SurveillanceSante(db.verifier_connexion)
+app.extensions["sante"] = sante
 
-# Créer ou récupérer la librairie CGI
+# Travaux longs (imports, remplacement d'une liste) confiés aux workers de travaux (python travaux.py)
+travaux = FileTravaux(db)
+
+# Les migrations sont normalement appliquées par l'init-container (python migrations.py) ;
+# DB_AUTO_MIGRATE permet de les lancer au démarrage en local (simple lecture si à jour)
+if os.getenv("DB_AUTO_MIGRATE", "true").lower() == "true":
+    db.migrer()
+
+# Créer ou récupérer la librairie CGI : une seule lecture si elle existe déjà
 def get_librairie():
-    # Rechercher si la librairie existe déjà dans la base de données
-    conn = db.db_params.copy()
-    conn["dbname"] = db.db_name
-    
-    import psycopg2
-    connection = psycopg2.connect(**conn)
-    cursor = connection.cursor()
-    
-    cursor.execute("SELECT id FROM librairies WHERE nom = %s", ("CGI",))
-    result = cursor.fetchone()
-    
-    if result:
-        # La librairie existe déjà, on va la récupérer
-        librairie_id = result[0]
-        
-        # Récupérer les détails de la librairie
-        cursor.execute("SELECT nom, adresse FROM librairies WHERE id = %s", (librairie_id,))
-        nom, adresse = cursor.fetchone()
-
-        cursor.close()
-        connection.close()
-        
-        # Créer l'objet Librairie avec l'ID existant
-        librairie = Librairie(nom, adresse, [])
-        librairie.id = librairie_id
-        return librairie
-    else:
-        # La librairie n'existe pas, on va la créer
-        cursor.close()
-        connection.close()
-        
-        # Créer la librairie
-        librairie = Librairie("CGI", "15 Avenue du Docteur Maurice Grynfogel", [])
-        
-        # Ajouter les livres initiaux
-        librairie.add_livres("Le DevOps c'est super !")
-        librairie.add_livres("Le Python pour les nuls")
-        
-        return librairie
+    return Librairie.obtenir_ou_creer(
+        db,
+        "CGI",
+        "15 Avenue du Docteur Maurice Grynfogel",
+        ["Le DevOps c'est super !", "Le Python pour les nuls"]
+    )
 
 # Initialiser la librairie au démarrage de l'application
 librairie1 = get_librairie()
 
+logger.info("Application prête en %.3f s.", time.perf_counter() - debut_demarrage)
+
+# Nombre de requêtes SQL par requête HTTP, exposé pour le banc d'essai (bench/bench.py)
+if os.getenv("DB_COMPTER_REQUETES", "false").lower() == "true":
+    @app.before_request
+    def debut_comptage():
+        reinitialiser_compteur_requetes()
+    
+    @app.after_request
+    def fin_comptage(reponse):
+        reponse.headers['X-DB-Queries'] = str(compteur_requetes())
+        return reponse
+
+# Lecture de ses propres écritures avec des réplicas (DB_REPLICA_HOSTS) : pendant
+# DB_READ_YOUR_WRITES_SECONDS après une écriture, les lectures du même client
+# (cookie posé par la réponse) vont au primaire. 0 : désactivé.
+DELAI_LECTURE_ECRITURES = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "0"))
+if db.repliques and DELAI_LECTURE_ECRITURES > 0:
+    @app.before_request
+    def lire_ses_ecritures():
+        try:
+            ecriture = float(request.cookies.get('derniere_ecriture', ''))
+        except ValueError:
+            return
+        if time.time() - ecriture < DELAI_LECTURE_ECRITURES:
+            g.jeton_lecture_primaire = lecture_primaire.set(True)
+    
+    @app.after_request
+    def noter_ecriture(reponse):
+        if request.method in ('POST', 'PATCH', 'DELETE') and reponse.status_code < 400:
+            reponse.set_cookie('derniere_ecriture', f"{time.time():.3f}",
+                               max_age=int(DELAI_LECTURE_ECRITURES) + 1, httponly=True, samesite='Lax')
+        return reponse
+    
+    @app.teardown_request
+    def oublier_ecriture(exception=None):
+        if 'jeton_lecture_primaire' in g:
+            lecture_primaire.reset(g.pop('jeton_lecture_primaire'))
+
+# Routes d'une librairie (/librairies/<id>/...) : l'identifiant de l'URL est vérifié
+# une fois, depuis le cache des librairies (sans construire de Librairie ni de LibrairieDB).
+# Les routes historiques (/livres...) portent sur la librairie CGI.
+@app.before_request
+def resoudre_librairie():
+    librairie_id = (request.view_args or {}).get('librairie_id')
+    if librairie_id is not None and db.obtenir_librairie(librairie_id) is None:
+        return jsonify({'error': 'Librairie introuvable'}), 404
+
 @app.route("/")
 def get():
     return jsonify(librairie1.get_nom())
@@ -64,57 +153,387 @@ def get():
 def getnom():
     return jsonify(librairie1.get_nom())
 
+# Durée (s) pendant laquelle un client ou un CDN peut resservir une réponse de lecture
+# sans la revalider (0 : revalidation à chaque fois, par un 304 le plus souvent)
+CACHE_HTTP_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+
+# Réponse de lecture qui ne dépend que d'une portée (une librairie, ou toutes) :
+# ETag et Last-Modified viennent de sa date de modification (librairies.modifiee_le,
+# tenue à jour par des triggers, retraits compris). Une requête conditionnelle
+# (If-None-Match, If-Modified-Since) reçoit un 304 sans lecture des livres ni
+# sérialisation ; sinon produire() construit la réponse.
+def reponse_conditionnelle(portee, produire):
+    modifiee_le = db.date_modification(portee)
+    if modifiee_le is None:
+        return produire()
+    return reponse_versionnee(f"{portee}-{modifiee_le.timestamp():.6f}", modifiee_le, produire)
+
+# Réponse dont la version est identifiée par `etag` et datée de `modifiee_le`
+def reponse_versionnee(etag, modifiee_le, produire):
+    # ETag faible : la même version peut être servie compressée ou non
+    if is_resource_modified(request.environ, etag=etag, last_modified=modifiee_le):
+        reponse = produire()
+    else:
+        reponse = app.response_class(status=304)
+    reponse.set_etag(etag, weak=True)
+    reponse.last_modified = modifiee_le
+    reponse.cache_control.public = True
+    if CACHE_HTTP_MAX_AGE > 0:
+        reponse.cache_control.max_age = CACHE_HTTP_MAX_AGE
+    else:
+        reponse.cache_control.no_cache = True
+    return reponse
+
+# Caractères que jsonify échappe (ensure_ascii) et que PostgreSQL laisse tels quels
+NON_ASCII = re.compile(r'[^\x00-\x7e]')
+
+# Réponse JSON mise en cache par librairie, avec ses versions compressées.
+# construire() renvoie la liste à sérialiser (ou son texte JSON, déjà produit par
+# PostgreSQL) et la position de la page suivante, annoncée dans les en-têtes Link
+# et X-Next-Cursor (le corps reste une liste).
+def reponse_json_cachee(librairie_id, construire):
+    def serialiser():
+        elements, suivant = construire()
+        if isinstance(elements, str):
+            # Texte compact aux clés triées : seuls les caractères non ASCII diffèrent de jsonify
+            if app.json.ensure_ascii:
+                elements = NON_ASCII.sub(lambda m: json.dumps(m.group()).strip('"'), elements)
+            corps = (elements + "\n").encode("utf-8")
+        else:
+            # Même sortie compacte que jsonify
+            corps = (app.json.dumps(elements, separators=(",", ":")) + "\n").encode("utf-8")
+        return corps, suivant
+    
+    def produire():
+        cle = (librairie_id, "http", request.full_path)
+        corps, suivant = db.cache.obtenir(cle, serialiser)
+        codage = choisir_codage(request, len(corps))
+        if codage is not None:
+            corps = db.cache.obtenir((*cle, codage), lambda: compresser(corps, codage))
+        reponse = app.response_class(corps, mimetype="application/json")
+        if codage is not None:
+            marquer_codage(reponse, codage)
+        if suivant is not None:
+            curseur = encoder_curseur(suivant)
+            args = request.args.to_dict()
+            args['after'] = curseur
+            reponse.headers['Link'] = '<{0}>; rel="next"'.format(url_for(request.endpoint, **request.view_args, **args))
+            reponse.headers['X-Next-Cursor'] = curseur
+        return reponse
+    
+    return reponse_conditionnelle(librairie_id, produire)
+
 @app.route("/livres")
-def getlivres():
-    # Récupérer la liste des livres à partir de la base de données
-    livres = librairie1.get_livres()
+@app.route("/librairies/<int:librairie_id>/livres")
+def getlivres(librairie_id=None):
+    librairie_id = librairie_id or librairie1.id
+    try:
+        limite, apres, _ = lire_parametres(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Convertir en liste de titres pour maintenir la compatibilité avec le code original
-    titres_livres = [livre["titre"] for livre in livres]
+    def construire():
+        # Seul le titre est lu : la liste reste compatible avec le code original
+        return db.lire_page_livres_json(librairie_id, limite, apres, champs=("titre",), titres_seuls=True)
     
-    return jsonify(titres_livres)
+    return reponse_json_cachee(librairie_id, construire)
+
+# Titre envoyé à POST et DELETE /livres : {"nomLivre": "..."} (None si le corps est incorrect)
+def lire_nom_livre():
+    livre = request.get_json(silent=True)
+    if not isinstance(livre, dict) or not isinstance(livre.get('nomLivre'), str):
+        return None
+    return livre['nomLivre']
 
 @app.route('/livres', methods=['POST'])
-def addlivres():
-    livre = request.get_json()
-    print(livre)
-    librairie1.add_livres(livre['nomLivre'])
+@app.route('/librairies/<int:librairie_id>/livres', methods=['POST'])
+def addlivres(librairie_id=None):
+    titre = lire_nom_livre()
+    if titre is None:
+        return jsonify({'error': "Le corps doit être un objet JSON avec nomLivre (chaîne)"}), 400
+    db.ajouter_titre_a_librairie(librairie_id or librairie1.id, titre)
     return "", 204
 
 @app.route('/livres', methods=['DELETE'])
-def dellivres():
-    livre = request.get_json()
-    print(livre)
-    librairie1.del_livres(livre['nomLivre'])
+@app.route('/librairies/<int:librairie_id>/livres', methods=['DELETE'])
+def dellivres(librairie_id=None):
+    titre = lire_nom_livre()
+    if titre is None:
+        return jsonify({'error': "Le corps doit être un objet JSON avec nomLivre (chaîne)"}), 400
+    db.supprimer_titre_de_librairie(librairie_id or librairie1.id, titre)
     return "", 204
 
-# Point de terminaison Health Check pour Kubernetes
+# Nombre maximal d'opérations dans un lot (PATCH /livres)
+LIMITE_OPERATIONS = 1000
+
+# Lot d'ajouts et de retraits appliqués dans l'ordre, en une seule transaction :
+# [{"op": "add", "nomLivre": "..."}, {"op": "remove", "nomLivre": "..."}, ...]
+@app.route('/livres', methods=['PATCH'])
+@app.route('/librairies/<int:librairie_id>/livres', methods=['PATCH'])
+def patch_livres(librairie_id=None):
+    operations = request.get_json(silent=True)
+    if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+        return jsonify({'error': "Le corps doit être une liste d'opérations"}), 400
+    if len(operations) > LIMITE_OPERATIONS:
+        return jsonify({'error': f"Un lot contient au plus {LIMITE_OPERATIONS} opérations"}), 400
+    
+    resultats = db.appliquer_operations(librairie_id or librairie1.id, operations)
+    return jsonify([
+        {'op': operation.get('op'), 'nomLivre': operation.get('nomLivre', operation.get('titre')), 'resultat': resultat}
+        for operation, resultat in zip(operations, resultats)
+    ]), 200
+
+# Taille maximale (octets) du corps d'un travail, conservé en base jusqu'à son traitement
+TAILLE_MAX_TRAVAIL = int(os.getenv("JOBS_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+
+def traitement_asynchrone_demande():
+    """Vrai si le client accepte d'attendre le résultat sur /jobs/<id> (Prefer: respond-async)"""
+    preferences = request.headers.get('Prefer', '').split(',')
+    return any(preference.split(';')[0].strip().lower() == 'respond-async' for preference in preferences)
+
+def lire_corps_travail():
+    """Corps de la requête en texte (None s'il n'est pas en UTF-8), 413 au-delà de JOBS_MAX_BODY_BYTES"""
+    request.max_content_length = TAILLE_MAX_TRAVAIL
+    try:
+        return request.get_data(cache=False).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+# 202 Accepted : le travail est en file, son état se lit sur /jobs/<id>
+def reponse_travail_accepte(travail_id):
+    reponse = jsonify(travaux.obtenir(travail_id))
+    reponse.status_code = 202
+    reponse.headers['Location'] = url_for('get_job', travail_id=travail_id)
+    reponse.headers['Preference-Applied'] = 'respond-async'
+    return reponse
+
+# Point de terminaison pour importer des livres en masse (JSON Lines ou CSV)
+@app.route('/livres/bulk', methods=['POST'])
+@app.route('/librairies/<int:librairie_id>/livres/bulk', methods=['POST'])
+def bulk_livres(librairie_id=None):
+    format_import = request.args.get('format')
+    if not format_import:
+        format_import = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    if format_import not in ('jsonl', 'csv'):
+        return jsonify({'error': "format doit valoir 'jsonl' ou 'csv'"}), 400
+    
+    # Prefer: respond-async : import confié à un worker de travaux, suivi sur /jobs/<id>
+    if traitement_asynchrone_demande():
+        donnees = lire_corps_travail()
+        if donnees is None:
+            return jsonify({'error': "Le corps doit être encodé en UTF-8"}), 400
+        # Progression en lignes : en-tête CSV exclu, dernière ligne sans saut de ligne comprise
+        total = donnees.count("\n") + (not donnees.endswith("\n")) - (format_import == 'csv')
+        travail_id = travaux.ajouter(
+            'importer_livres', librairie_id or librairie1.id, {'format': format_import}, donnees, max(0, total)
+        )
+        return reponse_travail_accepte(travail_id)
+    
+    # Le corps est lu au fil de l'eau, sans être chargé entièrement en mémoire
+    flux = ouvrir_texte(request.stream)
+    livres = LectureLivres(lire_csv(flux) if format_import == 'csv' else lire_jsonl(flux))
+    rapport = db.importer_livres(librairie_id or librairie1.id, livres)
+    if livres.erreur is not None:
+        # Les lignes lues avant l'erreur sont importées : le rapport les compte
+        if isinstance(livres.erreur, UnicodeDecodeError):
+            message = "Le corps doit être encodé en UTF-8"
+        else:
+            message = f"CSV illisible : {livres.erreur}"
+        return jsonify({**rapport, 'error': message}), 400
+    return jsonify(rapport), 200
+
+# Remplacer toute la liste des livres d'une librairie : ["titre", ...]
+# Toujours traité par un worker de travaux (202), suivi sur /jobs/<id>
+@app.route('/livres', methods=['PUT'])
+@app.route('/librairies/<int:librairie_id>/livres', methods=['PUT'])
+def put_livres(librairie_id=None):
+    request.max_content_length = TAILLE_MAX_TRAVAIL
+    titres = request.get_json(silent=True)
+    if not isinstance(titres, list) or not all(isinstance(titre, str) for titre in titres):
+        return jsonify({'error': "Le corps doit être une liste de titres"}), 400
+    
+    travail_id = travaux.ajouter('remplacer_livres', librairie_id or librairie1.id, {'titres': titres}, total=len(titres))
+    return reponse_travail_accepte(travail_id)
+
+# État d'un travail asynchrone : etat (en_attente, en_cours, termine, echoue),
+# progression (fait / total), tentatives, résultat ou dernière erreur
+@app.route('/jobs/<int:travail_id>')
+def get_job(travail_id):
+    travail = travaux.obtenir(travail_id)
+    if travail is None:
+        return jsonify({'error': 'Travail introuvable'}), 404
+    reponse = jsonify(travail)
+    reponse.cache_control.no_store = True
+    if travail['etat'] in ('en_attente', 'en_cours'):
+        # Intervalle de relecture suggéré au client
+        reponse.headers['Retry-After'] = '1'
+    return reponse
+
+# Sonde de vie Kubernetes : le processus répond, sans aucun accès à la base
+@app.route('/livez', methods=['GET'])
+def livez():
+    return jsonify({'status': 'alive'}), 200
+
+# Sonde de disponibilité : dernier état de la vérification d'arrière-plan (pool,
+# SELECT 1, latence et saturation), sans requête SQL à chaque sonde
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    etat = sante.etat()
+    return jsonify(etat), 200 if etat['pret'] else 503
+
+# Diagnostic détaillé, vérifié à chaque appel (sondes : /livez et /readyz)
 @app.route('/health', methods=['GET'])
 def health_check():
-    # Vérifier la connexion à la base de données
+    # Vérifier qu'une connexion du pool répond
     try:
-        import psycopg2
-        conn = db.db_params.copy()
-        conn["dbname"] = db.db_name
-        connection = psycopg2.connect(**conn)
-        connection.close()
-        return jsonify({'status': 'healthy', 'database': 'connected'}), 200
+        pool = db.verifier_connexion()
+        return jsonify({'status': 'healthy', 'database': 'connected', 'pool': pool, 'cache': db.cache.stats()}), 200
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
+# Métriques Prometheus (tous les workers gunicorn agrégés)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    corps, type_contenu = exposer()
+    return Response(corps, content_type=type_contenu)
+
 # Point de terminaison pour obtenir des informations détaillées sur les livres
 @app.route('/livres/details')
-def get_livres_details():
-    # Récupérer tous les détails des livres
-    livres = librairie1.get_livres()
-    return jsonify(livres)
+@app.route('/librairies/<int:librairie_id>/livres/details')
+def get_livres_details(librairie_id=None):
+    librairie_id = librairie_id or librairie1.id
+    # Récupérer les détails des livres (?limit=&after= pour paginer, ?fields= pour projeter)
+    try:
+        limite, apres, champs = lire_parametres(request.args)
+        champs = valider_champs(champs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def construire():
+        # JSON produit par PostgreSQL : aucun dictionnaire par livre côté Python
+        return db.lire_page_livres_json(librairie_id, limite, apres, champs)
+    
+    return reponse_json_cachee(librairie_id, construire)
+
+# Point de terminaison pour exporter tous les livres en flux (NDJSON ou CSV)
+# La réponse est envoyée au fil de la lecture : mémoire constante par requête
+@app.route('/livres/export')
+@app.route('/librairies/<int:librairie_id>/livres/export')
+def export_livres(librairie_id=None):
+    format_export = request.args.get('format', 'ndjson')
+    if format_export not in ('ndjson', 'csv'):
+        return jsonify({'error': "format doit valoir 'ndjson' ou 'csv'"}), 400
+    try:
+        _, _, champs = lire_parametres(request.args)
+        champs = valider_champs(champs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    lots = db.parcourir_livres_de_librairie(librairie_id or librairie1.id, champs)
+    
+    def generer_ndjson():
+        for lignes in lots:
+            yield "".join(
+                json.dumps(dict(zip(champs, ligne)), ensure_ascii=False) + "\n" for ligne in lignes
+            )
+    
+    def generer_csv():
+        tampon = io.StringIO()
+        ecrivain = csv.writer(tampon)
+        ecrivain.writerow(champs)
+        for lignes in lots:
+            ecrivain.writerows(lignes)
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+        # L'en-tête seul si la librairie est vide
+        if tampon.tell():
+            yield tampon.getvalue()
+    
+    # Un export inchangé depuis la dernière copie du client n'est pas relu (304)
+    if format_export == 'csv':
+        return reponse_conditionnelle(librairie_id or librairie1.id, lambda: Response(generer_csv(), mimetype='text/csv'))
+    return reponse_conditionnelle(
+        librairie_id or librairie1.id, lambda: Response(generer_ndjson(), mimetype='application/x-ndjson')
+    )
 
-# Point de terminaison pour rechercher des livres
+# Point de terminaison pour rechercher des livres (tout le catalogue, ou une librairie)
+# ?mode=ranked : recherche par mots et préfixes, classée par pertinence
 @app.route('/livres/search')
-def search_livres():
+@app.route('/librairies/<int:librairie_id>/livres/search')
+def search_livres(librairie_id=None):
     terme = request.args.get('q', '')
     if not terme:
         return jsonify([])
     
-    livres_trouves = db.rechercher_livres(terme)
-    return jsonify(livres_trouves)
+    mode = request.args.get('mode', 'substring')
+    if mode not in ('substring', 'ranked'):
+        return jsonify({'error': "mode doit valoir 'substring' ou 'ranked'"}), 400
+    
+    limite = request.args.get('limit', type=int)
+    if limite is not None and limite <= 0:
+        return jsonify({'error': 'limit doit être un entier positif'}), 400
+    
+    def produire():
+        if mode == 'ranked':
+            return jsonify(db.rechercher_livres_par_pertinence(terme, min(limite or 20, 100), librairie_id))
+        return jsonify(db.rechercher_livres(terme, limite, librairie_id))
+    
+    # Le catalogue entier change avec n'importe quelle librairie
+    return reponse_conditionnelle(librairie_id or PORTEE_TOUTES, produire)
+
+# Liste des librairies avec leur nombre de livres (?limit=&after= pour paginer)
+@app.route('/librairies')
+def get_librairies():
+    try:
+        limite, apres, _ = lire_parametres(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Invalidée par la modification de n'importe quelle librairie
+    return reponse_json_cachee(PORTEE_TOUTES, lambda: db.lister_librairies(limite, apres))
+
+@app.route('/librairies', methods=['POST'])
+def add_librairie():
+    donnees = request.get_json(silent=True)
+    if not isinstance(donnees, dict):
+        donnees = {}
+    nom, adresse = donnees.get('nom'), donnees.get('adresse')
+    if not isinstance(nom, str) or not nom.strip() or not isinstance(adresse, str):
+        return jsonify({'error': "nom et adresse doivent être des chaînes de caractères"}), 400
+    
+    librairie_id = db.ajouter_librairie(nom, adresse)
+    reponse = jsonify(db.obtenir_librairie(librairie_id))
+    reponse.headers['Location'] = url_for('get_librairie_infos', librairie_id=librairie_id)
+    return reponse, 201
+
+@app.route('/librairies/<int:librairie_id>')
+def get_librairie_infos(librairie_id):
+    return jsonify(db.obtenir_librairie(librairie_id))
+
+# Statistiques du catalogue, lues dans des vues matérialisées (migration 8) que les
+# workers de travaux rafraîchissent : totaux sur /stats, nombre de livres par librairie,
+# par auteur ou par année sur /stats/<dimension> (?limit=). actualise_le date les
+# valeurs et sert de validateur : 304 tant que les vues n'ont pas été rafraîchies.
+def reponse_statistiques(stats, produire):
+    actualise_le = stats['actualise_le']
+    return reponse_versionnee(f"stats-{actualise_le.timestamp():.6f}", actualise_le, produire)
+
+@app.route('/stats')
+def get_stats():
+    stats = db.lire_statistiques()
+    return reponse_statistiques(stats, lambda: jsonify({**stats, 'actualise_le': stats['actualise_le'].isoformat()}))
+
+@app.route('/stats/<dimension>')
+def get_stats_dimension(dimension):
+    if dimension not in CLASSEMENTS_STATISTIQUES:
+        return jsonify({'error': f"Statistiques disponibles : {', '.join(CLASSEMENTS_STATISTIQUES)}"}), 404
+    try:
+        limite, _, _ = lire_parametres(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    stats = db.lire_statistiques()
+    return reponse_statistiques(stats, lambda: jsonify({
+        'actualise_le': stats['actualise_le'].isoformat(),
+        dimension: db.lire_classement_statistiques(dimension, limite or LIMITE_DEFAUT),
+    }))
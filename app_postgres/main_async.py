@@ -0,0 +1,243 @@
+from journal import configurer_journalisation, debut_requete, fin_requete
+from librairie_async import LibrairieDBAsync
+from metriques import DUREE_HTTP, REQUETES_EN_COURS, exposer, route_courante
+from pagination import encoder_curseur, lire_parametres
+from pool import PoolEpuise
+from sante import SurveillanceSante
+from quart import Quart, Response, g, jsonify, request, url_for
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+
+# Charger les variables d'environnement
+load_dotenv()
+
+# Journaux JSON écrits par un thread dédié (LOG_LEVEL, LOG_SAMPLE_RATE)
+configurer_journalisation()
+logger = logging.getLogger("librairie.app")
+
+# Variante asynchrone de main.py (mêmes routes), servie par un serveur ASGI :
+#   hypercorn --bind 0.0.0.0:5000 --workers 2 main_async:app
+app = Quart(__name__)
+
+db = LibrairieDBAsync()
+# Disponibilité servie par /readyz, vérifiée par une tâche de fond dans chaque worker
+sante = SurveillanceSante(db.verifier_connexion, asynchrone=True)
+librairie1 = None
+tache_sante = None
+# Librairies dont l'existence a déjà été vérifiée (l'application n'en supprime pas)
+librairies_connues = set()
+
+# Le pool et la librairie sont initialisés dans la boucle d'événements de chaque worker
+@app.before_serving
+async def demarrer():
+    global librairie1, tache_sante
+    debut_demarrage = time.perf_counter()
+
+    if os.getenv("DB_AUTO_MIGRATE", "true").lower() == "true":
+        from librairie import LibrairieDB
+        await asyncio.to_thread(LibrairieDB().migrer)
+
+    await db.ouvrir()
+    tache_sante = asyncio.create_task(sante.surveiller())
+    librairie1, creee = await db.obtenir_ou_creer_librairie("CGI", "15 Avenue du Docteur Maurice Grynfogel")
+    if creee:
+        for titre in ["Le DevOps c'est super !", "Le Python pour les nuls"]:
+            await db.ajouter_titre_a_librairie(librairie1["id"], titre)
+
+    logger.info("Application prête en %.3f s.", time.perf_counter() - debut_demarrage)
+
+@app.after_serving
+async def arreter():
+    if tache_sante is not None:
+        tache_sante.cancel()
+    await db.fermer()
+
+# Identifiant de requête (X-Request-ID), latence et requêtes en cours par route (/metrics)
+@app.before_request
+async def debut_mesure():
+    g.trace_id = debut_requete(request.headers.get("X-Request-ID"))
+    g.metriques_route = route_courante(request)
+    g.metriques_debut = time.perf_counter()
+    REQUETES_EN_COURS.labels(g.metriques_route).inc()
+
+@app.after_request
+async def fin_mesure(reponse):
+    if "metriques_debut" in g:
+        duree = time.perf_counter() - g.metriques_debut
+        DUREE_HTTP.labels(g.metriques_route, request.method, reponse.status_code).observe(duree)
+        reponse.headers['X-Request-ID'] = g.trace_id
+        logger.debug("requête traitée", extra={
+            "method": request.method,
+            "path": request.path,
+            "status": reponse.status_code,
+            "duree_ms": round(duree * 1000, 2),
+        })
+    return reponse
+
+@app.teardown_request
+async def fermer_requete(exception=None):
+    if "metriques_route" in g:
+        REQUETES_EN_COURS.labels(g.pop("metriques_route")).dec()
+    fin_requete()
+
+# Aucune connexion libérée avant DB_POOL_TIMEOUT : refus que le client peut réessayer,
+# plutôt qu'une requête en attente sans limite
+@app.errorhandler(PoolEpuise)
+async def pool_epuise(e):
+    logger.warning("Pool de connexions épuisé", extra={"raison": str(e)})
+    reponse = jsonify({'error': 'Service surchargé, réessayer plus tard'})
+    reponse.headers['Retry-After'] = os.getenv("RETRY_AFTER_SECONDS", "1")
+    return reponse, 503
+
+# Routes d'une librairie (/librairies/<id>/...) : identifiant vérifié une fois par worker
+@app.before_request
+async def resoudre_librairie():
+    librairie_id = (request.view_args or {}).get('librairie_id')
+    if librairie_id is None or librairie_id in librairies_connues:
+        return None
+    if await db.obtenir_librairie(librairie_id) is None:
+        return jsonify({'error': 'Librairie introuvable'}), 404
+    librairies_connues.add(librairie_id)
+
+# Réponse paginée : le corps reste une liste, la page suivante est annoncée
+# dans les en-têtes Link et X-Next-Cursor
+def reponse_paginee(elements, suivant):
+    reponse = jsonify(elements)
+    if suivant is not None:
+        curseur = encoder_curseur(suivant)
+        args = request.args.to_dict()
+        args['after'] = curseur
+        reponse.headers['Link'] = '<{0}>; rel="next"'.format(url_for(request.endpoint, **request.view_args, **args))
+        reponse.headers['X-Next-Cursor'] = curseur
+    return reponse
+
+@app.route("/")
+async def get():
+    return jsonify(librairie1["nom"])
+
+@app.route("/nom")
+async def getnom():
+    return jsonify(librairie1["nom"])
+
+@app.route("/livres")
+@app.route("/librairies/<int:librairie_id>/livres")
+async def getlivres(librairie_id=None):
+    try:
+        limite, apres, _ = lire_parametres(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    livres, suivant = await db.obtenir_page_livres_de_librairie(librairie_id or librairie1["id"], limite, apres, ("titre",))
+    return reponse_paginee([livre["titre"] for livre in livres], suivant)
+
+# Titre envoyé à POST et DELETE /livres : {"nomLivre": "..."} (None si le corps est incorrect)
+async def lire_nom_livre():
+    livre = await request.get_json(silent=True)
+    if not isinstance(livre, dict) or not isinstance(livre.get('nomLivre'), str):
+        return None
+    return livre['nomLivre']
+
+@app.route('/livres', methods=['POST'])
+@app.route('/librairies/<int:librairie_id>/livres', methods=['POST'])
+async def addlivres(librairie_id=None):
+    titre = await lire_nom_livre()
+    if titre is None:
+        return jsonify({'error': "Le corps doit être un objet JSON avec nomLivre (chaîne)"}), 400
+    await db.ajouter_titre_a_librairie(librairie_id or librairie1["id"], titre)
+    return "", 204
+
+@app.route('/livres', methods=['DELETE'])
+@app.route('/librairies/<int:librairie_id>/livres', methods=['DELETE'])
+async def dellivres(librairie_id=None):
+    titre = await lire_nom_livre()
+    if titre is None:
+        return jsonify({'error': "Le corps doit être un objet JSON avec nomLivre (chaîne)"}), 400
+    await db.supprimer_titre_de_librairie(librairie_id or librairie1["id"], titre)
+    return "", 204
+
+# Point de terminaison Health Check pour Kubernetes
+@app.route('/livez', methods=['GET'])
+async def livez():
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    etat = sante.etat()
+    return jsonify(etat), 200 if etat['pret'] else 503
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    try:
+        pool = await db.verifier_connexion()
+        return jsonify({'status': 'healthy', 'database': 'connected', 'pool': pool}), 200
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+
+# Métriques Prometheus (workers agrégés si PROMETHEUS_MULTIPROC_DIR est défini)
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    corps, type_contenu = exposer()
+    return Response(corps, content_type=type_contenu)
+
+@app.route('/livres/details')
+@app.route('/librairies/<int:librairie_id>/livres/details')
+async def get_livres_details(librairie_id=None):
+    try:
+        limite, apres, champs = lire_parametres(request.args)
+        livres, suivant = await db.obtenir_page_livres_de_librairie(librairie_id or librairie1["id"], limite, apres, champs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return reponse_paginee(livres, suivant)
+
+@app.route('/livres/search')
+@app.route('/librairies/<int:librairie_id>/livres/search')
+async def search_livres(librairie_id=None):
+    terme = request.args.get('q', '')
+    if not terme:
+        return jsonify([])
+
+    mode = request.args.get('mode', 'substring')
+    if mode not in ('substring', 'ranked'):
+        return jsonify({'error': "mode doit valoir 'substring' ou 'ranked'"}), 400
+
+    limite = request.args.get('limit', type=int)
+    if limite is not None and limite <= 0:
+        return jsonify({'error': 'limit doit être un entier positif'}), 400
+
+    if mode == 'ranked':
+        livres_trouves = await db.rechercher_livres_par_pertinence(terme, min(limite or 20, 100), librairie_id)
+    else:
+        livres_trouves = await db.rechercher_livres(terme, limite, librairie_id)
+    return jsonify(livres_trouves)
+
+@app.route('/librairies')
+async def get_librairies():
+    try:
+        limite, apres, _ = lire_parametres(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    librairies, suivant = await db.lister_librairies(limite, apres)
+    return reponse_paginee(librairies, suivant)
+
+@app.route('/librairies', methods=['POST'])
+async def add_librairie():
+    donnees = await request.get_json(silent=True)
+    if not isinstance(donnees, dict):
+        return jsonify({'error': "Le corps doit être un objet JSON"}), 400
+    nom, adresse = donnees.get('nom'), donnees.get('adresse')
+    if not isinstance(nom, str) or not nom.strip() or not isinstance(adresse, str):
+        return jsonify({'error': "nom et adresse doivent être des chaînes de caractères"}), 400
+
+    librairie = await db.ajouter_librairie(nom, adresse)
+    librairies_connues.add(librairie["id"])
+    reponse = jsonify(librairie)
+    reponse.headers['Location'] = url_for('get_librairie_infos', librairie_id=librairie["id"])
+    return reponse, 201
+
+@app.route('/librairies/<int:librairie_id>')
+async def get_librairie_infos(librairie_id):
+    return jsonify(await db.obtenir_librairie(librairie_id))
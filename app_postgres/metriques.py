@@ -0,0 +1,128 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Avec plusieurs workers (gunicorn, hypercorn), chaque processus écrit ses valeurs
+# dans PROMETHEUS_MULTIPROC_DIR et /metrics les agrège (voir gunicorn.conf.py)
+REPERTOIRE_MULTIPROCESSUS = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if REPERTOIRE_MULTIPROCESSUS:
+    os.makedirs(REPERTOIRE_MULTIPROCESSUS, exist_ok=True)
+
+DUREE_HTTP = Histogram(
+    "librairie_http_request_duration_seconds",
+    "Durée de traitement des requêtes HTTP par route",
+    ["route", "method", "status"],
+)
+REQUETES_EN_COURS = Gauge(
+    "librairie_http_requests_in_progress",
+    "Requêtes HTTP en cours de traitement",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+
+REQUETES_REJETEES = Counter(
+    "librairie_http_requests_rejected_total",
+    "Requêtes HTTP refusées par le contrôle d'admission, par route et raison (rate_limit, concurrency, queue_time)",
+    ["route", "reason"],
+)
+
+DUREE_DB = Histogram(
+    "librairie_db_method_duration_seconds",
+    "Durée des méthodes d'accès à la base (LibrairieDB)",
+    ["method"],
+)
+REQUETES_SQL = Counter(
+    "librairie_db_queries_total",
+    "Requêtes SQL exécutées, par méthode de LibrairieDB",
+    ["method"],
+)
+CONNEXIONS_OUVERTES = Counter(
+    "librairie_db_connections_opened_total",
+    "Connexions PostgreSQL ouvertes par le pool",
+)
+CONNEXIONS_FERMEES = Counter(
+    "librairie_db_connections_closed_total",
+    "Connexions PostgreSQL fermées par le pool",
+)
+POOL_EPUISE = Counter(
+    "librairie_db_pool_timeouts_total",
+    "Emprunts de connexion abandonnés faute de connexion libre",
+)
+LECTURES = Counter(
+    "librairie_db_reads_total",
+    "Transactions de lecture, par cible (replica ou primary)",
+    ["target"],
+)
+EXCLUSIONS_REPLIQUE = Counter(
+    "librairie_db_replica_ejections_total",
+    "Réplicas écartés de la répartition des lectures, par raison (error ou lag)",
+    ["reason"],
+)
+
+# Taux de succès : rate(..{result="hit"}[5m]) / rate(librairie_cache_requests_total[5m])
+REQUETES_CACHE = Counter(
+    "librairie_cache_requests_total",
+    "Lectures du cache mémoire, par résultat (hit ou miss)",
+    ["result"],
+)
+
+# Travaux asynchrones (travaux.py), exposés par chaque worker de travaux (JOBS_METRICS_PORT)
+TRAVAUX_TRAITES = Counter(
+    "librairie_jobs_processed_total",
+    "Tentatives de travaux terminées, par type et issue (termine, reessai, echoue, bail_perdu)",
+    ["type", "outcome"],
+)
+DUREE_TRAVAUX = Histogram(
+    "librairie_job_duration_seconds",
+    "Durée d'une tentative de travail, par type",
+    ["type"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+TRAVAUX_EN_FILE = Gauge(
+    "librairie_jobs_queued",
+    "Travaux en file, par état (en_attente, en_cours)",
+    ["state"],
+    multiprocess_mode="max",
+)
+
+
+def route_courante(requete):
+    # Le modèle de route (/livres/<id>) et non le chemin, pour borner le nombre de séries
+    return requete.url_rule.rule if requete.url_rule is not None else "inconnue"
+
+
+def instrumenter(app):
+    """Mesurer la durée et le nombre de requêtes en cours de chaque route d'une application Flask"""
+    from flask import g, request
+
+    @app.before_request
+    def debut_mesure():
+        g.metriques_route = route_courante(request)
+        g.metriques_debut = time.perf_counter()
+        REQUETES_EN_COURS.labels(g.metriques_route).inc()
+
+    @app.after_request
+    def fin_mesure(reponse):
+        if "metriques_debut" in g:
+            DUREE_HTTP.labels(g.metriques_route, request.method, reponse.status_code).observe(
+                time.perf_counter() - g.metriques_debut
+            )
+        return reponse
+
+    @app.teardown_request
+    def fin_requete(exception=None):
+        if "metriques_route" in g:
+            REQUETES_EN_COURS.labels(g.pop("metriques_route")).dec()
+
+
+def exposer():
+    """Renvoyer (corps, type de contenu) de la page /metrics, tous workers confondus"""
+    if REPERTOIRE_MULTIPROCESSUS:
+        registre = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registre)
+    else:
+        registre = REGISTRY
+    return generate_latest(registre), CONTENT_TYPE_LATEST
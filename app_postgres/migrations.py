@@ -0,0 +1,370 @@
+import logging
+import sys
+import time
+
+import psycopg2
+
+logger = logging.getLogger("librairie.migrations")
+
+# Clé du verrou consultatif qui sérialise les migrations entre pods et init-containers
+CLE_VERROU_MIGRATIONS = 4_815_162_342
+
+
+def _tables_initiales(cursor):
+    # Table des librairies
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS librairies (
+            id SERIAL PRIMARY KEY,
+            nom VARCHAR(100) NOT NULL,
+            adresse TEXT NOT NULL,
+            date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Table des livres
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS livres (
+            id SERIAL PRIMARY KEY,
+            titre VARCHAR(200) NOT NULL,
+            auteur VARCHAR(100),
+            isbn VARCHAR(20) UNIQUE,
+            annee_publication INTEGER,
+            date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Table de relation entre librairies et livres (many-to-many)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS librairie_livres (
+            librairie_id INTEGER REFERENCES librairies(id) ON DELETE CASCADE,
+            livre_id INTEGER REFERENCES livres(id) ON DELETE CASCADE,
+            date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (librairie_id, livre_id)
+        )
+    """)
+
+
+def _titre_unique(cursor):
+    # Regrouper les livres de même titre (casse ignorée) sur le plus ancien avant d'indexer
+    cursor.execute("""
+        CREATE TEMPORARY TABLE doublons_livres ON COMMIT DROP AS
+        SELECT id, min(id) OVER (PARTITION BY lower(titre)) AS garde
+        FROM livres
+    """)
+    cursor.execute("DELETE FROM doublons_livres WHERE id = garde")
+    cursor.execute("""
+        INSERT INTO librairie_livres (librairie_id, livre_id, date_ajout)
+        SELECT ll.librairie_id, d.garde, ll.date_ajout
+        FROM librairie_livres ll
+        JOIN doublons_livres d ON d.id = ll.livre_id
+        ON CONFLICT DO NOTHING
+    """)
+    cursor.execute("DELETE FROM livres WHERE id IN (SELECT id FROM doublons_livres)")
+    if cursor.rowcount > 0:
+        logger.info("%d livre(s) en double fusionné(s).", cursor.rowcount)
+
+    # Clé unique insensible à la casse sur le titre, utilisée par les upserts
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS livres_titre_unique_idx ON livres (lower(titre))")
+
+
+def _index_pagination(cursor):
+    # Index du tri (titre, id) utilisé par la pagination par curseur
+    cursor.execute("CREATE INDEX IF NOT EXISTS livres_titre_id_idx ON livres (titre, id)")
+
+
+def _index_recherche(cursor):
+    # Recherche plein texte (français, sans accents) et trigrammes. Nécessite les
+    # extensions pg_trgm et unaccent ; sans elles la recherche retombe sur ILIKE.
+    cursor.execute("SAVEPOINT index_recherche")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+
+        # unaccent() n'est pas IMMUTABLE : on l'enveloppe pour pouvoir l'indexer
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION livres_sans_accent(texte TEXT) RETURNS TEXT
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+            AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, lower(texte)) $$
+        """)
+
+        cursor.execute("""
+            ALTER TABLE livres ADD COLUMN IF NOT EXISTS recherche TSVECTOR
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('french', coalesce(livres_sans_accent(titre), '')), 'A') ||
+                setweight(to_tsvector('french', coalesce(livres_sans_accent(auteur), '')), 'B')
+            ) STORED
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS livres_recherche_idx ON livres USING gin (recherche)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS livres_titre_trgm_idx ON livres USING gin (livres_sans_accent(titre) gin_trgm_ops)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS livres_auteur_trgm_idx ON livres USING gin (livres_sans_accent(auteur) gin_trgm_ops)"
+        )
+        cursor.execute("RELEASE SAVEPOINT index_recherche")
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT index_recherche")
+        # La migration est tout de même enregistrée : pour la rejouer après installation
+        # des extensions, supprimer sa version de schema_migrations
+        logger.warning("Recherche indexée indisponible, repli sur ILIKE (%s)", str(e).splitlines()[0])
+
+
+def _librairies_en_double(cursor):
+    # Chaque démarrage créait une librairie "CGI" supplémentaire : on supprime les
+    # copies vides (même nom et même adresse, sans livre) en gardant la plus ancienne
+    cursor.execute("""
+        DELETE FROM librairies l
+        USING librairies garde
+        WHERE garde.nom = l.nom
+          AND garde.adresse = l.adresse
+          AND garde.id < l.id
+          AND NOT EXISTS (SELECT 1 FROM librairie_livres ll WHERE ll.librairie_id = l.id)
+    """)
+    if cursor.rowcount > 0:
+        logger.info("%d librairie(s) en double supprimée(s).", cursor.rowcount)
+
+
+def _date_modification(cursor):
+    # Date de dernière modification de chaque librairie (Last-Modified et ETag des
+    # réponses HTTP), tenue à jour par des triggers pour tous les chemins d'écriture
+    # (ajouts, retraits, imports par COPY, suppressions en cascade). Les retraits
+    # passés ne sont pas connus : la date de la migration est la seule borne sûre.
+    cursor.execute("ALTER TABLE librairies ADD COLUMN IF NOT EXISTS modifiee_le TIMESTAMPTZ NOT NULL DEFAULT now()")
+
+    # Un trigger par instruction (tables de transition) : une seule mise à jour de
+    # librairies par écriture, quel que soit le nombre de lignes
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION librairies_liens_modifies() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE librairies SET modifiee_le = clock_timestamp()
+            WHERE id IN (SELECT librairie_id FROM liens_modifies);
+            RETURN NULL;
+        END
+        $$
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS librairie_livres_ajouts ON librairie_livres")
+    cursor.execute("""
+        CREATE TRIGGER librairie_livres_ajouts
+        AFTER INSERT ON librairie_livres
+        REFERENCING NEW TABLE AS liens_modifies
+        FOR EACH STATEMENT EXECUTE FUNCTION librairies_liens_modifies()
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS librairie_livres_retraits ON librairie_livres")
+    cursor.execute("""
+        CREATE TRIGGER librairie_livres_retraits
+        AFTER DELETE ON librairie_livres
+        REFERENCING OLD TABLE AS liens_modifies
+        FOR EACH STATEMENT EXECUTE FUNCTION librairies_liens_modifies()
+    """)
+
+    # Un livre complété (auteur, ISBN...) change les détails de toutes ses librairies ;
+    # les upserts qui ne changent rien ne comptent pas
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION librairies_livres_modifies() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE librairies SET modifiee_le = clock_timestamp()
+            WHERE id IN (
+                SELECT ll.librairie_id
+                FROM livres_nouveaux n
+                JOIN livres_anciens a ON a.id = n.id
+                JOIN librairie_livres ll ON ll.livre_id = n.id
+                WHERE (n.titre, n.auteur, n.isbn, n.annee_publication)
+                      IS DISTINCT FROM (a.titre, a.auteur, a.isbn, a.annee_publication)
+            );
+            RETURN NULL;
+        END
+        $$
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS livres_modifies ON livres")
+    cursor.execute("""
+        CREATE TRIGGER livres_modifies
+        AFTER UPDATE ON livres
+        REFERENCING OLD TABLE AS livres_anciens NEW TABLE AS livres_nouveaux
+        FOR EACH STATEMENT EXECUTE FUNCTION librairies_livres_modifies()
+    """)
+
+
+
+def _travaux(cursor):
+    # File des travaux longs (imports, remplacement d'une liste), traités par les workers
+    # de travaux (python travaux.py) ; etat : en_attente, en_cours, termine ou echoue
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS travaux (
+            id BIGSERIAL PRIMARY KEY,
+            type TEXT NOT NULL,
+            librairie_id INTEGER REFERENCES librairies(id) ON DELETE CASCADE,
+            parametres JSONB NOT NULL DEFAULT '{}',
+            donnees TEXT,
+            etat TEXT NOT NULL DEFAULT 'en_attente'
+                CHECK (etat IN ('en_attente', 'en_cours', 'termine', 'echoue')),
+            tentatives INTEGER NOT NULL DEFAULT 0,
+            tentatives_max INTEGER NOT NULL DEFAULT 3,
+            fait BIGINT NOT NULL DEFAULT 0,
+            total BIGINT,
+            resultat JSONB,
+            erreur TEXT,
+            id_requete TEXT,
+            cree_le TIMESTAMPTZ NOT NULL DEFAULT now(),
+            disponible_le TIMESTAMPTZ NOT NULL DEFAULT now(),
+            commence_le TIMESTAMPTZ,
+            bail_jusqu_a TIMESTAMPTZ,
+            termine_le TIMESTAMPTZ
+        )
+    """)
+    # Seuls les travaux à prendre sont indexés : l'index reste petit quel que soit l'historique
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS travaux_a_prendre_idx
+        ON travaux (id) WHERE etat IN ('en_attente', 'en_cours')
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS travaux_termines_idx
+        ON travaux (termine_le) WHERE etat IN ('termine', 'echoue')
+    """)
+
+
+def _statistiques(cursor):
+    # Agrégats du catalogue pour /stats, rafraîchis (REFRESH ... CONCURRENTLY) par les
+    # workers de travaux. L'index unique de chaque vue permet le rafraîchissement
+    # concurrent ; les index (livres DESC) servent les classements sans tri.
+    # stats_catalogue garde aussi l'état des tables à son calcul, pour ne rafraîchir
+    # les vues qu'après une modification.
+    cursor.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS stats_catalogue AS
+        SELECT 1 AS id,
+               now() AS actualise_le,
+               (SELECT count(*) FROM livres) AS livres,
+               (SELECT count(*) FROM librairies) AS librairies,
+               (SELECT count(*) FROM librairie_livres) AS liens,
+               (SELECT count(DISTINCT auteur) FROM livres) AS auteurs,
+               (SELECT count(*) FROM livres WHERE auteur IS NULL) AS livres_sans_auteur,
+               (SELECT count(*) FROM livres WHERE annee_publication IS NULL) AS livres_sans_annee,
+               (SELECT max(modifiee_le) FROM librairies) AS librairies_modifiees_le,
+               (SELECT max(id) FROM livres) AS dernier_livre_id
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS stats_catalogue_id_idx ON stats_catalogue (id)")
+
+    cursor.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS stats_librairies AS
+        SELECT l.id AS librairie_id, count(ll.livre_id) AS livres
+        FROM librairies l
+        LEFT JOIN librairie_livres ll ON ll.librairie_id = l.id
+        GROUP BY l.id
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS stats_librairies_id_idx ON stats_librairies (librairie_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS stats_librairies_livres_idx ON stats_librairies (livres DESC, librairie_id)")
+
+    cursor.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS stats_auteurs AS
+        SELECT auteur, count(*) AS livres
+        FROM livres
+        WHERE auteur IS NOT NULL
+        GROUP BY auteur
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS stats_auteurs_auteur_idx ON stats_auteurs (auteur)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS stats_auteurs_livres_idx ON stats_auteurs (livres DESC, auteur)")
+
+    cursor.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS stats_annees AS
+        SELECT annee_publication, count(*) AS livres
+        FROM livres
+        WHERE annee_publication IS NOT NULL
+        GROUP BY annee_publication
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS stats_annees_annee_idx ON stats_annees (annee_publication)")
+
+# Migrations dans leur ordre d'application : (version, description, fonction)
+# Une migration publiée ne doit plus être modifiée, on en ajoute une nouvelle.
+MIGRATIONS = [
+    (1, "Tables librairies, livres et librairie_livres", _tables_initiales),
+    (2, "Titre unique insensible à la casse", _titre_unique),
+    (3, "Index de pagination (titre, id)", _index_pagination),
+    (4, "Index de recherche plein texte et trigrammes", _index_recherche),
+    (5, "Suppression des librairies vides en double", _librairies_en_double),
+    (6, "Date de modification des librairies tenue par triggers", _date_modification),
+    (7, "File des travaux asynchrones", _travaux),
+    (8, "Vues matérialisées des statistiques du catalogue", _statistiques),
+]
+
+
+def version_schema(cursor):
+    """Version du schéma en base (0 si aucune migration n'a été appliquée)"""
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return 0
+    cursor.execute("SELECT coalesce(max(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def appliquer_migrations(db_params):
+    """Appliquer les migrations manquantes, chacune dans sa transaction
+
+    Sans effet (une seule lecture) si le schéma est à jour. Un verrou consultatif
+    garantit qu'un seul processus migre à la fois. Renvoie les versions appliquées.
+    """
+    derniere_version = MIGRATIONS[-1][0]
+    conn = psycopg2.connect(**db_params)
+    try:
+        cursor = conn.cursor()
+        if version_schema(cursor) >= derniere_version:
+            return []
+        conn.rollback()
+
+        cursor.execute("SELECT pg_advisory_lock(%s)", (CLE_VERROU_MIGRATIONS,))
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    date_application TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+
+            # Relu sous verrou : un autre processus a pu migrer entre-temps
+            cursor.execute("SELECT version FROM schema_migrations")
+            deja_appliquees = {ligne[0] for ligne in cursor.fetchall()}
+            conn.commit()
+
+            appliquees = []
+            for version, description, migration in MIGRATIONS:
+                if version in deja_appliquees:
+                    continue
+                debut = time.perf_counter()
+                try:
+                    migration(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                logger.info("Migration %d appliquée en %.3f s : %s", version, time.perf_counter() - debut, description)
+                appliquees.append(version)
+            return appliquees
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (CLE_VERROU_MIGRATIONS,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+# Point d'entrée de l'init-container : python migrations.py
+if __name__ == "__main__":
+    from journal import configurer_journalisation
+    from librairie import LibrairieDB
+
+    configurer_journalisation()
+    debut = time.perf_counter()
+    db = LibrairieDB()
+    try:
+        appliquees = db.migrer()
+    except psycopg2.Error as e:
+        logger.error("Échec des migrations : %s", e)
+        sys.exit(1)
+    logger.info("Schéma à jour (version %d, %d migration(s) appliquée(s)) en %.3f s.",
+                MIGRATIONS[-1][0], len(appliquees), time.perf_counter() - debut)
@@ -0,0 +1,48 @@
+import base64
+import json
+
+# Taille de page maximale acceptée pour le paramètre limit
+LIMITE_MAX = 1000
+
+# Taille de page utilisée quand un curseur est fourni sans limit
+LIMITE_DEFAUT = 100
+
+
+def encoder_curseur(position):
+    """Encoder la position (titre, id) du dernier livre d'une page en curseur opaque"""
+    titre, livre_id = position
+    brut = json.dumps([titre, livre_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(brut).decode("ascii").rstrip("=")
+
+
+def decoder_curseur(curseur):
+    """Retrouver la position (titre, id) à partir d'un curseur (ValueError s'il est invalide)"""
+    try:
+        brut = base64.urlsafe_b64decode(curseur + "=" * (-len(curseur) % 4))
+        titre, livre_id = json.loads(brut.decode("utf-8"))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Curseur invalide") from e
+    if not isinstance(titre, str) or not isinstance(livre_id, int):
+        raise ValueError("Curseur invalide")
+    return titre, livre_id
+
+
+def lire_parametres(args):
+    """Lire limit, after et fields d'une requête (ValueError si un paramètre est invalide)"""
+    limite = args.get("limit")
+    if limite is not None:
+        if not limite.isdigit() or not 0 < int(limite) <= LIMITE_MAX:
+            raise ValueError(f"limit doit être un entier entre 1 et {LIMITE_MAX}")
+        limite = int(limite)
+
+    apres = args.get("after")
+    if apres is not None:
+        apres = decoder_curseur(apres)
+        if limite is None:
+            limite = LIMITE_DEFAUT
+
+    champs = args.get("fields")
+    if champs is not None:
+        champs = tuple(champ.strip() for champ in champs.split(",") if champ.strip())
+
+    return limite, apres, champs
@@ -0,0 +1,521 @@
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, sql
+
+import journal
+from journal import id_requete
+from metriques import CONNEXIONS_FERMEES, CONNEXIONS_OUVERTES, EXCLUSIONS_REPLIQUE, LECTURES, POOL_EPUISE
+
+
+# Nombre de requêtes SQL exécutées par le thread courant (une requête HTTP par thread)
+_compteur = threading.local()
+
+# Méthode de LibrairieDB en cours, reprise dans le journal des requêtes lentes
+methode_courante = contextvars.ContextVar("methode_courante", default=None)
+
+# Vrai pendant une requête dont les lectures doivent aller au primaire (lecture de ses propres écritures)
+lecture_primaire = contextvars.ContextVar("lecture_primaire", default=False)
+
+logger = logging.getLogger("librairie.sql")
+
+# Marqueurs de paramètres de psycopg2 (%s, %(nom)s) et "%%" littéral
+_MARQUEUR = re.compile(r"%%|%s|%\((\w+)\)s")
+# Au-delà, les instructions préparées d'une connexion sont toutes libérées (projections dynamiques)
+MAX_INSTRUCTIONS_PREPAREES = 256
+
+
+def reinitialiser_compteur_requetes():
+    _compteur.requetes = 0
+
+
+def compteur_requetes():
+    """Nombre de requêtes SQL exécutées par le thread courant depuis la dernière remise à zéro"""
+    return getattr(_compteur, "requetes", 0)
+
+
+def forme_parametres(parametres):
+    """Types des paramètres d'une requête, sans leurs valeurs (journal des requêtes lentes)"""
+    if parametres is None:
+        return None
+    if isinstance(parametres, dict):
+        return {cle: type(valeur).__name__ for cle, valeur in parametres.items()}
+    return [type(valeur).__name__ for valeur in parametres]
+
+
+@functools.lru_cache(maxsize=1024)
+def _instruction(requete):
+    """Nom, texte PREPARE ($1, $2…) et ordre des paramètres d'une requête écrite pour psycopg2"""
+    noms = []
+
+    def numeroter(marqueur):
+        if marqueur.group(0) == "%%":
+            return "%"
+        nom = marqueur.group(1)
+        if nom is None:
+            noms.append(len(noms))
+            return f"${len(noms)}"
+        if nom not in noms:
+            noms.append(nom)
+        return f"${noms.index(nom) + 1}"
+
+    texte = _MARQUEUR.sub(numeroter, requete)
+    nom = "librairie_" + hashlib.sha1(requete.encode("utf-8")).hexdigest()[:16]
+    return nom, texte, tuple(noms)
+
+
+class ConnexionPreparee(extensions.connection):
+    """Connexion psycopg2 qui retient les instructions préparées côté serveur (PREPARE)
+
+    Elles durent autant que la session, même si la transaction qui les a créées
+    est annulée : une seule analyse et planification par connexion et par requête.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparees = set()
+
+
+class CurseurCompte(extensions.cursor):
+    """Curseur psycopg2 qui compte et chronomètre les requêtes du thread courant
+
+    Chaque requête porte en commentaire l'identifiant de la requête HTTP
+    (visible dans pg_stat_activity et les journaux PostgreSQL) ; celles qui
+    dépassent LOG_SLOW_QUERY_MS sont journalisées.
+    """
+
+    def _annoter(self, requete):
+        identifiant = id_requete.get()
+        if identifiant is None:
+            return requete
+        if isinstance(requete, sql.Composable):
+            return sql.SQL(f"/* request_id={identifiant} */ ") + requete
+        if isinstance(requete, str):
+            return f"/* request_id={identifiant} */ {requete}"
+        return requete
+
+    def _chronometrer(self, executer, requete, parametres, texte_journal=None):
+        _compteur.requetes = compteur_requetes() + 1
+        debut = time.perf_counter()
+        try:
+            return executer(self._annoter(requete))
+        finally:
+            duree = time.perf_counter() - debut
+            if 0 <= journal.seuil_requete_lente <= duree:
+                self._journaliser_lente(texte_journal or requete, parametres, duree)
+
+    def _journaliser_lente(self, requete, parametres, duree):
+        if isinstance(requete, sql.Composable):
+            requete = requete.as_string(self)
+        elif isinstance(requete, bytes):
+            requete = requete.decode("utf-8", "replace")
+        logger.warning("requête SQL lente", extra={
+            "sql": " ".join(requete.split())[:500],
+            "params": parametres,
+            "duree_ms": round(duree * 1000, 2),
+            "methode": methode_courante.get(),
+        })
+
+    def execute(self, query, vars=None):
+        return self._chronometrer(lambda requete: super(CurseurCompte, self).execute(requete, vars),
+                                  query, forme_parametres(vars))
+
+    def executer_prepare(self, query, vars=None):
+        """Exécuter une requête des chemins fréquents par une instruction préparée côté serveur
+
+        Mêmes marqueurs de paramètres que execute() ; l'instruction est créée au
+        premier usage sur la connexion (PREPARE), puis seulement exécutée
+        (EXECUTE). Sans ConnexionPreparee (DB_PREPARED_STATEMENTS=false), simple execute().
+        """
+        preparees = getattr(self.connection, "preparees", None)
+        if preparees is None:
+            return self.execute(query, vars)
+        requete = query.as_string(self) if isinstance(query, sql.Composable) else query
+        nom, texte, noms = _instruction(requete)
+        if nom not in preparees:
+            if len(preparees) >= MAX_INSTRUCTIONS_PREPAREES:
+                super().execute("DEALLOCATE ALL")
+                preparees.clear()
+            self._chronometrer(lambda prepare: super(CurseurCompte, self).execute(prepare),
+                               f"PREPARE {nom} AS {texte}", None)
+            preparees.add(nom)
+        if isinstance(vars, dict):
+            valeurs = [vars[cle] for cle in noms]
+        else:
+            valeurs = list(vars or ())
+        execution = f"EXECUTE {nom} ({', '.join(['%s'] * len(valeurs))})" if valeurs else f"EXECUTE {nom}"
+        return self._chronometrer(lambda annotee: super(CurseurCompte, self).execute(annotee, valeurs),
+                                  execution, forme_parametres(vars), texte_journal=requete)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        forme = [forme_parametres(vars_list[0]), len(vars_list)] if vars_list else None
+        return self._chronometrer(lambda requete: super(CurseurCompte, self).executemany(requete, vars_list),
+                                  query, forme)
+
+    def copy_expert(self, sql, file, size=8192):
+        # COPY n'accepte pas l'attente coopérative (gevent) : le lot est envoyé en mode bloquant,
+        # ce qui ne retient aucune autre greenlet puisque le processus attend de toute façon
+        attente = extensions.get_wait_callback()
+        if attente is not None:
+            extensions.set_wait_callback(None)
+        try:
+            return self._chronometrer(lambda requete: super(CurseurCompte, self).copy_expert(requete, file, size),
+                                      sql, None)
+        finally:
+            if attente is not None:
+                extensions.set_wait_callback(attente)
+
+
+def attendre_avec_gevent():
+    """Rendre psycopg2 coopératif sous gevent (workers gunicorn gevent)
+
+    Sans cela, chaque requête SQL bloque tout le worker et ses autres greenlets.
+    """
+    from gevent.socket import wait_read, wait_write
+
+    def attendre(conn, timeout=None):
+        while True:
+            etat = conn.poll()
+            if etat == extensions.POLL_OK:
+                return
+            if etat == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif etat == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"État de poll inattendu : {etat}")
+
+    extensions.set_wait_callback(attendre)
+
+
+class PoolEpuise(Exception):
+    """Levée quand aucune connexion ne se libère avant la fin du délai d'attente"""
+
+
+class PoolConnexions:
+    """Pool de connexions PostgreSQL partagé par les threads d'un worker gunicorn"""
+
+    def __init__(self, db_params, taille_min=1, taille_max=10, delai_attente=5.0, intervalle_verification=30.0,
+                 instructions_preparees=True):
+        if taille_min < 0 or taille_max < 1 or taille_min > taille_max:
+            raise ValueError("Attention: tailles de pool incorrectes")
+
+        self.db_params = dict(db_params)
+        self.taille_min = taille_min
+        self.taille_max = taille_max
+        self.delai_attente = delai_attente
+        self.intervalle_verification = intervalle_verification
+        # Faux derrière un pooler en mode transaction (PgBouncer) : les sessions y sont partagées
+        self.instructions_preparees = instructions_preparees
+
+        self._condition = threading.Condition()
+        self._initialiser_etat()
+
+    def _initialiser_etat(self):
+        # Connexions libres sous la forme (connexion, date du dernier usage)
+        self._libres = deque()
+        self._ouvertes = 0
+        self._pid = os.getpid()
+        self._stats = {
+            "connexions_creees": 0,
+            "connexions_fermees": 0,
+            "emprunts": 0,
+            "attentes": 0,
+            "expirations": 0,
+            "verifications_echouees": 0,
+        }
+
+    def _verifier_processus(self):
+        """Repartir d'un pool vide si le processus a été forké (worker gunicorn)"""
+        if self._pid != os.getpid():
+            # Les sockets héritées appartiennent au processus parent : on les
+            # abandonne sans les fermer pour ne pas couper ses connexions
+            self._initialiser_etat()
+
+    def _ouvrir(self):
+        conn = psycopg2.connect(
+            **self.db_params,
+            connection_factory=ConnexionPreparee if self.instructions_preparees else None,
+            cursor_factory=CurseurCompte,
+        )
+        self._stats["connexions_creees"] += 1
+        CONNEXIONS_OUVERTES.inc()
+        return conn
+
+    def _fermer(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._stats["connexions_fermees"] += 1
+        CONNEXIONS_FERMEES.inc()
+
+    def _est_valide(self, conn, dernier_usage):
+        """Vérifier qu'une connexion libre est encore utilisable avant de la prêter (hors verrou)"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - dernier_usage < self.intervalle_verification:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def remplir(self):
+        """Ouvrir les connexions jusqu'à atteindre la taille minimale"""
+        with self._condition:
+            self._verifier_processus()
+            while self._ouvertes < self.taille_min:
+                self._libres.append((self._ouvrir(), time.monotonic()))
+                self._ouvertes += 1
+            self._condition.notify_all()
+
+    def acquerir(self):
+        """Emprunter une connexion, en attendant au plus `delai_attente` secondes
+
+        Une connexion libre est retirée du pool sous verrou puis vérifiée sans lui :
+        un SELECT 1 sur une connexion réseau morte ne bloque pas les autres threads.
+        """
+        echeance = time.monotonic() + self.delai_attente
+        a_attendu = False
+        with self._condition:
+            self._verifier_processus()
+            self._stats["emprunts"] += 1
+        while True:
+            with self._condition:
+                while True:
+                    if self._libres:
+                        conn, dernier_usage = self._libres.pop()
+                        break
+
+                    if self._ouvertes < self.taille_max:
+                        # On réserve la place avant d'ouvrir pour ne pas dépasser la taille maximale
+                        self._ouvertes += 1
+                        conn = None
+                        break
+
+                    restant = echeance - time.monotonic()
+                    if restant <= 0:
+                        self._stats["expirations"] += 1
+                        POOL_EPUISE.inc()
+                        raise PoolEpuise(
+                            f"Aucune connexion disponible après {self.delai_attente} s "
+                            f"({self._ouvertes}/{self.taille_max} connexions utilisées)"
+                        )
+                    if not a_attendu:
+                        self._stats["attentes"] += 1
+                        a_attendu = True
+                    self._condition.wait(restant)
+
+            if conn is None:
+                break
+            # La connexion retirée reste comptée dans _ouvertes : sa place est réservée
+            if self._est_valide(conn, dernier_usage):
+                return conn
+            with self._condition:
+                self._stats["verifications_echouees"] += 1
+                self._fermer(conn)
+                self._ouvertes -= 1
+                self._condition.notify()
+
+        try:
+            return self._ouvrir()
+        except Exception:
+            with self._condition:
+                self._ouvertes -= 1
+                self._condition.notify()
+            raise
+
+    def liberer(self, conn, invalide=False):
+        """Rendre une connexion au pool, ou la fermer si elle est inutilisable"""
+        with self._condition:
+            if self._pid != os.getpid():
+                return
+            if invalide or conn.closed or conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                self._fermer(conn)
+                self._ouvertes -= 1
+            else:
+                self._libres.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connexion(self):
+        """Emprunter une connexion le temps d'une transaction (commit ou rollback automatique)"""
+        with self.transaction(self.acquerir()) as conn:
+            yield conn
+
+    @contextmanager
+    def transaction(self, conn):
+        """Terminer la transaction d'une connexion empruntée (commit ou rollback) et la rendre"""
+        invalide = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # BaseException : couvre aussi GeneratorExit quand un flux est interrompu
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                invalide = True
+            raise
+        finally:
+            self.liberer(conn, invalide=invalide)
+
+    def stats(self):
+        """Obtenir l'état du pool (taille, connexions libres et compteurs)"""
+        with self._condition:
+            self._verifier_processus()
+            libres = len(self._libres)
+            return {
+                "taille_min": self.taille_min,
+                "taille_max": self.taille_max,
+                "ouvertes": self._ouvertes,
+                "libres": libres,
+                "utilisees": self._ouvertes - libres,
+                **self._stats,
+            }
+
+    def fermer(self):
+        """Fermer toutes les connexions libres du pool"""
+        with self._condition:
+            while self._libres:
+                conn, _ = self._libres.pop()
+                self._fermer(conn)
+                self._ouvertes -= 1
+            self._condition.notify_all()
+
+
+class RepartiteurLectures:
+    """Répartir les lectures entre les réplicas PostgreSQL, à défaut sur le primaire
+
+    Chaque réplica a son propre PoolConnexions ; une lecture va au réplica
+    disponible qui a le moins de connexions empruntées. Un réplica injoignable
+    est écarté `delai_exclusion` secondes (doublé à chaque échec consécutif,
+    60 s au plus) ; son retard de réplication est vérifié au plus toutes les
+    `intervalle_verification` secondes et il est écarté s'il dépasse `retard_max`.
+    """
+
+    def __init__(self, pools, primaire, retard_max=5.0, intervalle_verification=5.0, delai_exclusion=5.0):
+        self.primaire = primaire
+        self.retard_max = retard_max
+        self.intervalle_verification = intervalle_verification
+        self.delai_exclusion = delai_exclusion
+        self._verrou = threading.Lock()
+        self._tour = 0
+        self._repliques = [
+            {"pool": pool, "hote": "{host}:{port}".format(**pool.db_params), "exclu_jusqu_a": 0.0, "echecs": 0,
+             "verifie_a": 0.0, "retard": None}
+            for pool in pools
+        ]
+
+    def _candidats(self):
+        """Réplicas disponibles, le moins chargé en premier (à charge égale, chacun son tour)"""
+        maintenant = time.monotonic()
+        with self._verrou:
+            self._tour = (self._tour + 1) % len(self._repliques)
+            ordre = self._repliques[self._tour:] + self._repliques[:self._tour]
+            disponibles = [replique for replique in ordre if replique["exclu_jusqu_a"] <= maintenant]
+        return sorted(disponibles, key=lambda replique: replique["pool"].stats()["utilisees"])
+
+    def _exclure(self, replique, raison, duree=None):
+        with self._verrou:
+            if duree is None:
+                replique["echecs"] += 1
+                duree = min(self.delai_exclusion * 2 ** (replique["echecs"] - 1), 60.0)
+            replique["exclu_jusqu_a"] = time.monotonic() + duree
+        EXCLUSIONS_REPLIQUE.labels(raison).inc()
+        logger.warning("Réplica écarté", extra={"replique": replique["hote"], "raison": raison, "duree_s": duree})
+
+    def _verifier_retard(self, replique, conn):
+        """Mesurer le retard de réplication (0 si tout le WAL reçu est rejoué) ; faux s'il est trop grand"""
+        if time.monotonic() - replique["verifie_a"] < self.intervalle_verification:
+            return True
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+            """)
+            retard = float(cursor.fetchone()[0])
+        conn.rollback()
+        with self._verrou:
+            replique["verifie_a"] = time.monotonic()
+            replique["retard"] = retard
+            replique["echecs"] = 0
+        if retard > self.retard_max:
+            self._exclure(replique, "lag", self.intervalle_verification)
+            return False
+        return True
+
+    def _acquerir(self):
+        for replique in self._candidats():
+            pool = replique["pool"]
+            try:
+                conn = pool.acquerir()
+            except PoolEpuise:
+                continue
+            except psycopg2.OperationalError:
+                self._exclure(replique, "error")
+                continue
+            try:
+                if self._verifier_retard(replique, conn):
+                    return replique, conn
+                pool.liberer(conn)
+            except psycopg2.Error:
+                pool.liberer(conn, invalide=True)
+                self._exclure(replique, "error")
+        return None, None
+
+    @contextmanager
+    def connexion(self):
+        """Emprunter une connexion de lecture (réplica, ou primaire si aucun n'est disponible)"""
+        replique, conn = self._acquerir()
+        if replique is None:
+            LECTURES.labels("primary").inc()
+            with self.primaire.connexion() as conn:
+                yield conn
+            return
+
+        LECTURES.labels("replica").inc()
+        try:
+            with replique["pool"].transaction(conn):
+                yield conn
+        except psycopg2.OperationalError:
+            # Connexion coupée en cours de lecture : le réplica est écarté pour les suivantes
+            self._exclure(replique, "error")
+            raise
+
+    def stats(self):
+        maintenant = time.monotonic()
+        with self._verrou:
+            etats = [dict(replique) for replique in self._repliques]
+        return [
+            {
+                "hote": etat["hote"],
+                "disponible": etat["exclu_jusqu_a"] <= maintenant,
+                "retard_s": etat["retard"],
+                "pool": etat["pool"].stats(),
+            }
+            for etat in etats
+        ]
+
+    def fermer(self):
+        """Fermer les connexions libres de tous les réplicas"""
+        for replique in self._repliques:
+            replique["pool"].fermer()
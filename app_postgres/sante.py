@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("librairie.sante")
+
+
+class SurveillanceSante:
+    """État de la base vérifié en arrière-plan, lu sans I/O par /readyz
+
+    Toutes les HEALTH_CHECK_INTERVAL secondes, `verifier()` emprunte une connexion
+    du pool, exécute SELECT 1 et renvoie l'état du pool. Le service n'est pas prêt
+    si la vérification échoue ou dure plus de HEALTH_MAX_LATENCY_MS (attente d'une
+    connexion comprise), si la part de connexions empruntées atteint
+    HEALTH_MAX_POOL_SATURATION, ou si la dernière vérification est trop ancienne
+    (vérification bloquée). Une vérification par processus, quel que soit le
+    nombre de sondes.
+
+    `asynchrone` : `verifier` est une coroutine, vérifiée par la tâche surveiller()
+    que l'application lance dans sa boucle d'événements, et non par un thread.
+    """
+
+    def __init__(self, verifier, asynchrone=False):
+        self.verifier = verifier
+        self.asynchrone = asynchrone
+        self.intervalle = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+        self.latence_max = float(os.getenv("HEALTH_MAX_LATENCY_MS", "1000")) / 1000
+        self.saturation_max = float(os.getenv("HEALTH_MAX_POOL_SATURATION", "1"))
+        self._verrou = threading.Lock()
+        self._etat = None
+        self._pid = None
+        self._premiere = threading.Event()
+
+    def demarrer(self):
+        """Lancer le thread de vérification de ce processus ; faux s'il tourne déjà"""
+        with self._verrou:
+            # Un thread par processus : il ne survit pas au fork des workers
+            if self._pid == os.getpid():
+                return False
+            self._pid = os.getpid()
+            self._etat = None
+            self._premiere = threading.Event()
+        threading.Thread(target=self._boucle, name="surveillance-sante", daemon=True).start()
+        return True
+
+    def _boucle(self):
+        while True:
+            debut = time.perf_counter()
+            try:
+                stats = self.verifier()
+            except Exception as e:
+                self._enregistrer(time.perf_counter() - debut, erreur=e)
+            else:
+                self._enregistrer(time.perf_counter() - debut, stats)
+            time.sleep(self.intervalle)
+
+    async def surveiller(self):
+        """Boucle de vérification d'une application asynchrone"""
+        while True:
+            debut = time.perf_counter()
+            try:
+                stats = await self.verifier()
+            except Exception as e:
+                self._enregistrer(time.perf_counter() - debut, erreur=e)
+            else:
+                self._enregistrer(time.perf_counter() - debut, stats)
+            await asyncio.sleep(self.intervalle)
+
+    def _enregistrer(self, duree, stats=None, erreur=None):
+        raisons = []
+        if erreur is not None:
+            raisons.append(f"base injoignable : {erreur}")
+        else:
+            if duree > self.latence_max:
+                raisons.append(f"vérification en {duree * 1000:.0f} ms (seuil {self.latence_max * 1000:.0f} ms)")
+            if stats["utilisees"] >= self.saturation_max * stats["taille_max"]:
+                raisons.append(f"pool saturé ({stats['utilisees']}/{stats['taille_max']} connexions empruntées)")
+        etat = {
+            "pret": not raisons,
+            "raisons": raisons,
+            "latence_ms": round(duree * 1000, 2),
+            "pool": stats,
+            "verifie_a": time.monotonic(),
+        }
+        with self._verrou:
+            precedent = self._etat
+            self._etat = etat
+        self._premiere.set()
+        # Journaliser les changements d'état (un échec dès la première vérification compris)
+        if (precedent["pret"] if precedent is not None else True) != etat["pret"]:
+            if etat["pret"]:
+                logger.info("Service de nouveau prêt")
+            else:
+                logger.warning("Service non prêt", extra={"raisons": raisons})
+
+    def etat(self):
+        """Dernier état connu, sans accès à la base (la vérification démarre au premier appel)"""
+        if not self.asynchrone and self.demarrer():
+            # Premier appel dans ce processus : laisser une chance à la première vérification
+            self._premiere.wait(self.latence_max)
+        with self._verrou:
+            etat = self._etat
+        if etat is None:
+            return {"pret": False, "raisons": ["première vérification en cours"]}
+
+        age = time.monotonic() - etat["verifie_a"]
+        resultat = {cle: valeur for cle, valeur in etat.items() if cle != "verifie_a"}
+        resultat["age_s"] = round(age, 2)
+        # Une vérification bloquée (pool ou réseau) ne laisse pas un ancien état "prêt"
+        if age > 3 * self.intervalle + self.latence_max:
+            resultat["pret"] = False
+            resultat["raisons"] = [*etat["raisons"], f"aucune vérification depuis {age:.0f} s"]
+        return resultat
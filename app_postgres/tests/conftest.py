@@ -0,0 +1,106 @@
+import importlib
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Les modules de l'application s'importent par leur nom (comme dans l'image Docker)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def module_main():
+    """Module main importé sans base : pas de migration, librairie CGI factice
+
+    Toute connexion échoue aussitôt (socket inexistant) : un test qui atteint la base
+    sans l'avoir remplacée le signale par une erreur plutôt que d'écrire quelque part.
+    """
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("DB_AUTO_MIGRATE", "false")
+        patch.setenv("DB_HOST", "/nonexistent")
+        patch.setenv("DB_REPLICA_HOSTS", "")
+        patch.setenv("CACHE_TTL", "0")
+        import librairie
+        patch.setattr(librairie.Librairie, "obtenir_ou_creer",
+                      classmethod(lambda cls, *args, **kwargs: SimpleNamespace(id=1, nom="CGI")))
+        return importlib.import_module("main")
+
+
+@pytest.fixture
+def client(module_main):
+    return module_main.app.test_client()
+
+
+class Horloge:
+    """Remplace le module time : le temps n'avance que sur demande"""
+
+    def __init__(self, instant=1000.0):
+        self.instant = instant
+
+    def monotonic(self):
+        return self.instant
+
+    def time(self):
+        return self.instant
+
+
+@pytest.fixture
+def modules_horloge():
+    """Modules dont le module time est remplacé par la fixture horloge (à redéfinir par fichier de tests)"""
+    return ()
+
+
+@pytest.fixture
+def horloge(monkeypatch, modules_horloge):
+    horloge = Horloge()
+    for module in modules_horloge:
+        monkeypatch.setattr(module, "time", horloge)
+    return horloge
+
+
+class CurseurFactice:
+    """Curseur psycopg2 factice : enregistre les requêtes (espaces normalisés) et leurs paramètres
+
+    `repondre(requete, params)` donne les lignes que fetchall et fetchone liront ensuite.
+    """
+
+    def __init__(self, repondre=None, rowcount=1):
+        self.repondre = repondre or (lambda requete, params: [])
+        self.rowcount = rowcount
+        self.requetes = []
+        self._lignes = []
+
+    def execute(self, requete, params=None):
+        requete = " ".join(requete.split())
+        self.requetes.append((requete, params))
+        self._lignes = list(self.repondre(requete, params))
+
+    executer_prepare = execute
+
+    def fetchall(self):
+        return self._lignes
+
+    def fetchone(self):
+        return self._lignes[0] if self._lignes else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@pytest.fixture
+def creer_curseur():
+    """Fabrique de CurseurFactice, pour un test qui en utilise plusieurs"""
+    return CurseurFactice
+
+
+@pytest.fixture
+def curseur(request, creer_curseur):
+    """CurseurFactice, construit avec les arguments de parametrize("curseur", ..., indirect=True)"""
+    return creer_curseur(**getattr(request, "param", {}))
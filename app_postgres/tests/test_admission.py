@@ -0,0 +1,150 @@
+import logging
+
+import pytest
+from flask import Flask, Response, request
+
+import admission
+from admission import SeauxJetons, controler_admission, instant_reception
+
+
+@pytest.fixture
+def modules_horloge():
+    return (admission,)
+
+
+def test_seau_rafale_puis_attente(horloge):
+    seaux = SeauxJetons(debit=2, capacite=3)
+    assert [seaux.prendre("a") for _ in range(3)] == [0, 0, 0]
+    assert seaux.prendre("a") == pytest.approx(0.5)
+    # Un autre client a son propre seau
+    assert seaux.prendre("b") == 0
+
+
+def test_seau_jetons_rendus_au_debit(horloge):
+    seaux = SeauxJetons(debit=2, capacite=1)
+    assert seaux.prendre("a") == 0
+    assert seaux.prendre("a") > 0
+    horloge.instant += 0.5
+    assert seaux.prendre("a") == 0
+    # Jamais plus de jetons que la capacité, même après une longue absence
+    horloge.instant += 60
+    assert seaux.prendre("a") == 0
+    assert seaux.prendre("a") > 0
+
+
+def test_seau_oublie_les_clients_les_moins_recents(horloge):
+    seaux = SeauxJetons(debit=1, capacite=1, max_clients=2)
+    for client in ("a", "b", "a", "c"):
+        seaux.prendre(client)
+    # "b" a été oublié : il repart d'un seau plein, "a" non
+    assert seaux.prendre("b") == 0
+    assert seaux.prendre("c") > 0
+
+
+@pytest.mark.parametrize("entete, attendu", [
+    ("t=1700000000.5", 1700000000.5),
+    ("t=1700000000500", 1700000000.5),
+    ("1700000000500000", 1700000000.5),
+    ("", None),
+    (None, None),
+    ("t=demain", None),
+])
+def test_instant_reception(entete, attendu):
+    assert instant_reception(entete) == (pytest.approx(attendu) if attendu is not None else None)
+
+
+def creer_app(monkeypatch, proxys_de_confiance=2, **variables):
+    for nom in ("RATE_LIMIT_PER_SECOND", "RATE_LIMIT_BURST", "EXPENSIVE_MAX_CONCURRENCY",
+                "EXPENSIVE_MAX_WAIT_MS", "MAX_QUEUE_TIME_MS", "RETRY_AFTER_SECONDS"):
+        monkeypatch.delenv(nom, raising=False)
+    for nom, valeur in variables.items():
+        monkeypatch.setenv(nom, valeur)
+
+    app = Flask(__name__)
+    reponses_imbriquees = []
+
+    @app.route("/lecture")
+    def lecture():
+        return "ok"
+
+    @app.route("/health")
+    def health_check():
+        return "ok"
+
+    @app.route("/recherche")
+    def recherche():
+        # Une seconde requête coûteuse pendant que celle-ci tient sa place
+        if "imbriquee" not in request.args:
+            reponses_imbriquees.append(app.test_client().get("/recherche?imbriquee=1"))
+        return "ok"
+
+    @app.route("/export")
+    def export():
+        return Response(iter(["a\n", "b\n"]), mimetype="text/plain")
+
+    controler_admission(app, couteuses={"recherche", "export"}, exemptees={"health_check"},
+                        proxys_de_confiance=proxys_de_confiance)
+    return app, reponses_imbriquees
+
+
+def test_admission_debit_par_client(monkeypatch, horloge):
+    app, _ = creer_app(monkeypatch, RATE_LIMIT_PER_SECOND="1", RATE_LIMIT_BURST="2")
+    client = app.test_client()
+    assert [client.get("/lecture").status_code for _ in range(3)] == [200, 200, 429]
+    refus = client.get("/lecture")
+    assert refus.headers["Retry-After"] == "1"
+    assert refus.get_json() == {"error": "Trop de requêtes"}
+    # Autre adresse, autre seau ; les sondes ne sont jamais limitées
+    assert client.get("/lecture", environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
+    assert client.get("/health").status_code == 200
+
+
+def test_admission_debit_sans_proxys_de_confiance(monkeypatch, caplog):
+    with caplog.at_level(logging.WARNING, logger="librairie.admission"):
+        creer_app(monkeypatch, proxys_de_confiance=0, RATE_LIMIT_PER_SECOND="10")
+    assert "TRUSTED_PROXIES" in caplog.text
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="librairie.admission"):
+        creer_app(monkeypatch, proxys_de_confiance=0)
+    assert caplog.text == ""
+
+
+def test_admission_routes_couteuses(monkeypatch):
+    app, imbriquees = creer_app(monkeypatch, EXPENSIVE_MAX_CONCURRENCY="1", EXPENSIVE_MAX_WAIT_MS="0",
+                                RETRY_AFTER_SECONDS="3")
+    client = app.test_client()
+    assert client.get("/recherche").status_code == 200
+    assert imbriquees[0].status_code == 503
+    assert imbriquees[0].headers["Retry-After"] == "3"
+    # La place est rendue à la fin de chaque requête
+    assert client.get("/recherche").status_code == 200
+    assert imbriquees[1].status_code == 503
+
+
+def test_admission_place_tenue_pendant_le_flux(monkeypatch):
+    app, _ = creer_app(monkeypatch, EXPENSIVE_MAX_CONCURRENCY="1", EXPENSIVE_MAX_WAIT_MS="0")
+    client = app.test_client()
+    export = client.get("/export", buffered=False)
+    # Corps pas encore envoyé : la place reste prise
+    assert client.get("/recherche?imbriquee=1").status_code == 503
+    assert export.get_data() == b"a\nb\n"
+    export.close()
+    assert client.get("/recherche?imbriquee=1").status_code == 200
+
+
+def test_admission_routes_couteuses_sans_limite_par_defaut(monkeypatch):
+    app, imbriquees = creer_app(monkeypatch)
+    assert app.test_client().get("/recherche").status_code == 200
+    assert imbriquees[0].status_code == 200
+
+
+def test_admission_temps_en_file(monkeypatch, horloge):
+    app, _ = creer_app(monkeypatch, MAX_QUEUE_TIME_MS="100")
+    client = app.test_client()
+    recente = {"X-Request-Start": f"t={horloge.instant - 0.05}"}
+    ancienne = {"X-Request-Start": f"t={horloge.instant - 0.5}"}
+    assert client.get("/lecture", headers=recente).status_code == 200
+    assert client.get("/lecture", headers=ancienne).status_code == 503
+    assert client.get("/health", headers=ancienne).status_code == 200
+    # Sans en-tête, la requête n'est pas refusée
+    assert client.get("/lecture").status_code == 200
@@ -0,0 +1,108 @@
+import pytest
+
+import cache
+from cache import PORTEE_TOUTES, CacheLRU
+
+
+@pytest.fixture
+def modules_horloge():
+    return (cache,)
+
+
+class Calcul:
+    """Valeur à mettre en cache : compte ses appels"""
+
+    def __init__(self, valeur):
+        self.valeur = valeur
+        self.appels = 0
+
+    def __call__(self):
+        self.appels += 1
+        return self.valeur
+
+
+def test_cache_succes_puis_expiration(horloge):
+    lru = CacheLRU(taille_max=10, duree_vie=30)
+    calcul = Calcul("livres")
+    assert lru.obtenir((1, "livres"), calcul) == "livres"
+    assert lru.obtenir((1, "livres"), calcul) == "livres"
+    assert calcul.appels == 1
+    horloge.instant += 30
+    assert lru.obtenir((1, "livres"), calcul) == "livres"
+    assert calcul.appels == 2
+    assert lru.stats() == {"entrees": 1, "taille_max": 10, "succes": 1, "echecs": 2, "taux_succes": 0.3333}
+
+
+def test_cache_evince_l_entree_la_moins_recente(horloge):
+    lru = CacheLRU(taille_max=2, duree_vie=30)
+    calculs = {cle: Calcul(cle) for cle in ((1, "a"), (2, "a"), (3, "a"))}
+    lru.obtenir((1, "a"), calculs[(1, "a")])
+    lru.obtenir((2, "a"), calculs[(2, "a")])
+    # (1, "a") relue : c'est (2, "a") la moins récente
+    lru.obtenir((1, "a"), calculs[(1, "a")])
+    lru.obtenir((3, "a"), calculs[(3, "a")])
+    for cle in calculs:
+        lru.obtenir(cle, calculs[cle])
+    assert [calculs[cle].appels for cle in calculs] == [1, 2, 2]
+    assert lru.stats()["entrees"] == 2
+
+
+@pytest.mark.parametrize("taille_max, duree_vie", [(0, 30), (10, 0)])
+def test_cache_inactif(horloge, taille_max, duree_vie):
+    lru = CacheLRU(taille_max=taille_max, duree_vie=duree_vie)
+    calcul = Calcul("x")
+    lru.obtenir((1, "a"), calcul)
+    lru.obtenir((1, "a"), calcul)
+    assert not lru.actif
+    assert calcul.appels == 2
+
+
+def test_cache_invalider_une_librairie(horloge):
+    lru = CacheLRU()
+    calculs = {cle: Calcul(cle) for cle in ((1, "livres"), (1, "librairie"), (2, "livres"), (PORTEE_TOUTES, "librairies"))}
+    for cle, calcul in calculs.items():
+        lru.obtenir(cle, calcul)
+    lru.invalider(1)
+    for cle, calcul in calculs.items():
+        lru.obtenir(cle, calcul)
+    # La librairie 1 et la liste des librairies sont recalculées, pas la librairie 2
+    assert [calcul.appels for calcul in calculs.values()] == [2, 2, 1, 2]
+    assert lru.modifiee_recemment(1, 5)
+    assert lru.modifiee_recemment(PORTEE_TOUTES, 5)
+    assert not lru.modifiee_recemment(2, 5)
+    horloge.instant += 10
+    assert not lru.modifiee_recemment(1, 5)
+
+
+def test_cache_invalider_tout(horloge):
+    lru = CacheLRU()
+    calcul = Calcul("x")
+    lru.obtenir((1, "a"), calcul)
+    lru.obtenir((2, "a"), calcul)
+    lru.invalider()
+    assert lru.stats()["entrees"] == 0
+    assert lru.modifiee_recemment(2, 5)
+    lru.obtenir((2, "a"), calcul)
+    assert calcul.appels == 3
+
+
+def test_cache_valeur_calculee_pendant_une_invalidation(horloge):
+    lru = CacheLRU()
+
+    def calcul_perime():
+        # Une écriture invalide la librairie pendant le calcul : la valeur n'est pas gardée
+        lru.invalider(1)
+        return "ancienne"
+
+    assert lru.obtenir((1, "livres"), calcul_perime) == "ancienne"
+    calcul = Calcul("nouvelle")
+    assert lru.obtenir((1, "livres"), calcul) == "nouvelle"
+    assert calcul.appels == 1
+
+    # Une invalidation d'une autre librairie ne concerne pas le calcul
+    def calcul_autre():
+        lru.invalider(2)
+        return "valeur"
+
+    lru.obtenir((3, "livres"), calcul_autre)
+    assert lru.obtenir((3, "livres"), Calcul("jamais")) == "valeur"
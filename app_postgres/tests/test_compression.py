@@ -0,0 +1,42 @@
+import gzip
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from compression import CODAGES, TAILLE_MIN, choisir_codage, compresser
+
+
+def requete(accept_encoding=None):
+    entetes = {"Accept-Encoding": accept_encoding} if accept_encoding is not None else {}
+    return EnvironBuilder(headers=entetes).get_request()
+
+
+@pytest.mark.parametrize("accept_encoding, attendu", [
+    ("gzip, deflate", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br, gzip", CODAGES[0]),
+    ("gzip, br", CODAGES[0]),
+    ("*", CODAGES[0]),
+    ("deflate", None),
+    ("identity", None),
+    ("gzip;q=0", None),
+    ("*;q=0", None),
+    ("", None),
+    (None, None),
+])
+def test_choisir_codage(accept_encoding, attendu):
+    assert choisir_codage(requete(accept_encoding), TAILLE_MIN) == attendu
+
+
+def test_choisir_codage_petit_corps():
+    assert choisir_codage(requete("gzip, br"), TAILLE_MIN - 1) is None
+
+
+@pytest.mark.parametrize("codage", CODAGES)
+def test_compresser_deterministe(codage):
+    corps = b'["Germinal","Nana"]\n' * 100
+    compresse = compresser(corps, codage)
+    assert compresse == compresser(corps, codage)
+    assert len(compresse) < len(corps)
+    if codage == "gzip":
+        assert gzip.decompress(compresse) == corps
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from flux_livres import ANNEE_MAX, ANNEE_MIN, LectureLivres, lire_csv, lire_jsonl, normaliser_livre, ouvrir_texte
+
+
+def test_normaliser_livre_complet():
+    livre = {"titre": "  Germinal ", "auteur": " Zola ", "isbn": "978-2", "annee_publication": "1885"}
+    assert normaliser_livre(livre) == ("Germinal", "Zola", "978-2", 1885)
+
+
+def test_normaliser_livre_nom_livre_et_champs_vides():
+    assert normaliser_livre({"nomLivre": "Nana", "auteur": "", "annee_publication": None}) == ("Nana", None, None, None)
+
+
+@pytest.mark.parametrize("livre", [
+    None,
+    "Germinal",
+    {},
+    {"titre": "   "},
+    {"titre": 42},
+    {"titre": "Germinal", "auteur": ["Zola"]},
+    {"titre": "x" * 201},
+    {"titre": "Germinal", "isbn": "9" * 21},
+])
+def test_normaliser_livre_rejete(livre):
+    assert normaliser_livre(livre) is None
+
+
+@pytest.mark.parametrize("annee", ["mil huit cent", [1885], 2 ** 31, -(2 ** 31) - 1, ANNEE_MAX + 1, ANNEE_MIN - 1, float("inf")])
+def test_normaliser_livre_annee_rejetee(annee):
+    assert normaliser_livre({"titre": "Germinal", "annee_publication": annee}) is None
+
+
+@pytest.mark.parametrize("annee", [ANNEE_MIN, -800, 0, ANNEE_MAX])
+def test_normaliser_livre_annee_bornes(annee):
+    assert normaliser_livre({"titre": "Germinal", "annee_publication": annee})[3] == annee
+
+
+def test_lire_jsonl_lignes_illisibles():
+    flux = io.StringIO('{"titre": "A"}\n\npas du json\n[1, 2]\n{"titre": "B"}\n')
+    assert list(lire_jsonl(flux)) == [{"titre": "A"}, None, None, {"titre": "B"}]
+
+
+def test_lire_csv_entete():
+    flux = io.StringIO("titre,auteur,isbn,annee_publication\nGerminal,Zola,,1885\n")
+    assert [normaliser_livre(livre) for livre in lire_csv(flux)] == [("Germinal", "Zola", None, 1885)]
+
+
+def test_lecture_livres_arretee_a_la_premiere_erreur():
+    flux = ouvrir_texte(io.BytesIO(b'{"titre": "A"}\n\xff\n{"titre": "B"}\n'))
+    livres = LectureLivres(lire_jsonl(flux))
+    # Erreur de décodage : la ligne fautive compte comme rejetée, la lecture s'arrête
+    assert list(livres) == [None]
+    assert isinstance(livres.erreur, UnicodeDecodeError)
+
+    livres = LectureLivres(lire_csv(io.StringIO("titre\nA\nB\n")))
+    assert [livre["titre"] for livre in livres] == ["A", "B"]
+    assert livres.erreur is None
@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from librairie import LibrairieDB, mesure_db
+from pool import methode_courante
+
+
+def test_mesure_db_methode_courante():
+    @mesure_db
+    def _compter():
+        return methode_courante.get()
+
+    assert _compter() == "compter"
+    assert methode_courante.get() is None
+
+
+def test_mesure_db_generateur_methode_courante():
+    @mesure_db
+    def parcourir():
+        for _ in range(2):
+            yield methode_courante.get()
+
+    generateur = parcourir()
+    assert next(generateur) == "parcourir"
+    assert list(generateur) == ["parcourir"]
+    assert methode_courante.get() is None
+
+    # Générateur fermé avant son épuisement
+    generateur = parcourir()
+    next(generateur)
+    generateur.close()
+    assert methode_courante.get() is None
+
+
+def etat_initial(presents, catalogue):
+    """Réponses du curseur : état initial des titres (clé, présent dans la librairie, au catalogue)"""
+    def repondre(requete, params):
+        if "WITH ORDINALITY" in requete:
+            return [(cle, cle in presents, cle in catalogue) for cle in (titre.lower() for titre in params[0])]
+        return []
+    return repondre
+
+
+def retraits(curseur):
+    """Clés des titres retirés de la librairie"""
+    return [cle for requete, params in curseur.requetes if requete.startswith("DELETE") for cle in params[1]]
+
+
+class PoolFactice:
+    def __init__(self, curseur):
+        self.curseur = curseur
+
+    @contextmanager
+    def connexion(self):
+        yield SimpleNamespace(cursor=lambda: self.curseur)
+
+
+def creer_db(curseur, isbns_pris=()):
+    db = LibrairieDB()
+    db._pool = PoolFactice(curseur)
+    # Cache inactif : pas d'écoute des invalidations
+    db._cache = SimpleNamespace(actif=False, invalidations=[])
+    db._cache.invalider = db._cache.invalidations.append
+    db.crees, db.lies = [], []
+
+    def creer_livres(cursor, lignes):
+        db.crees.extend(lignes)
+        return {titre.lower() for titre, _, isbn, _ in lignes if isbn in isbns_pris}
+
+    def lier_titres(cursor, librairie_id, cles):
+        db.lies.extend(cles)
+        return len(cles)
+
+    db._creer_livres, db._lier_titres = creer_livres, lier_titres
+    return db
+
+
+@pytest.mark.parametrize("curseur", [{"repondre": etat_initial(presents={"germinal"}, catalogue={"germinal", "nana"})}],
+                         indirect=True)
+def test_appliquer_operations_lot_avec_ajout_rejete(curseur):
+    db = creer_db(curseur, isbns_pris={"978-1"})
+    resultats = db.appliquer_operations(7, [
+        {"op": "add", "titre": "Thérèse Raquin", "isbn": "978-1"},
+        {"op": "remove", "titre": "Thérèse Raquin"},
+        {"op": "add", "titre": "Thérèse Raquin", "isbn": "978-1"},
+        {"op": "add", "nomLivre": "Nana"},
+        {"op": "remove", "titre": "Germinal"},
+        {"op": "add", "titre": "GERMINAL"},
+        {"op": "move", "titre": "Nana"},
+        {"op": "add", "titre": "Candide"},
+        {"op": "remove", "titre": "Candide"},
+    ])
+    assert resultats == [
+        "rejete", "absent", "rejete", "ajoute", "supprime", "ajoute", "invalide", "ajoute", "supprime",
+    ]
+    # Seuls les livres absents du catalogue sont créés, une fois chacun
+    assert [ligne[0] for ligne in db.crees] == ["Thérèse Raquin", "Candide"]
+    # Germinal retiré puis remis, Candide ajouté puis retiré : aucun lien écrit pour eux
+    assert db.lies == ["nana"]
+    assert retraits(curseur) == []
+    assert db._cache.invalidations == [7]
+
+
+@pytest.mark.parametrize("curseur", [{"repondre": etat_initial(presents={"nana"}, catalogue={"nana"})}], indirect=True)
+def test_appliquer_operations_retrait_apres_ajout_rejete_d_un_titre_present(curseur):
+    db = creer_db(curseur, isbns_pris={"978-1"})
+    resultats = db.appliquer_operations(7, [
+        {"op": "add", "titre": "Candide", "isbn": "978-1"},
+        {"op": "remove", "titre": "Candide"},
+        {"op": "remove", "titre": "Nana"},
+    ])
+    assert resultats == ["rejete", "absent", "supprime"]
+    assert db.lies == []
+    assert retraits(curseur) == ["nana"]
@@ -0,0 +1,161 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+
+@pytest.fixture
+def lots(module_main, monkeypatch):
+    """Lots d'import fusionnés, sans base : chaque ligne valide compte comme insérée"""
+    lots = []
+
+    def fusionner_lot(librairie_id, lot, rapport):
+        lots.append(list(lot))
+        rapport["inseres"] += len(lot)
+
+    monkeypatch.setattr(module_main.db, "_fusionner_lot", fusionner_lot)
+    return lots
+
+
+def lignes_jsonl(nombre):
+    return "".join(json.dumps({"titre": f"Livre {i}"}) + "\n" for i in range(nombre)).encode()
+
+
+def test_bulk_import_complet(client, lots):
+    reponse = client.post("/livres/bulk", data=lignes_jsonl(3) + b"pas du json\n")
+    assert reponse.status_code == 200
+    assert reponse.get_json() == {"inseres": 3, "doublons": 0, "rejetes": 1, "livres_crees": 0}
+
+
+def test_bulk_utf8_invalide_en_cours_de_flux(client, lots):
+    corps = lignes_jsonl(3000) + b'{"titre": "\xff\xfe"}\n' + lignes_jsonl(10)
+    reponse = client.post("/livres/bulk", data=corps)
+    assert reponse.status_code == 400
+    rapport = reponse.get_json()
+    assert rapport["error"] == "Le corps doit être encodé en UTF-8"
+    # Les lignes lues avant l'erreur sont importées et comptées, la suite est ignorée
+    assert 0 < rapport["inseres"] <= 3000
+    assert rapport["inseres"] == sum(map(len, lots))
+    assert rapport["rejetes"] == 1
+
+
+def test_bulk_csv_illisible(client, lots):
+    corps = "titre,auteur\nGerminal,Zola\n" + "x" * 200_000 + ",y\nNana,Zola\n"
+    reponse = client.post("/livres/bulk?format=csv", data=corps.encode())
+    assert reponse.status_code == 400
+    rapport = reponse.get_json()
+    assert rapport["error"].startswith("CSV illisible")
+    assert (rapport["inseres"], rapport["rejetes"]) == (1, 1)
+    assert lots == [[("Germinal", "Zola", None, None)]]
+
+
+@pytest.fixture
+def titres(module_main, monkeypatch):
+    """Titres ajoutés et retirés par POST et DELETE /livres, sans base"""
+    titres = []
+    monkeypatch.setattr(module_main.db, "ajouter_titre_a_librairie",
+                        lambda librairie_id, titre: titres.append(("add", librairie_id, titre)))
+    monkeypatch.setattr(module_main.db, "supprimer_titre_de_librairie",
+                        lambda librairie_id, titre: titres.append(("remove", librairie_id, titre)))
+    return titres
+
+
+@pytest.mark.parametrize("methode, op", [("POST", "add"), ("DELETE", "remove")])
+def test_livres_nom_livre(client, titres, methode, op):
+    reponse = client.open("/livres", method=methode, json={"nomLivre": "Germinal"})
+    assert reponse.status_code == 204
+    assert titres == [(op, 1, "Germinal")]
+
+
+@pytest.mark.parametrize("methode", ["POST", "DELETE"])
+@pytest.mark.parametrize("corps", [
+    {"data": "pas du json", "content_type": "application/json"},
+    {"data": "Germinal"},
+    {"json": ["Germinal"]},
+    {"json": {}},
+    {"json": {"nomLivre": 3}},
+    {"json": {"nomLivre": None}},
+])
+def test_livres_corps_incorrect(client, titres, methode, corps):
+    reponse = client.open("/livres", method=methode, **corps)
+    assert reponse.status_code == 400
+    assert "nomLivre" in reponse.get_json()["error"]
+    assert titres == []
+
+
+@pytest.mark.parametrize("corps", [
+    {"data": "pas du json", "content_type": "application/json"},
+    {"data": "CGI"},
+    {"json": ["CGI", "Toulouse"]},
+    {"json": "CGI"},
+    {"json": {"nom": "CGI"}},
+    {"json": {"nom": " ", "adresse": "Toulouse"}},
+    {"json": {"nom": "CGI", "adresse": 31}},
+])
+def test_ajouter_librairie_corps_incorrect(client, module_main, monkeypatch, corps):
+    monkeypatch.setattr(module_main.db, "ajouter_librairie", lambda *args: pytest.fail("librairie créée"))
+    reponse = client.post("/librairies", **corps)
+    assert reponse.status_code == 400
+    assert reponse.get_json() == {"error": "nom et adresse doivent être des chaînes de caractères"}
+
+
+def test_liste_json_postgresql_identique_a_jsonify(client, module_main, monkeypatch):
+    titres = ["Été 😀", 'a\x7fb\x01"\\/\t', "Zoé"]
+    # Texte tel que row_to_json et to_json le produisent : compact, non ASCII laissé tel quel
+    texte = "[" + ",".join('"' + t.replace("\\", "\\\\").replace('"', '\\"').replace("\t", "\\t").replace("\x01", "\\u0001") + '"'
+                           for t in titres) + "]"
+    assert json.loads(texte) == titres
+    monkeypatch.setattr(module_main.db, "date_modification", lambda portee: None)
+    monkeypatch.setattr(module_main.db, "lire_page_livres_json", lambda *args, **kwargs: (texte, None))
+    reponse = client.get("/livres", headers={"Accept-Encoding": "identity"})
+    with module_main.app.app_context():
+        assert reponse.get_data() == module_main.jsonify(titres).get_data()
+
+
+MODIFIEE_LE = datetime(2026, 10, 18, 12, 30, 15, 250000, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("entetes, statut", [
+    ({}, 200),
+    ({"If-None-Match": 'W/"v1"'}, 304),
+    ({"If-None-Match": '"v1"'}, 304),
+    ({"If-None-Match": 'W/"v0", W/"v1"'}, 304),
+    ({"If-None-Match": "*"}, 304),
+    ({"If-None-Match": 'W/"v0"'}, 200),
+    # Last-Modified est à la seconde près
+    ({"If-Modified-Since": "Sun, 18 Oct 2026 12:30:15 GMT"}, 304),
+    ({"If-Modified-Since": "Sun, 18 Oct 2026 12:30:14 GMT"}, 200),
+    # If-None-Match l'emporte sur If-Modified-Since
+    ({"If-None-Match": 'W/"v0"', "If-Modified-Since": "Sun, 18 Oct 2026 12:30:15 GMT"}, 200),
+])
+def test_reponse_versionnee(module_main, entetes, statut):
+    appels = []
+
+    def produire():
+        appels.append(1)
+        return module_main.jsonify(["Germinal"])
+
+    with module_main.app.test_request_context(headers=entetes):
+        reponse = module_main.reponse_versionnee("v1", MODIFIEE_LE, produire)
+    assert reponse.status_code == statut
+    # Une réponse 304 ne lit ni ne sérialise rien
+    assert len(appels) == (statut == 200)
+    assert reponse.get_etag() == ("v1", True)
+    assert reponse.last_modified == MODIFIEE_LE.replace(microsecond=0)
+    assert reponse.cache_control.public
+
+
+def test_liste_304_pour_la_version_du_client(client, module_main, monkeypatch):
+    lectures = []
+    monkeypatch.setattr(module_main.db, "date_modification", lambda portee: MODIFIEE_LE)
+    monkeypatch.setattr(module_main.db, "lire_page_livres_json",
+                        lambda *args, **kwargs: lectures.append(1) or ('["Germinal"]', None))
+    reponse = client.get("/livres")
+    assert reponse.status_code == 200
+    etag = reponse.headers["ETag"]
+    assert etag == f'W/"1-{MODIFIEE_LE.timestamp():.6f}"'
+    # Même version demandée compressée : l'ETag faible vaut pour tous les codages
+    reponse = client.get("/livres", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert reponse.status_code == 304
+    assert reponse.get_data() == b""
+    assert lectures == [1]
@@ -0,0 +1,66 @@
+import base64
+import json
+
+import pytest
+
+from pagination import LIMITE_DEFAUT, LIMITE_MAX, decoder_curseur, encoder_curseur, lire_parametres
+
+
+@pytest.mark.parametrize("position", [
+    ("Germinal", 1),
+    ("", 0),
+    ("L'Écume des jours ? & /", 2 ** 40),
+    ("日本語", 7),
+])
+def test_curseur_aller_retour(position):
+    curseur = encoder_curseur(position)
+    # Utilisable tel quel dans une URL
+    assert "=" not in curseur and "+" not in curseur and "/" not in curseur
+    assert decoder_curseur(curseur) == position
+
+
+def encoder_brut(valeur):
+    return base64.urlsafe_b64encode(json.dumps(valeur).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("curseur", [
+    "",
+    "pas du base64 !",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    base64.urlsafe_b64encode(b"pas du json").decode(),
+    encoder_brut(["Germinal"]),
+    encoder_brut(["Germinal", 1, 2]),
+    encoder_brut({"titre": "Germinal", "id": 1}),
+    encoder_brut([1, 1]),
+    encoder_brut(["Germinal", "1"]),
+    encoder_brut(["Germinal", 1.5]),
+    encoder_brut(None),
+])
+def test_curseur_invalide(curseur):
+    with pytest.raises(ValueError, match="Curseur invalide"):
+        decoder_curseur(curseur)
+
+
+def test_lire_parametres_par_defaut():
+    assert lire_parametres({}) == (None, None, None)
+
+
+def test_lire_parametres_complets():
+    curseur = encoder_curseur(("Nana", 3))
+    args = {"limit": "20", "after": curseur, "fields": " titre, ,auteur "}
+    assert lire_parametres(args) == (20, ("Nana", 3), ("titre", "auteur"))
+
+
+def test_lire_parametres_curseur_sans_limite():
+    assert lire_parametres({"after": encoder_curseur(("Nana", 3))})[0] == LIMITE_DEFAUT
+
+
+@pytest.mark.parametrize("limite", ["0", "-1", "abc", "1.5", str(LIMITE_MAX + 1), ""])
+def test_lire_parametres_limite_invalide(limite):
+    with pytest.raises(ValueError, match="limit"):
+        lire_parametres({"limit": limite})
+
+
+def test_lire_parametres_curseur_invalide():
+    with pytest.raises(ValueError, match="Curseur invalide"):
+        lire_parametres({"limit": "10", "after": "xyz"})
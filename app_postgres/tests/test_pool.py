@@ -0,0 +1,164 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+import pool
+from pool import PoolEpuise, RepartiteurLectures
+
+
+@pytest.fixture
+def modules_horloge():
+    return (pool,)
+
+
+@pytest.fixture
+def replica(creer_curseur):
+    return lambda *args, **kwargs: PoolFactice(creer_curseur, *args, **kwargs)
+
+
+class PoolFactice:
+    """Pool d'un réplica : charge, retard de réplication et panne réglables"""
+
+    def __init__(self, creer_curseur, hote, utilisees=0, retard=0.0):
+        self.hote = hote
+        self.db_params = {"host": hote, "port": 5432}
+        self.utilisees = utilisees
+        self.retard = retard
+        # Exception levée par acquerir (réplica injoignable, pool épuisé)
+        self.panne = None
+        self.acquisitions = 0
+        self.liberations = []
+        # Requêtes de vérification du retard, toutes connexions confondues
+        self.curseur = creer_curseur(repondre=lambda requete, params: [(self.retard,)])
+
+    def acquerir(self):
+        self.acquisitions += 1
+        if self.panne is not None:
+            raise self.panne
+        return SimpleNamespace(hote=self.hote, cursor=lambda: self.curseur, rollback=lambda: None)
+
+    def liberer(self, conn, invalide=False):
+        self.liberations.append(invalide)
+
+    @contextmanager
+    def transaction(self, conn):
+        try:
+            yield conn
+        finally:
+            self.liberer(conn)
+
+    def stats(self):
+        return {"utilisees": self.utilisees}
+
+
+class PrimaireFactice:
+    @contextmanager
+    def connexion(self):
+        yield SimpleNamespace(hote="primaire")
+
+
+def creer_repartiteur(*pools):
+    return RepartiteurLectures(list(pools), PrimaireFactice(), retard_max=5.0, intervalle_verification=5.0,
+                               delai_exclusion=5.0)
+
+
+def lire(repartiteur):
+    """Hôte qui a servi une lecture"""
+    with repartiteur.connexion() as conn:
+        return conn.hote
+
+
+def fin_exclusion(repartiteur, indice=0):
+    return repartiteur._repliques[indice]["exclu_jusqu_a"]
+
+
+def test_lecture_sur_le_replica_le_moins_charge(horloge, replica):
+    a, b = replica("a", utilisees=2), replica("b")
+    repartiteur = creer_repartiteur(a, b)
+    assert [lire(repartiteur) for _ in range(3)] == ["b", "b", "b"]
+    b.utilisees = 3
+    assert lire(repartiteur) == "a"
+
+
+def test_lecture_a_tour_de_role_a_charge_egale(horloge, replica):
+    repartiteur = creer_repartiteur(replica("a"), replica("b"))
+    assert [lire(repartiteur) for _ in range(4)] == ["b", "a", "b", "a"]
+
+
+def test_replica_epuise_passe_au_suivant_sans_exclusion(horloge, replica):
+    a, b = replica("a"), replica("b", utilisees=1)
+    a.panne = PoolEpuise("aucune connexion libre")
+    repartiteur = creer_repartiteur(a, b)
+    assert lire(repartiteur) == "b"
+    assert all(etat["disponible"] for etat in repartiteur.stats())
+
+
+def test_replica_injoignable_ecarte_avec_delai_croissant(horloge, replica):
+    a = replica("a")
+    a.panne = psycopg2.OperationalError("injoignable")
+    repartiteur = creer_repartiteur(a)
+    # Lectures sur le primaire : 5 s, puis 10, 20, 40 et jamais plus de 60 s
+    for duree in (5, 10, 20, 40, 60, 60):
+        assert lire(repartiteur) == "primaire"
+        assert fin_exclusion(repartiteur) == horloge.instant + duree
+        assert not repartiteur.stats()[0]["disponible"]
+        acquisitions = a.acquisitions
+        horloge.instant += duree - 0.1
+        # Réplica écarté : pas de nouvelle tentative avant la fin du délai
+        assert lire(repartiteur) == "primaire"
+        assert a.acquisitions == acquisitions
+        horloge.instant += 0.1
+
+    a.panne = None
+    assert lire(repartiteur) == "a"
+    # Vérification réussie : les échecs sont oubliés, le délai repart de 5 s
+    a.panne = psycopg2.OperationalError("injoignable")
+    horloge.instant += 5
+    assert lire(repartiteur) == "primaire"
+    assert fin_exclusion(repartiteur) == horloge.instant + 5
+
+
+def test_replica_en_retard_ecarte(horloge, replica):
+    a = replica("a", retard=12.0)
+    repartiteur = creer_repartiteur(a)
+    assert lire(repartiteur) == "primaire"
+    # La connexion est rendue au pool, encore utilisable
+    assert a.liberations == [False]
+    assert repartiteur.stats()[0]["retard_s"] == 12.0
+    assert fin_exclusion(repartiteur) == horloge.instant + 5
+
+    horloge.instant += 5
+    a.retard = 0.5
+    assert lire(repartiteur) == "a"
+    # Retard vérifié au plus toutes les 5 s : il peut avoir grandi sans être vu
+    a.retard = 30.0
+    horloge.instant += 4.9
+    assert lire(repartiteur) == "a"
+    assert len(a.curseur.requetes) == 2
+    horloge.instant += 0.1
+    assert lire(repartiteur) == "primaire"
+    assert len(a.curseur.requetes) == 3
+
+
+def test_replica_en_erreur_pendant_la_verification(horloge, replica):
+    def connexion_fermee(requete, params):
+        raise psycopg2.InterfaceError("connexion fermée")
+
+    a = replica("a")
+    a.curseur.repondre = connexion_fermee
+    repartiteur = creer_repartiteur(a)
+    assert lire(repartiteur) == "primaire"
+    assert a.liberations == [True]
+    assert fin_exclusion(repartiteur) == horloge.instant + 5
+
+
+def test_replica_coupe_pendant_la_lecture(horloge, replica):
+    a = replica("a")
+    repartiteur = creer_repartiteur(a)
+    with pytest.raises(psycopg2.OperationalError):
+        with repartiteur.connexion():
+            raise psycopg2.OperationalError("connexion perdue")
+    assert not repartiteur.stats()[0]["disponible"]
+    assert lire(repartiteur) == "primaire"
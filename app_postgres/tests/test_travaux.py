@@ -0,0 +1,176 @@
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from travaux import BailPerdu, FileTravaux, WorkerTravaux
+
+
+@pytest.fixture
+def file_travaux(monkeypatch, curseur):
+    for nom, valeur in {"JOBS_MAX_ATTEMPTS": "3", "JOBS_RETRY_DELAY": "5", "JOBS_LEASE_SECONDS": "60"}.items():
+        monkeypatch.setenv(nom, valeur)
+
+    @contextmanager
+    def connexion():
+        yield SimpleNamespace(cursor=lambda: curseur)
+
+    file = FileTravaux(SimpleNamespace(pool=SimpleNamespace(connexion=connexion)))
+    file.curseur = curseur
+    return file
+
+
+def travail(tentatives=1, tentatives_max=3, type_travail="importer_livres"):
+    return {"id": 42, "type": type_travail, "librairie_id": 1, "parametres": {}, "donnees": "",
+            "tentatives": tentatives, "tentatives_max": tentatives_max, "id_requete": None}
+
+
+@pytest.mark.parametrize("tentatives, delai", [(1, 5), (2, 10)])
+def test_echec_remis_en_file_avec_delai_croissant(file_travaux, tentatives, delai):
+    assert file_travaux.echouer(travail(tentatives), "ValueError: boum")
+    requete, params = file_travaux.curseur.requetes[-1]
+    assert "etat = 'en_attente'" in requete
+    # Seule la tentative en cours, encore en_cours, peut changer l'état du travail
+    assert requete.endswith("WHERE id = %s AND tentatives = %s AND etat = 'en_cours'")
+    assert params == ("ValueError: boum", delai, 42, tentatives)
+
+
+def test_echec_de_la_derniere_tentative(file_travaux):
+    assert not file_travaux.echouer(travail(3), "ValueError: boum")
+    requete, params = file_travaux.curseur.requetes[-1]
+    assert "etat = 'echoue'" in requete and "termine_le = now()" in requete
+    assert params == ("ValueError: boum", 42, 3)
+
+
+def test_terminer_efface_les_donnees(file_travaux):
+    file_travaux.terminer(travail(2), {"inseres": 3})
+    requete, params = file_travaux.curseur.requetes[-1]
+    assert "etat = 'termine'" in requete and "donnees = NULL" in requete
+    assert params[0].adapted == {"inseres": 3}
+    assert params[1:] == (42, 2)
+
+
+@pytest.mark.parametrize("operation", [
+    lambda file, t: file.prolonger(t),
+    lambda file, t: file.avancer(t, 10, 100),
+    lambda file, t: file.terminer(t, {}),
+    lambda file, t: file.echouer(t, "erreur"),
+])
+def test_bail_perdu_quand_le_travail_a_ete_repris(file_travaux, operation):
+    file_travaux.curseur.rowcount = 0
+    with pytest.raises(BailPerdu):
+        operation(file_travaux, travail())
+
+
+class FileFactice:
+    """Enregistre les transitions demandées par le worker"""
+
+    def __init__(self, duree_bail=60.0, bail_perdu=False):
+        self.duree_bail = duree_bail
+        self.bail_perdu = bail_perdu
+        self.transitions = []
+        self.prolongations = threading.Event()
+
+    def _transition(self, *transition):
+        if self.bail_perdu:
+            raise BailPerdu("repris")
+        self.transitions.append(transition)
+
+    def prolonger(self, travail):
+        self.prolongations.set()
+        self._transition("prolonger")
+
+    def avancer(self, travail, fait, total=None):
+        self._transition("avancer", fait, total)
+
+    def terminer(self, travail, resultat):
+        self._transition("terminer", resultat)
+
+    def echouer(self, travail, erreur):
+        self._transition("echouer", erreur)
+        return travail["tentatives"] < travail["tentatives_max"]
+
+
+ISSUES = ("termine", "reessai", "echoue", "bail_perdu")
+
+
+def compter_issues(type_travail):
+    return {
+        issue: REGISTRY.get_sample_value("librairie_jobs_processed_total", {"type": type_travail, "outcome": issue}) or 0
+        for issue in ISSUES
+    }
+
+
+def traiter(file, travail, executant):
+    """Traiter un travail ; renvoie le worker et l'issue comptée dans les métriques"""
+    worker = WorkerTravaux(file, db="db", executants={"importer_livres": executant})
+    avant = compter_issues(travail["type"])
+    worker.traiter(travail)
+    apres = compter_issues(travail["type"])
+    issues = [issue for issue in ISSUES if apres[issue] != avant[issue]]
+    assert len(issues) == 1
+    return worker, issues[0]
+
+
+def test_traiter_termine():
+    file = FileFactice()
+
+    def executant(db, travail, avancer):
+        assert db == "db"
+        avancer(5, 10)
+        avancer(10)
+        return {"inseres": 10}
+
+    worker, issue = traiter(file, travail(), executant)
+    assert issue == "termine"
+    assert file.transitions == [("avancer", 5, 10), ("avancer", 10, None), ("terminer", {"inseres": 10})]
+    # Un travail terminé déclenche un rafraîchissement anticipé des statistiques
+    assert worker._ecritures
+
+
+@pytest.mark.parametrize("tentatives, attendue", [(1, "reessai"), (3, "echoue")])
+def test_traiter_echec(tentatives, attendue):
+    file = FileFactice()
+
+    def executant(db, travail, avancer):
+        raise RuntimeError("base indisponible")
+
+    worker, issue = traiter(file, travail(tentatives), executant)
+    assert issue == attendue
+    assert file.transitions == [("echouer", "RuntimeError: base indisponible")]
+    assert not worker._ecritures
+
+
+def test_traiter_type_inconnu():
+    file = FileFactice()
+    assert traiter(file, travail(type_travail="inconnu"), lambda *_: {})[1] == "reessai"
+    assert file.transitions == [("echouer", "ValueError: Type de travail inconnu : inconnu")]
+
+
+def test_traiter_bail_perdu():
+    file = FileFactice(bail_perdu=True)
+    appels = []
+
+    def executant(db, travail, avancer):
+        appels.append("debut")
+        avancer(1)
+        appels.append("suite")
+
+    # Ni fin ni échec enregistrés : le travail appartient à un autre worker
+    assert traiter(file, travail(), executant)[1] == "bail_perdu"
+    assert appels == ["debut"]
+    assert file.transitions == []
+
+
+def test_traiter_prolonge_le_bail_pendant_le_travail():
+    file = FileFactice(duree_bail=0.03)
+
+    def executant(db, travail, avancer):
+        assert file.prolongations.wait(5)
+        return {}
+
+    assert traiter(file, travail(), executant)[1] == "termine"
+    assert ("prolonger",) in file.transitions
+    assert file.transitions.count(("terminer", {})) == 1
@@ -0,0 +1,372 @@
+import io
+import logging
+import os
+import select
+import signal
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import Json
+
+from flux_livres import lire_csv, lire_jsonl
+from journal import id_requete
+from metriques import DUREE_TRAVAUX, TRAVAUX_EN_FILE, TRAVAUX_TRAITES
+
+logger = logging.getLogger("librairie.travaux")
+
+# Canal des NOTIFY qui réveillent les workers de travaux à chaque ajout
+CANAL_TRAVAUX = "travaux"
+
+# Colonnes d'un travail renvoyées par GET /jobs/<id>
+CHAMPS_TRAVAIL = (
+    "id", "type", "librairie_id", "etat", "tentatives", "tentatives_max", "fait", "total",
+    "resultat", "erreur", "cree_le", "commence_le", "termine_le",
+)
+
+
+class BailPerdu(Exception):
+    """Le travail a été repris par un autre worker (bail expiré) : ses écritures sont ignorées"""
+
+
+class FileTravaux:
+    """File de travaux dans la table travaux, partagée par l'API et les workers
+
+    L'API ajoute un travail (INSERT + NOTIFY) et répond 202 ; un worker le réserve
+    par SELECT ... FOR UPDATE SKIP LOCKED, sans attendre les lignes déjà prises par
+    les autres, et le marque en_cours avec un bail de JOBS_LEASE_SECONDS, prolongé
+    tant qu'il y travaille. Un travail dont le bail expire (worker arrêté) est repris
+    par un autre worker ; un échec est réessayé après JOBS_RETRY_DELAY secondes,
+    doublées à chaque tentative, jusqu'à JOBS_MAX_ATTEMPTS tentatives.
+
+    Le numéro de tentative sert de jeton : un worker dont le travail a été repris
+    ne peut plus en modifier l'état.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.tentatives_max = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+        self.duree_bail = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+        self.delai_reessai = float(os.getenv("JOBS_RETRY_DELAY", "5"))
+        self.retention = float(os.getenv("JOBS_RETENTION_HOURS", "168"))
+
+    def ajouter(self, type_travail, librairie_id, parametres=None, donnees=None, total=None):
+        """Mettre un travail en file et réveiller les workers ; renvoie son identifiant"""
+        with self.db.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO travaux (type, librairie_id, parametres, donnees, total, tentatives_max, id_requete)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (type_travail, librairie_id, Json(parametres or {}), donnees, total,
+                  self.tentatives_max, id_requete.get()))
+            travail_id = cursor.fetchone()[0]
+            cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_TRAVAUX, str(travail_id)))
+            cursor.close()
+        logger.info("Travail ajouté", extra={"travail_id": travail_id, "type": type_travail, "librairie_id": librairie_id})
+        return travail_id
+
+    def obtenir(self, travail_id):
+        """État d'un travail (None s'il n'existe pas), sans ses données"""
+        with self.db.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.executer_prepare(
+                "SELECT {} FROM travaux WHERE id = %s".format(", ".join(CHAMPS_TRAVAIL)), (travail_id,)
+            )
+            ligne = cursor.fetchone()
+            cursor.close()
+        if ligne is None:
+            return None
+        travail = dict(zip(CHAMPS_TRAVAIL, ligne))
+        for champ in ("cree_le", "commence_le", "termine_le"):
+            if travail[champ] is not None:
+                travail[champ] = travail[champ].isoformat()
+        return travail
+
+    def prendre(self):
+        """Réserver le prochain travail disponible (None si la file est vide)"""
+        with self.db.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE travaux t
+                SET etat = 'en_cours',
+                    tentatives = t.tentatives + 1,
+                    commence_le = now(),
+                    bail_jusqu_a = now() + make_interval(secs => %s)
+                FROM (
+                    SELECT id FROM travaux
+                    WHERE (etat = 'en_attente' AND disponible_le <= now())
+                       OR (etat = 'en_cours' AND bail_jusqu_a < now() AND tentatives < tentatives_max)
+                    ORDER BY id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                ) prochain
+                WHERE t.id = prochain.id
+                RETURNING t.id, t.type, t.librairie_id, t.parametres, t.donnees, t.tentatives,
+                          t.tentatives_max, t.id_requete
+            """, (self.duree_bail,))
+            ligne = cursor.fetchone()
+            cursor.close()
+        if ligne is None:
+            return None
+        return dict(zip(
+            ("id", "type", "librairie_id", "parametres", "donnees", "tentatives", "tentatives_max", "id_requete"),
+            ligne,
+        ))
+
+    def _mettre_a_jour(self, travail, affectation, parametres):
+        with self.db.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE travaux SET {} WHERE id = %s AND tentatives = %s AND etat = 'en_cours'".format(affectation),
+                (*parametres, travail["id"], travail["tentatives"]),
+            )
+            modifie = cursor.rowcount
+            cursor.close()
+        if not modifie:
+            raise BailPerdu(f"Travail {travail['id']} repris par un autre worker")
+
+    def prolonger(self, travail):
+        """Repousser la fin du bail (battement du worker pendant le travail)"""
+        self._mettre_a_jour(travail, "bail_jusqu_a = now() + make_interval(secs => %s)", (self.duree_bail,))
+
+    def avancer(self, travail, fait, total=None):
+        """Enregistrer la progression (éléments traités, et total s'il est connu)"""
+        self._mettre_a_jour(travail, "fait = %s, total = coalesce(%s, total)", (fait, total))
+
+    def terminer(self, travail, resultat):
+        self._mettre_a_jour(
+            travail,
+            "etat = 'termine', resultat = %s, erreur = NULL, termine_le = now(), bail_jusqu_a = NULL, donnees = NULL",
+            (Json(resultat),),
+        )
+
+    def echouer(self, travail, erreur):
+        """Remettre le travail en file après un délai croissant, ou l'abandonner ; vrai s'il sera réessayé"""
+        if travail["tentatives"] < travail["tentatives_max"]:
+            delai = self.delai_reessai * 2 ** (travail["tentatives"] - 1)
+            self._mettre_a_jour(
+                travail,
+                "etat = 'en_attente', erreur = %s, bail_jusqu_a = NULL, disponible_le = now() + make_interval(secs => %s)",
+                (erreur, delai),
+            )
+            return True
+        self._mettre_a_jour(
+            travail, "etat = 'echoue', erreur = %s, termine_le = now(), bail_jusqu_a = NULL", (erreur,)
+        )
+        return False
+
+    def entretenir(self):
+        """Abandonner les travaux dont le dernier bail a expiré, purger les anciens, mesurer la file"""
+        with self.db.pool.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE travaux
+                SET etat = 'echoue', termine_le = now(), bail_jusqu_a = NULL,
+                    erreur = coalesce(erreur, 'Bail expiré à chaque tentative (worker arrêté pendant le travail)')
+                WHERE etat = 'en_cours' AND bail_jusqu_a < now() AND tentatives >= tentatives_max
+            """)
+            abandonnes = cursor.rowcount
+            cursor.execute("""
+                DELETE FROM travaux
+                WHERE etat IN ('termine', 'echoue') AND termine_le < now() - %s * interval '1 hour'
+            """, (self.retention,))
+            purges = cursor.rowcount
+            cursor.execute("""
+                SELECT etat, count(*) FROM travaux
+                WHERE etat IN ('en_attente', 'en_cours')
+                GROUP BY etat
+            """)
+            en_file = dict(cursor.fetchall())
+            cursor.close()
+        for etat in ("en_attente", "en_cours"):
+            TRAVAUX_EN_FILE.labels(etat).set(en_file.get(etat, 0))
+        if abandonnes or purges:
+            logger.info("Entretien de la file", extra={"abandonnes": abandonnes, "purges": purges})
+
+
+def _importer_livres(db, travail, avancer):
+    parametres = travail["parametres"]
+    flux = io.StringIO(travail["donnees"], newline="")
+    livres = lire_csv(flux) if parametres.get("format") == "csv" else lire_jsonl(flux)
+    return db.importer_livres(
+        travail["librairie_id"], livres,
+        progression=lambda rapport: avancer(rapport["inseres"] + rapport["doublons"] + rapport["rejetes"]),
+    )
+
+
+def _remplacer_livres(db, travail, avancer):
+    titres = travail["parametres"]["titres"]
+    bilan = db.remplacer_livres(travail["librairie_id"], titres)
+    avancer(len(titres))
+    return bilan
+
+
+# Traitement de chaque type de travail : fonction(db, travail, avancer) -> résultat (JSON)
+EXECUTANTS = {
+    "importer_livres": _importer_livres,
+    "remplacer_livres": _remplacer_livres,
+}
+
+
+class WorkerTravaux:
+    """Boucle d'un worker de travaux : réserver, exécuter, enregistrer l'issue
+
+    Le worker attend les NOTIFY du canal travaux, avec une relecture de la file au
+    moins toutes les JOBS_POLL_INTERVAL secondes (travaux à réessayer, baux expirés,
+    notification manquée). arreter() laisse finir le travail en cours.
+
+    Entre deux travaux, il rafraîchit aussi les statistiques de /stats : toutes les
+    STATS_REFRESH_INTERVAL secondes si le catalogue a changé (0 : jamais), et dès la
+    fin d'un travail, au plus une fois par STATS_MIN_REFRESH_INTERVAL secondes.
+    """
+
+    def __init__(self, file, db, executants=EXECUTANTS):
+        self.file = file
+        self.db = db
+        self.executants = executants
+        self.intervalle = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+        self.intervalle_entretien = float(os.getenv("JOBS_MAINTENANCE_INTERVAL", "60"))
+        self.intervalle_statistiques = float(os.getenv("STATS_REFRESH_INTERVAL", "60"))
+        self.intervalle_min_statistiques = float(os.getenv("STATS_MIN_REFRESH_INTERVAL", "5"))
+        self._statistiques_le = None
+        self._ecritures = False
+        self._arret = threading.Event()
+        self._reveil_lecture, self._reveil_ecriture = os.pipe()
+        self._ecoute = None
+
+    def arreter(self, *_):
+        self._arret.set()
+        os.write(self._reveil_ecriture, b"x")
+
+    def executer(self):
+        prochain_entretien = 0.0
+        while not self._arret.is_set():
+            try:
+                if time.monotonic() >= prochain_entretien:
+                    self.file.entretenir()
+                    prochain_entretien = time.monotonic() + self.intervalle_entretien
+                self._actualiser_statistiques()
+                travail = self.file.prendre()
+            except psycopg2.Error as e:
+                logger.warning("File des travaux inaccessible : %s", e)
+                self._arret.wait(self.intervalle)
+                continue
+            if travail is None:
+                self._attendre()
+            else:
+                self.traiter(travail)
+        if self._ecoute is not None:
+            self._ecoute.close()
+
+    def _actualiser_statistiques(self):
+        if self.intervalle_statistiques <= 0:
+            return
+        if self._statistiques_le is not None:
+            ecoule = time.monotonic() - self._statistiques_le
+            if ecoule < (self.intervalle_min_statistiques if self._ecritures else self.intervalle_statistiques):
+                return
+        debut = time.perf_counter()
+        # Heure notée avant : un rafraîchissement en échec n'est pas retenté à chaque tour
+        self._statistiques_le = time.monotonic()
+        self._ecritures = False
+        try:
+            if self.db.actualiser_statistiques():
+                logger.info("Statistiques rafraîchies en %.3f s", time.perf_counter() - debut)
+        except psycopg2.Error as e:
+            logger.warning("Statistiques non rafraîchies : %s", e)
+
+    def _attendre(self):
+        """Attendre une notification du canal travaux, au plus JOBS_POLL_INTERVAL secondes"""
+        try:
+            if self._ecoute is None or self._ecoute.closed:
+                self._ecoute = psycopg2.connect(**self.db.db_params)
+                self._ecoute.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = self._ecoute.cursor()
+                cursor.execute(f"LISTEN {CANAL_TRAVAUX}")
+                cursor.close()
+            prets, _, _ = select.select([self._ecoute, self._reveil_lecture], [], [], self.intervalle)
+            if self._ecoute in prets:
+                self._ecoute.poll()
+                self._ecoute.notifies.clear()
+        except psycopg2.Error as e:
+            logger.warning("Écoute du canal des travaux interrompue : %s", e)
+            if self._ecoute is not None:
+                self._ecoute.close()
+            self._ecoute = None
+            self._arret.wait(self.intervalle)
+
+    def traiter(self, travail):
+        """Exécuter une tentative de travail, avec un battement qui prolonge son bail"""
+        # Journaux et commentaires SQL rattachés à la requête qui a ajouté le travail
+        jeton = id_requete.set(travail["id_requete"] or f"travail-{travail['id']}")
+        fin_battement = threading.Event()
+        battement = threading.Thread(target=self._battre, args=(travail, fin_battement), daemon=True)
+        battement.start()
+        contexte = {"travail_id": travail["id"], "type": travail["type"], "tentative": travail["tentatives"]}
+        logger.info("Travail commencé", extra=contexte)
+        debut = time.perf_counter()
+        try:
+            executant = self.executants.get(travail["type"])
+            if executant is None:
+                raise ValueError(f"Type de travail inconnu : {travail['type']}")
+            resultat = executant(self.db, travail, lambda fait, total=None: self.file.avancer(travail, fait, total))
+            fin_battement.set()
+            self.file.terminer(travail, resultat)
+            issue = "termine"
+            self._ecritures = True
+            logger.info("Travail terminé", extra={**contexte, "duree_s": round(time.perf_counter() - debut, 3)})
+        except BailPerdu as e:
+            issue = "bail_perdu"
+            logger.warning("%s", e, extra=contexte)
+        except Exception as e:
+            fin_battement.set()
+            try:
+                issue = "reessai" if self.file.echouer(travail, f"{type(e).__name__}: {e}") else "echoue"
+            except (BailPerdu, psycopg2.Error) as erreur:
+                # Sans enregistrement, le bail expirera et le travail sera repris
+                issue = "bail_perdu"
+                logger.warning("Échec non enregistré : %s", erreur, extra=contexte)
+            logger.exception("Échec du travail (%s)", issue, extra=contexte)
+        finally:
+            fin_battement.set()
+            battement.join()
+            id_requete.reset(jeton)
+        DUREE_TRAVAUX.labels(travail["type"]).observe(time.perf_counter() - debut)
+        TRAVAUX_TRAITES.labels(travail["type"], issue).inc()
+
+    def _battre(self, travail, fin):
+        while not fin.wait(self.file.duree_bail / 3):
+            try:
+                self.file.prolonger(travail)
+            except BailPerdu:
+                return
+            except psycopg2.Error as e:
+                logger.warning("Bail non prolongé : %s", e, extra={"travail_id": travail["id"]})
+
+
+# Point d'entrée des pods de travaux : python travaux.py
+if __name__ == "__main__":
+    from prometheus_client import start_http_server
+
+    from journal import configurer_journalisation
+    from librairie import LibrairieDB
+
+    configurer_journalisation()
+    # Pas de lectures à mettre en cache ici : les invalidations partent par NOTIFY vers l'API
+    os.environ.setdefault("CACHE_TAILLE_MAX", "0")
+    db = LibrairieDB()
+    worker = WorkerTravaux(FileTravaux(db), db)
+    signal.signal(signal.SIGTERM, worker.arreter)
+    signal.signal(signal.SIGINT, worker.arreter)
+
+    port_metriques = int(os.getenv("JOBS_METRICS_PORT", "9000"))
+    if port_metriques > 0:
+        start_http_server(port_metriques)
+    logger.info("Worker de travaux démarré (types : %s)", ", ".join(EXECUTANTS))
+    try:
+        worker.executer()
+    finally:
+        db.fermer()
+    logger.info("Worker de travaux arrêté")
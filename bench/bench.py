@@ -0,0 +1,498 @@
+"""Banc d'essai de charge pour les deux variantes de l'application
+
+Lance (ou vise) un serveur, le remplit avec un jeu de livres de taille donnée,
+puis envoie pendant une durée fixe un mélange pondéré de requêtes (lecture,
+pagination, recherche, ajout, suppression) depuis plusieurs clients en parallèle.
+Le résultat (débit, p50/p95/p99 et requêtes SQL par route) est écrit en JSON
+pour être comparé d'un commit à l'autre.
+
+Exemples :
+    # serveur déjà démarré (variante en mémoire ou PostgreSQL)
+    python bench/bench.py --url http://localhost:5000
+
+    # PostgreSQL jetable dans Docker + application lancée par gunicorn
+    python bench/bench.py --lancer postgres --postgres-docker --livres 20000
+
+    # comparer au résultat d'un commit précédent (code de sortie 1 si régression)
+    python bench/bench.py --lancer postgres --comparer bench/resultats/a1b2c3d-postgres.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from datetime import datetime, timezone
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Mélange par défaut, proche d'un usage réel : surtout des lectures
+MIX_DEFAUT = "livres=45,details=15,search=15,ranked=5,post=12,delete=8"
+
+# Vocabulaire des titres générés, pour que les recherches trouvent des résultats
+MOTS = [
+    "python", "devops", "kubernetes", "cloud", "toulouse", "données", "réseau",
+    "sécurité", "conteneur", "pipeline", "architecture", "algorithmes", "système",
+    "élégant", "pratique", "avancé", "mémoire", "performance", "café", "histoire",
+]
+
+# Commandes de lancement des variantes (répertoire, module WSGI/ASGI)
+VARIANTES = {
+    "memoire": ("app", ["gunicorn", "--bind", "127.0.0.1:{port}", "--workers", "{workers}", "main:app"]),
+    "postgres": ("app_postgres", ["gunicorn", "--bind", "127.0.0.1:{port}", "--workers", "{workers}", "main:app"]),
+    "async": ("app_postgres", ["hypercorn", "--bind", "127.0.0.1:{port}", "--workers", "{workers}", "main_async:app"]),
+}
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(valeurs_triees, p):
+    """Percentile par rang le plus proche (valeurs déjà triées)"""
+    if not valeurs_triees:
+        return None
+    rang = max(0, min(len(valeurs_triees) - 1, round(p / 100 * len(valeurs_triees)) - 1))
+    return valeurs_triees[rang]
+
+
+def lire_mix(texte):
+    """Lire un mélange "route=poids,route=poids" en liste de (route, poids)"""
+    mix = []
+    for element in texte.split(","):
+        route, _, poids = element.partition("=")
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError(f"route inconnue dans le mélange : {route!r} (attendu : {', '.join(ROUTES)})")
+        mix.append((route, float(poids or 1)))
+    return mix
+
+
+def titre_genere(alea, prefixe, numero):
+    return f"{prefixe} {numero} : {' '.join(alea.sample(MOTS, 3))}"
+
+
+class Client:
+    """Connexion HTTP persistante (keep-alive) d'un client du banc d'essai"""
+
+    def __init__(self, url, delai=30.0):
+        cible = urllib.parse.urlsplit(url)
+        self.hote = cible.hostname
+        self.port = cible.port or 80
+        self.delai = delai
+        self._conn = None
+
+    def envoyer(self, methode, chemin, corps=None, type_contenu="application/json"):
+        """Envoyer une requête et renvoyer (statut, en-têtes, corps)"""
+        en_tetes = {}
+        if corps is not None:
+            en_tetes["Content-Type"] = type_contenu
+            if not isinstance(corps, bytes):
+                corps = json.dumps(corps).encode("utf-8")
+        for tentative in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.hote, self.port, timeout=self.delai)
+            try:
+                self._conn.request(methode, chemin, body=corps, headers=en_tetes)
+                reponse = self._conn.getresponse()
+                return reponse.status, reponse.headers, reponse.read()
+            except (http.client.HTTPException, OSError):
+                # Connexion keep-alive fermée par le serveur : on rouvre une fois
+                self.fermer()
+                if tentative:
+                    raise
+
+    def fermer(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Scenario:
+    """État partagé entre les clients : titres ajoutés, à supprimer ensuite"""
+
+    def __init__(self, graine):
+        self.graine = graine
+        self.ajoutes = deque()
+        self._compteur = 0
+        self._verrou = threading.Lock()
+
+    def nouveau_titre(self, alea):
+        with self._verrou:
+            self._compteur += 1
+            numero = self._compteur
+        return titre_genere(alea, f"Bench {self.graine}-", numero)
+
+    def titre_a_supprimer(self):
+        try:
+            return self.ajoutes.popleft()
+        except IndexError:
+            return None
+
+
+# Chaque route produit (méthode, chemin, corps) ; None si rien à envoyer pour l'instant
+def _route_livres(scenario, alea):
+    return "GET", "/livres?limit=100", None
+
+
+def _route_details(scenario, alea):
+    return "GET", "/livres/details?limit=50&fields=id,titre,auteur", None
+
+
+def _route_search(scenario, alea):
+    return "GET", "/livres/search?" + urllib.parse.urlencode({"q": alea.choice(MOTS)[:5], "limit": 50}), None
+
+
+def _route_ranked(scenario, alea):
+    termes = " ".join(alea.sample(MOTS, 2))
+    return "GET", "/livres/search?" + urllib.parse.urlencode({"q": termes, "mode": "ranked"}), None
+
+
+def _route_post(scenario, alea):
+    titre = scenario.nouveau_titre(alea)
+    scenario.ajoutes.append(titre)
+    return "POST", "/livres", {"nomLivre": titre}
+
+
+def _route_delete(scenario, alea):
+    titre = scenario.titre_a_supprimer()
+    if titre is None:
+        return None
+    return "DELETE", "/livres", {"nomLivre": titre}
+
+
+ROUTES = {
+    "livres": _route_livres,
+    "details": _route_details,
+    "search": _route_search,
+    "ranked": _route_ranked,
+    "post": _route_post,
+    "delete": _route_delete,
+}
+
+
+def attendre_serveur(url, delai=60.0, processus=None):
+    client = Client(url, delai=2.0)
+    echeance = time.monotonic() + delai
+    while time.monotonic() < echeance:
+        if processus is not None and processus.poll() is not None:
+            raise RuntimeError(f"le serveur s'est arrêté au démarrage (code {processus.returncode})")
+        try:
+            statut, _, _ = client.envoyer("GET", "/health")
+            if statut == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            client.fermer()
+        time.sleep(0.2)
+    raise RuntimeError(f"le serveur {url} ne répond pas après {delai} s")
+
+
+def demarrer_postgres_docker(image):
+    """Démarrer un PostgreSQL jetable et renvoyer (identifiant du conteneur, variables DB_*)"""
+    port = port_libre()
+    conteneur = subprocess.check_output([
+        "docker", "run", "-d", "--rm", "-p", f"127.0.0.1:{port}:5432",
+        "-e", "POSTGRES_PASSWORD=bench", "-e", "POSTGRES_DB=librairie_db", image,
+    ], text=True).strip()
+    env = {
+        "DB_HOST": "127.0.0.1", "DB_PORT": str(port), "DB_USER": "postgres",
+        "DB_PASSWORD": "bench", "DB_NAME": "librairie_db",
+    }
+
+    import psycopg2
+    echeance = time.monotonic() + 60
+    while True:
+        try:
+            psycopg2.connect(host="127.0.0.1", port=port, user="postgres", password="bench",
+                             dbname="librairie_db", connect_timeout=2).close()
+            return conteneur, env
+        except psycopg2.OperationalError:
+            if time.monotonic() > echeance:
+                subprocess.run(["docker", "stop", conteneur], check=False)
+                raise RuntimeError("PostgreSQL (Docker) ne répond pas après 60 s")
+            time.sleep(0.5)
+
+
+def lancer_application(variante, workers, env_db):
+    """Lancer la variante demandée sur un port libre et renvoyer (processus, url)"""
+    repertoire, commande = VARIANTES[variante]
+    port = port_libre()
+    commande = [partie.format(port=port, workers=workers) for partie in commande]
+    env = dict(os.environ, **env_db)
+    # Compter les requêtes SQL par requête HTTP (en-tête X-DB-Queries)
+    env.setdefault("DB_COMPTER_REQUETES", "true")
+    env.setdefault("DB_AUTO_MIGRATE", "true")
+    processus = subprocess.Popen(commande, cwd=os.path.join(RACINE, repertoire), env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        attendre_serveur(url, processus=processus)
+    except Exception:
+        processus.terminate()
+        raise
+    return processus, url
+
+
+def remplir(url, nombre, graine, concurrence):
+    """Ajouter `nombre` livres : import en masse si disponible, sinon un par un"""
+    if nombre <= 0:
+        return
+    alea = random.Random(graine)
+    titres = [titre_genere(alea, "Livre", i) for i in range(nombre)]
+    auteurs = ["Camille Martin", "Louis Bernard", "Inès Dubois", "Hugo Laurent", "Zoé Lefèvre"]
+
+    client = Client(url, delai=300.0)
+    taille_lot = 5000
+    for debut in range(0, nombre, taille_lot):
+        corps = "".join(
+            json.dumps({"titre": titre, "auteur": alea.choice(auteurs),
+                        "annee_publication": alea.randint(1950, 2025)}, ensure_ascii=False) + "\n"
+            for titre in titres[debut:debut + taille_lot]
+        ).encode("utf-8")
+        statut, _, reponse = client.envoyer("POST", "/livres/bulk?format=jsonl", corps, "application/x-ndjson")
+        if statut in (404, 405):
+            break
+        if statut != 200:
+            raise RuntimeError(f"import en masse refusé ({statut}) : {reponse[:200]!r}")
+    else:
+        client.fermer()
+        return
+    client.fermer()
+
+    # Variante sans import en masse : ajouts unitaires en parallèle
+    restants = deque(titres)
+
+    def ajouter():
+        client = Client(url)
+        while True:
+            try:
+                titre = restants.popleft()
+            except IndexError:
+                break
+            client.envoyer("POST", "/livres", {"nomLivre": titre})
+        client.fermer()
+
+    fils = [threading.Thread(target=ajouter) for _ in range(concurrence)]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+
+
+def sonder_routes(url, mix, scenario):
+    """Écarter les routes absentes de la variante visée (404)"""
+    client = Client(url)
+    alea = random.Random(scenario.graine)
+    disponibles = []
+    for route, poids in mix:
+        requete = ROUTES[route](scenario, alea)
+        if requete is None:
+            # DELETE : on ajoute d'abord un livre pour le sonder
+            methode, chemin, corps = ROUTES["post"](scenario, alea)
+            client.envoyer(methode, chemin, corps)
+            requete = ROUTES[route](scenario, alea)
+        statut, _, _ = client.envoyer(*requete)
+        if statut == 404:
+            print(f"Route '{route}' absente de cette variante, ignorée.")
+            continue
+        disponibles.append((route, poids))
+    client.fermer()
+    if not disponibles:
+        raise RuntimeError("aucune route du mélange n'est disponible")
+    return disponibles
+
+
+def executer(url, mix, concurrence, duree, echauffement, scenario):
+    """Envoyer le mélange pendant `echauffement` + `duree` secondes et renvoyer les mesures"""
+    routes = [route for route, _ in mix]
+    poids = [p for _, p in mix]
+    mesures = []
+    verrou = threading.Lock()
+    debut_mesure = time.monotonic() + echauffement
+    fin = debut_mesure + duree
+
+    def client_charge(indice):
+        alea = random.Random(f"{scenario.graine}-{indice}")
+        client = Client(url)
+        locales = []
+        while True:
+            route = alea.choices(routes, poids)[0]
+            requete = ROUTES[route](scenario, alea)
+            if requete is None:
+                requete = ROUTES["post"](scenario, alea)
+                route = "post"
+            debut = time.perf_counter()
+            try:
+                statut, en_tetes, _ = client.envoyer(*requete)
+                requetes_sql = en_tetes.get("X-DB-Queries")
+            except OSError:
+                statut, requetes_sql = None, None
+            fin_requete = time.perf_counter()
+            maintenant = time.monotonic()
+            if maintenant >= fin:
+                break
+            if maintenant >= debut_mesure:
+                locales.append((route, fin_requete - debut, statut,
+                                int(requetes_sql) if requetes_sql is not None else None))
+        client.fermer()
+        with verrou:
+            mesures.extend(locales)
+
+    fils = [threading.Thread(target=client_charge, args=(i,)) for i in range(concurrence)]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    return mesures
+
+
+def resumer(mesures, duree):
+    def resume(echantillon):
+        latences = sorted(latence for _, latence, _, _ in echantillon)
+        erreurs = sum(1 for _, _, statut, _ in echantillon if statut is None or statut >= 500)
+        sql = [n for _, _, _, n in echantillon if n is not None]
+        return {
+            "requetes": len(echantillon),
+            "erreurs": erreurs,
+            "req_s": round(len(echantillon) / duree, 1),
+            "p50_ms": round(percentile(latences, 50) * 1000, 2) if latences else None,
+            "p95_ms": round(percentile(latences, 95) * 1000, 2) if latences else None,
+            "p99_ms": round(percentile(latences, 99) * 1000, 2) if latences else None,
+            "requetes_sql": round(sum(sql) / len(sql), 2) if sql else None,
+        }
+
+    par_route = {}
+    for mesure in mesures:
+        par_route.setdefault(mesure[0], []).append(mesure)
+    return resume(mesures), {route: resume(echantillon) for route, echantillon in sorted(par_route.items())}
+
+
+def commit_courant():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, text=True).strip()
+        modifie = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=RACINE).returncode != 0
+        return commit + ("-modifie" if modifie else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+def afficher(resultat):
+    print(f"\n{'route':<10} {'requêtes':>9} {'erreurs':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'SQL/req':>8}")
+    lignes = list(resultat["routes"].items()) + [("total", resultat["global"])]
+    for route, r in lignes:
+        print(f"{route:<10} {r['requetes']:>9} {r['erreurs']:>8} {r['req_s']:>9} "
+              f"{r['p50_ms'] or '-':>8} {r['p95_ms'] or '-':>8} {r['p99_ms'] or '-':>8} "
+              f"{r['requetes_sql'] if r['requetes_sql'] is not None else '-':>8}")
+
+
+def comparer(resultat, reference, tolerance):
+    """Afficher l'écart avec un résultat de référence ; renvoie True si une régression dépasse la tolérance"""
+    print(f"\nComparaison avec {reference['commit']} ({reference['date']}) :")
+    regression = False
+    for route, r in list(resultat["routes"].items()) + [("total", resultat["global"])]:
+        ref = reference["global"] if route == "total" else reference["routes"].get(route)
+        if not ref or not ref["req_s"] or not ref["p95_ms"] or not r["p95_ms"]:
+            continue
+        ecart_debit = (r["req_s"] - ref["req_s"]) / ref["req_s"] * 100
+        ecart_p95 = (r["p95_ms"] - ref["p95_ms"]) / ref["p95_ms"] * 100
+        alerte = ecart_debit < -tolerance or ecart_p95 > tolerance
+        regression = regression or alerte
+        print(f"  {route:<10} req/s {ecart_debit:+6.1f} %   p95 {ecart_p95:+6.1f} %{'   <- régression' if alerte else ''}")
+    return regression
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai de charge de l'application librairie")
+    cible = parser.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--url", help="URL d'un serveur déjà démarré (ex. http://localhost:5000)")
+    cible.add_argument("--lancer", choices=sorted(VARIANTES), help="variante à démarrer pour la mesure")
+    parser.add_argument("--workers", type=int, default=2, help="workers du serveur lancé (défaut : 2)")
+    parser.add_argument("--postgres-docker", nargs="?", const="postgres:16", metavar="IMAGE",
+                        help="démarrer un PostgreSQL jetable dans Docker (défaut : postgres:16)")
+    parser.add_argument("--concurrence", type=int, default=8, help="clients simultanés (défaut : 8)")
+    parser.add_argument("--duree", type=float, default=20.0, help="durée mesurée en secondes (défaut : 20)")
+    parser.add_argument("--echauffement", type=float, default=3.0, help="durée non mesurée au début (défaut : 3)")
+    parser.add_argument("--livres", type=int, default=2000, help="taille du jeu de livres ajouté avant la mesure (défaut : 2000)")
+    parser.add_argument("--mix", default=MIX_DEFAUT, help=f"poids des routes (défaut : {MIX_DEFAUT})")
+    parser.add_argument("--graine", type=int, default=42, help="graine aléatoire, pour rejouer le même scénario")
+    parser.add_argument("--sortie", help="fichier JSON du résultat (défaut : bench/resultats/<commit>-<variante>.json)")
+    parser.add_argument("--comparer", metavar="REFERENCE", help="résultat JSON d'un commit précédent à comparer")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="écart toléré en %% sur req/s et p95 avant de signaler une régression (défaut : 10)")
+    args = parser.parse_args()
+
+    try:
+        mix = lire_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    conteneur = None
+    processus = None
+    try:
+        env_db = {}
+        if args.postgres_docker:
+            conteneur, env_db = demarrer_postgres_docker(args.postgres_docker)
+        if args.lancer:
+            processus, url = lancer_application(args.lancer, args.workers, env_db)
+            variante = args.lancer
+        else:
+            url = args.url.rstrip("/")
+            attendre_serveur(url, delai=10.0)
+            variante = "externe"
+
+        print(f"Remplissage avec {args.livres} livres...")
+        debut = time.perf_counter()
+        remplir(url, args.livres, args.graine, args.concurrence)
+        print(f"Remplissage terminé en {time.perf_counter() - debut:.1f} s.")
+
+        scenario = Scenario(args.graine)
+        mix = sonder_routes(url, mix, scenario)
+        print(f"Mesure : {args.concurrence} clients, {args.echauffement:g} s d'échauffement puis {args.duree:g} s...")
+        mesures = executer(url, mix, args.concurrence, args.duree, args.echauffement, scenario)
+    finally:
+        if processus is not None:
+            processus.terminate()
+            processus.wait(timeout=30)
+        if conteneur is not None:
+            subprocess.run(["docker", "stop", conteneur], check=False, stdout=subprocess.DEVNULL)
+
+    total, routes = resumer(mesures, args.duree)
+    resultat = {
+        "commit": commit_courant(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "cible": {"variante": variante, "url": url if variante == "externe" else None, "workers": args.workers if args.lancer else None},
+        "parametres": {
+            "concurrence": args.concurrence, "duree": args.duree, "echauffement": args.echauffement,
+            "livres": args.livres, "mix": dict(mix), "graine": args.graine,
+        },
+        "global": total,
+        "routes": routes,
+    }
+    afficher(resultat)
+
+    sortie = args.sortie or os.path.join(RACINE, "bench", "resultats", f"{resultat['commit']}-{variante}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(sortie)), exist_ok=True)
+    with open(sortie, "w", encoding="utf-8") as f:
+        json.dump(resultat, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"\nRésultat écrit dans {sortie}")
+
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            reference = json.load(f)
+        if comparer(resultat, reference, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Micro-benchmark de la lecture d'une page de livres dans app_postgres
+
+Mesure, hors HTTP et sans cache, le débit en livres par seconde de trois façons
+de produire le corps JSON d'une page de GET /livres/details :
+
+- `texte`    : requête SQL analysée à chaque appel, un dictionnaire par ligne, json.dumps ;
+- `prepare`  : instruction préparée côté serveur, un dictionnaire par ligne, json.dumps ;
+- `json_agg` : instruction préparée, JSON produit par PostgreSQL et renvoyé tel quel.
+
+La lecture d'une librairie par son id (requête courte, où l'analyse et la
+planification pèsent le plus) est aussi mesurée avec et sans instruction préparée.
+
+Une librairie dédiée est remplie au premier lancement (--livres), puis chaque
+mode lit des pages de plusieurs tailles (--pages) pendant --duree secondes. Les
+modes sont alternés sur --tours tours et le meilleur tour de chacun est gardé,
+pour que le bruit de la machine pèse autant sur tous.
+
+Exemple :
+    DB_NAME=librairie_test python bench/micro_lignes.py --livres 20000 --pages 20,200,2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, "app_postgres"))
+
+from librairie import CHAMPS_LIVRE, LibrairieDB  # noqa: E402
+
+NOM_LIBRAIRIE = "bench-micro-lignes"
+
+
+def preparer_librairie(db, nombre):
+    """Librairie de `nombre` livres (complétée si elle en a moins)"""
+    infos, _ = db.obtenir_ou_creer_librairie(NOM_LIBRAIRIE, "banc d'essai")
+    presents = len(db._lire_page_livres(infos["id"], None, None, ("id",))[0])
+    if presents < nombre:
+        db.importer_livres(infos["id"], (
+            {"titre": f"Micro {numero:07d} les misérables", "auteur": f"Auteur {numero % 97}",
+             "isbn": f"978{numero:010d}", "annee_publication": 1900 + numero % 120}
+            for numero in range(presents, nombre)
+        ))
+    # Statistiques à jour : sinon les plans comparés ne sont pas ceux de la production
+    with db.pool.connexion() as conn, conn.cursor() as cursor:
+        cursor.execute("ANALYZE livres; ANALYZE librairie_livres")
+    return infos["id"]
+
+
+def mesurer(lire, duree):
+    """Appeler lire() pendant `duree` secondes ; renvoie (appels, livres lus, secondes)"""
+    lire()  # échauffement : PREPARE, cache de plans et connexion du pool
+    appels = livres = 0
+    debut = time.perf_counter()
+    while True:
+        livres += lire()
+        appels += 1
+        ecoule = time.perf_counter() - debut
+        if ecoule >= duree:
+            return appels, livres, ecoule
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit de lecture d'une page de livres (livres/s)")
+    parser.add_argument("--livres", type=int, default=20000, help="taille de la librairie de test")
+    parser.add_argument("--pages", default="20,200,2000", help="tailles de page mesurées")
+    parser.add_argument("--duree", type=float, default=1.0, help="durée de chaque mesure (s)")
+    parser.add_argument("--tours", type=int, default=5, help="nombre de mesures de chaque mode")
+    parser.add_argument("--sortie", help="fichier JSON où écrire les résultats")
+    args = parser.parse_args()
+
+    os.environ["DB_PREPARED_STATEMENTS"] = "false"
+    db_texte = LibrairieDB()
+    os.environ["DB_PREPARED_STATEMENTS"] = "true"
+    db = LibrairieDB()
+    librairie_id = preparer_librairie(db, args.livres)
+    total = len(db._lire_page_livres(librairie_id, None, None, ("id",))[0])
+
+    def par_dictionnaires(base, limite):
+        def lire():
+            livres, _ = base._lire_page_livres(librairie_id, limite, None, CHAMPS_LIVRE)
+            # Sérialisation de reponse_json_cachee (jsonify : clés triées, sortie compacte)
+            json.dumps(livres, sort_keys=True, separators=(",", ":")).encode("utf-8")
+            return len(livres)
+        return lire
+
+    def par_json_agg(limite):
+        def lire():
+            corps, _ = db.lire_page_livres_json(librairie_id, limite, None, CHAMPS_LIVRE)
+            corps.encode("utf-8")
+            return min(limite, total)
+        return lire
+
+    resultats = []
+    print(f"{'page':>6} {'mode':<9} {'livres/s':>12} {'µs/appel':>10}")
+    for limite in (int(taille) for taille in args.pages.split(",")):
+        modes = {
+            "texte": par_dictionnaires(db_texte, limite),
+            "prepare": par_dictionnaires(db, limite),
+            "json_agg": par_json_agg(limite),
+        }
+        meilleurs = {}
+        for _ in range(args.tours):
+            for mode, lire in modes.items():
+                appels, livres, ecoule = mesurer(lire, args.duree)
+                if mode not in meilleurs or livres / ecoule > meilleurs[mode][1] / meilleurs[mode][2]:
+                    meilleurs[mode] = (appels, livres, ecoule)
+        for mode, (appels, livres, ecoule) in meilleurs.items():
+            resultat = {
+                "page": limite,
+                "mode": mode,
+                "livres_par_s": round(livres / ecoule),
+                "us_par_appel": round(ecoule / appels * 1e6, 1),
+            }
+            resultats.append(resultat)
+            print(f"{limite:>6} {mode:<9} {resultat['livres_par_s']:>12,} {resultat['us_par_appel']:>10}")
+
+    print(f"\n{'':>6} {'mode':<9} {'appels/s':>12} {'µs/appel':>10}")
+    for mode, base in (("texte", db_texte), ("prepare", db)):
+        appels, _, ecoule = max(
+            (mesurer(lambda: base._lire_librairie(librairie_id) and 1, args.duree) for _ in range(args.tours)),
+            key=lambda mesure: mesure[0] / mesure[2],
+        )
+        resultat = {"requete": "librairie", "mode": mode, "us_par_appel": round(ecoule / appels * 1e6, 1)}
+        resultats.append(resultat)
+        print(f"{'point':>6} {mode:<9} {round(appels / ecoule):>12,} {resultat['us_par_appel']:>10}")
+
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as fichier:
+            json.dump({"livres": args.livres, "resultats": resultats}, fichier, indent=2)
+
+
+if __name__ == "__main__":
+    main()